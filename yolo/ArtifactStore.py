@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import stat
+import shutil
+import hashlib
+import sqlite3
+import argparse
+import yaml
+from ReadMetrics import ResultsCsvTail
+from TrainProfiler import _dataset_name
+
+STORE_DIR = os.path.join("runs", "artifacts")
+PROMOTE_DIR = os.path.join("Assets", "Model")
+
+# 一个 run 里要入库的文件：相对路径 -> 类型；训练预览图 train_batch*.jpg / val_batch*.jpg 不入库
+RUN_FILES = {
+    os.path.join("weights", "best.pt"): "weights",
+    os.path.join("weights", "last.pt"): "weights",
+    "results.csv": "metrics",
+    "args.yaml": "config",
+}
+EXPORT_SUFFIXES = {".onnx": "onnx", ".engine": "engine", ".tflite": "tflite"}
+SUMMARY_METRICS = ["metrics/precision(B)", "metrics/recall(B)", "metrics/mAP50(B)", "metrics/mAP50-95(B)"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    sha256     TEXT PRIMARY KEY,
+    size       INTEGER,
+    created_at REAL
+);
+-- 一次保存就是一个版本，名字下的版本号递增
+CREATE TABLE IF NOT EXISTS versions (
+    name       TEXT NOT NULL,
+    version    INTEGER NOT NULL,
+    run_dir    TEXT,
+    data       TEXT,
+    model      TEXT,
+    metrics    TEXT,
+    created_at REAL,
+    PRIMARY KEY (name, version)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    name    TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    path    TEXT NOT NULL,
+    kind    TEXT,
+    sha256  TEXT NOT NULL,
+    PRIMARY KEY (name, version, path)
+);
+CREATE TABLE IF NOT EXISTS promotions (
+    target      TEXT PRIMARY KEY,
+    name        TEXT,
+    version     INTEGER,
+    sha256      TEXT,
+    promoted_at REAL
+);
+"""
+
+FICLONE = 0x40049409  # Linux ioctl，btrfs/xfs 上做写时复制
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_or_copy(src, dst):
+    """
+    优先 reflink（写时复制，源文件之后被改也不影响），不支持时复制。
+    不用硬链接：训练继续写 last.pt 或用户改了发布的文件，会连带改掉库里按哈希存的对象。
+    """
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _read_only(path):
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _writable(path):
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR)
+
+
+class ArtifactStore:
+    """
+    按 SHA-256 存放权重、导出模型和指标文件，相同内容只存一份；
+    manifest.sqlite 记录每个版本来自哪个 run、哪个数据集以及它的指标。
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "manifest.sqlite"))
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def put(self, path):
+        """把一个文件放进对象库，返回 sha256；已存在的内容直接复用"""
+        sha256 = file_sha256(path)
+        target = self.object_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.tmp"
+            link_or_copy(path, tmp)
+            _read_only(tmp)
+            os.replace(tmp, target)
+            self.conn.execute("INSERT OR IGNORE INTO objects VALUES (?, ?, ?)",
+                              (sha256, os.path.getsize(target), time.time()))
+        return sha256
+
+    def _run_files(self, run_dir):
+        for rel, kind in RUN_FILES.items():
+            if os.path.exists(os.path.join(run_dir, rel)):
+                yield rel, kind
+        weights = os.path.join(run_dir, "weights")
+        if not os.path.isdir(weights):
+            return
+        for entry in sorted(os.listdir(weights)):
+            full = os.path.join(weights, entry)
+            if os.path.isdir(full):
+                # OpenVINO / saved_model 之类的导出是目录，逐个文件入库
+                kind = "int8" if "int8" in entry.lower() else "export"
+                for folder, _, names in os.walk(full):
+                    for name in sorted(names):
+                        yield os.path.relpath(os.path.join(folder, name), run_dir), kind
+                continue
+            suffix = os.path.splitext(entry)[1].lower()
+            if suffix in EXPORT_SUFFIXES:
+                yield os.path.join("weights", entry), "int8" if "int8" in entry.lower() else EXPORT_SUFFIXES[suffix]
+
+    def _summary(self, run_dir):
+        csv_path = os.path.join(run_dir, "results.csv")
+        if not os.path.exists(csv_path):
+            return {}
+        tail = ResultsCsvTail(csv_path)
+        tail.poll()
+        summary = {"epochs": tail.rows}
+        for name in SUMMARY_METRICS:
+            values = tail.get(name)
+            if values:
+                summary[name] = max(values)
+        return summary
+
+    def _args(self, run_dir):
+        try:
+            with open(os.path.join(run_dir, "args.yaml"), "r", encoding="utf-8") as f:
+                return yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError):
+            return {}
+
+    def save_run(self, run_dir, name=None):
+        """保存一个训练 run 为新版本，返回 (name, version)；和上一个版本内容完全相同时不新建版本"""
+        args = self._args(run_dir)
+        if name is None:
+            data = args.get("data")
+            # GUI 训练的数据集都叫 data.yaml，按所在目录命名，和 TrainProfiler 的推荐文件一致
+            name = (_dataset_name(str(data)) if data else "") or os.path.basename(os.path.normpath(run_dir))
+        files = {rel: (kind, self.put(os.path.join(run_dir, rel))) for rel, kind in self._run_files(run_dir)}
+        if not files:
+            raise FileNotFoundError(f"{run_dir} 下没有可保存的权重或指标文件")
+
+        latest = self.latest(name)
+        if latest is not None and self.files(name, latest) == {rel: sha for rel, (_, sha) in files.items()}:
+            self.conn.commit()
+            return name, latest
+
+        version = (latest or 0) + 1
+        with self.conn:
+            self.conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (name, version, os.path.abspath(run_dir), args.get("data"), args.get("model"),
+                               json.dumps(self._summary(run_dir), ensure_ascii=False), time.time()))
+            self.conn.executemany("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                                  [(name, version, rel.replace(os.sep, "/"), kind, sha)
+                                   for rel, (kind, sha) in files.items()])
+        return name, version
+
+    # --- 查询 ---
+    def latest(self, name):
+        row = self.conn.execute("SELECT MAX(version) FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def names(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT name FROM versions ORDER BY name")]
+
+    def versions(self, name):
+        cursor = self.conn.execute(
+            "SELECT version, run_dir, data, model, metrics, created_at FROM versions WHERE name = ? ORDER BY version",
+            (name,))
+        keys = [d[0] for d in cursor.description]
+        rows = [dict(zip(keys, r)) for r in cursor.fetchall()]
+        for row in rows:
+            row["metrics"] = json.loads(row["metrics"]) if row["metrics"] else {}
+        return rows
+
+    def files(self, name, version):
+        rows = self.conn.execute("SELECT path, sha256 FROM artifacts WHERE name = ? AND version = ?",
+                                 (name, version)).fetchall()
+        return {path.replace("/", os.sep): sha for path, sha in rows}
+
+    def resolve(self, name, version=None, path=os.path.join("weights", "best.pt")):
+        version = version or self.latest(name)
+        sha256 = self.files(name, version).get(path)
+        if sha256 is None:
+            raise KeyError(f"{name} v{version} 没有 {path}")
+        return self.object_path(sha256)
+
+    # --- 发布 ---
+    def promote(self, name, version=None, target_name=None, target_dir=PROMOTE_DIR):
+        """
+        把某个版本的 best.pt 发布为 target_dir/<target_name>.pt：先在同目录建好链接，
+        再用 os.replace 原子替换，正在读旧文件的进程不受影响，也不会看到写了一半的文件。
+        """
+        version = version or self.latest(name)
+        source = self.resolve(name, version)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, (target_name or name) + ".pt")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.symlink(os.path.abspath(source), tmp)
+        except (OSError, NotImplementedError):
+            # Windows 没有创建符号链接的权限时退回 reflink/复制；复制出来的文件可以被替换，对象本身仍是只读
+            link_or_copy(source, tmp)
+            _writable(tmp)
+        os.replace(tmp, target)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO promotions VALUES (?, ?, ?, ?, ?)",
+                              (os.path.abspath(target), name, version, os.path.basename(source), time.time()))
+        return target
+
+    def promoted(self):
+        cursor = self.conn.execute("SELECT target, name, version, promoted_at FROM promotions ORDER BY target")
+        return [dict(zip(["target", "name", "version", "promoted_at"], r)) for r in cursor.fetchall()]
+
+    def gc(self):
+        """删除没有任何版本引用的对象，返回释放的字节数"""
+        used = {r[0] for r in self.conn.execute("SELECT DISTINCT sha256 FROM artifacts")}
+        freed = 0
+        with self.conn:
+            for sha256, size in self.conn.execute("SELECT sha256, size FROM objects").fetchall():
+                if sha256 in used:
+                    continue
+                path = self.object_path(sha256)
+                if os.path.exists(path):
+                    _writable(path)  # Windows 上只读文件删不掉
+                    os.remove(path)
+                    freed += size or 0
+                self.conn.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+        return freed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模型产物库")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("save", help="保存一个训练 run")
+    p.add_argument("run_dir")
+    p.add_argument("--name")
+    p = sub.add_parser("promote", help="发布到 Assets/Model")
+    p.add_argument("name")
+    p.add_argument("--version", type=int)
+    p.add_argument("--as", dest="target_name")
+    sub.add_parser("list", help="列出所有版本")
+    sub.add_parser("gc", help="清理无引用的对象")
+    args = parser.parse_args()
+
+    store = ArtifactStore()
+    if args.command == "save":
+        print("已保存 %s v%d" % store.save_run(args.run_dir, args.name))
+    elif args.command == "promote":
+        print("已发布到", store.promote(args.name, args.version, args.target_name))
+    elif args.command == "list":
+        for name in store.names():
+            for v in store.versions(name):
+                score = v["metrics"].get("metrics/mAP50-95(B)")
+                print(f"{name} v{v['version']:<3} {str(v['data']):<28} mAP50-95={score} {v['run_dir']}")
+    elif args.command == "gc":
+        print(f"释放 {store.gc() / 1e6:.1f} MB")
+    store.close()
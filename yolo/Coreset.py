@@ -0,0 +1,356 @@
+import os
+import sys
+import csv
+import glob
+import argparse
+import numpy as np
+import yaml
+from TrainProfiler import _dataset_name
+from ReadMetrics import ResultsCsvTail
+
+CORESET_DIR = os.path.join("runs", "coreset")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+EMBED_MODEL = "yolov8n.pt"
+EMBED_SIZE = 256  # 只用来比较图片相似度，小分辨率足够
+BACKBONE_LAYERS = 10  # yolov8 的 0~9 层（到 SPPF）是顺序结构，可以逐层调用
+
+
+# --- 数据集 ---
+def load_data_yaml(data_yaml):
+    with open(data_yaml, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    root = data.get("path") or ""
+    if not os.path.isabs(root):
+        # 相对路径先按 yaml 所在目录找，找不到再按当前目录
+        candidate = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+        root = candidate if os.path.isdir(candidate) else os.path.abspath(root)
+    data["path"] = root
+    return data
+
+
+def split_images(data, split="train"):
+    """train/val 可以是目录、图片列表 txt 或它们的列表，返回绝对路径的图片列表"""
+    entries = data[split] if isinstance(data[split], list) else [data[split]]
+    images = []
+    for entry in entries:
+        entry = entry if os.path.isabs(entry) else os.path.join(data["path"], entry)
+        if os.path.isdir(entry):
+            images += sorted(p for p in glob.glob(os.path.join(entry, "**", "*"), recursive=True)
+                             if p.lower().endswith(IMAGE_EXTS))
+        elif entry.endswith(".txt"):
+            base = os.path.dirname(entry)
+            with open(entry, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        images.append(line if os.path.isabs(line) else os.path.normpath(os.path.join(base, line)))
+    return images
+
+
+def label_path(image):
+    """和 ultralytics 一样把路径里最后一个 /images/ 换成 /labels/"""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    head, _, tail = image.rpartition(sa)
+    return os.path.splitext((head + sb + tail) if head else image)[0] + ".txt"
+
+
+def read_labels(image):
+    path = label_path(image)
+    if not os.path.exists(path):
+        return np.zeros((0, 5), dtype=np.float32)
+    rows = np.loadtxt(path, dtype=np.float32, ndmin=2)
+    return rows[:, :5] if rows.size else np.zeros((0, 5), dtype=np.float32)
+
+
+def load_image(path, size):
+    """直接拉伸成 size x size：YOLO 标注是归一化坐标，拉伸后仍然有效；np.fromfile 兼容中文路径"""
+    import cv2
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    return image[:, :, ::-1].transpose(2, 0, 1)  # BGR HWC -> RGB CHW
+
+
+def _batches(paths, size, batch):
+    import torch
+    for start in range(0, len(paths), batch):
+        chunk, arrays = [], []
+        for path in paths[start:start + batch]:
+            image = load_image(path, size)
+            if image is not None:
+                chunk.append(path)
+                arrays.append(image)
+        if arrays:
+            yield chunk, torch.from_numpy(np.ascontiguousarray(np.stack(arrays))).float() / 255.0
+
+
+# --- 图片特征 ---
+class EmbeddingCache:
+    """
+    每张图一条主干网络特征（全局平均池化），按 (路径, 大小, 修改时间) 存在 npz 里，
+    再次运行只算新增或改动过的图片。
+    """
+
+    def __init__(self, path, weights=EMBED_MODEL, size=EMBED_SIZE):
+        self.path = path
+        self.weights = weights
+        self.size = size
+        self.entries = {}  # 路径 -> (大小, 修改时间, 特征)
+        if os.path.exists(path):
+            cached = np.load(path, allow_pickle=False)
+            if str(cached["weights"]) == os.path.basename(weights) and int(cached["size"]) == size:
+                for p, s, m, e in zip(cached["paths"], cached["sizes"], cached["mtimes"], cached["embeddings"]):
+                    self.entries[str(p)] = (int(s), float(m), e)
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def embed(self, paths, batch=32, device="cpu"):
+        missing = [p for p in paths if p not in self.entries or self.entries[p][:2] != self._stat(p)]
+        if missing:
+            print(f"计算 {len(missing)} 张图片的特征（缓存命中 {len(paths) - len(missing)} 张）")
+            self._compute(missing, batch, device)
+            self.save()
+        return np.stack([self.entries[p][2] for p in paths if p in self.entries]).astype(np.float32)
+
+    def _compute(self, paths, batch, device):
+        import torch
+        from ultralytics import YOLO
+        layers = YOLO(self.weights).model.model[:BACKBONE_LAYERS].to(device).eval()
+        with torch.no_grad():
+            for chunk, images in _batches(paths, self.size, batch):
+                x = images.to(device)
+                for layer in layers:
+                    x = layer(x)
+                features = x.mean(dim=(2, 3)).cpu().numpy()
+                for path, feature in zip(chunk, features):
+                    self.entries[path] = (*self._stat(path), feature.astype(np.float16))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        paths = list(self.entries)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, weights=os.path.basename(self.weights), size=self.size, paths=np.array(paths),
+                 sizes=np.array([self.entries[p][0] for p in paths], dtype=np.int64),
+                 mtimes=np.array([self.entries[p][1] for p in paths], dtype=np.float64),
+                 embeddings=np.stack([self.entries[p][2] for p in paths]))
+        os.replace(tmp, self.path)
+
+
+# --- 难度 ---
+def hardness_scores(weights, paths, imgsz=640, batch=16, device="cpu"):
+    """
+    用上一次训练的 best.pt 在每张训练图上算检测损失（box + cls + dfl），损失越大越难。
+    模型保持 eval 模式，BN 统计量不变；eval 输出里带着原始特征图，损失函数可以直接用。
+    """
+    import torch
+    from types import SimpleNamespace
+    from ultralytics.nn.tasks import attempt_load_one_weight
+    from ultralytics.utils import DEFAULT_CFG_DICT
+
+    model, _ = attempt_load_one_weight(weights, device=device)
+    args = model.args if isinstance(model.args, dict) else vars(model.args)
+    model.args = SimpleNamespace(**{**DEFAULT_CFG_DICT, **args})
+    criterion = model.init_criterion()
+    scores = {}
+    with torch.no_grad():
+        for chunk, images in _batches(paths, imgsz, batch):
+            preds = model(images.to(device))
+            feats = preds[1] if isinstance(preds, tuple) else preds
+            for i, path in enumerate(chunk):
+                labels = torch.from_numpy(read_labels(path))
+                one = {
+                    "batch_idx": torch.zeros(len(labels)),
+                    "cls": labels[:, :1],
+                    "bboxes": labels[:, 1:5],
+                }
+                _, items = criterion([f[i:i + 1] for f in feats], one)
+                scores[path] = float(items.sum())
+    return scores
+
+
+def _same_yaml(a, b):
+    a, b = os.path.normcase(os.path.abspath(a)), os.path.normcase(os.path.abspath(b))
+    return a == b or (os.path.exists(a) and os.path.exists(b) and os.path.samefile(a, b))
+
+
+def _trained_on(run_dir, data_yaml):
+    """run 的 args.yaml 里的数据集是不是 data_yaml，或者是从它生成的精简训练集"""
+    try:
+        with open(os.path.join(run_dir, "args.yaml"), "r", encoding="utf-8") as f:
+            data = (yaml.safe_load(f) or {}).get("data")
+    except (OSError, yaml.YAMLError):
+        return False
+    if not data:
+        return False
+    if _same_yaml(data, data_yaml):
+        return True
+    selection = os.path.join(os.path.dirname(str(data)), "selection.yaml")
+    if os.path.exists(selection):
+        with open(selection, "r", encoding="utf-8") as f:
+            source = (yaml.safe_load(f) or {}).get("source")
+        return bool(source) and _same_yaml(source, data_yaml)
+    return False
+
+
+def latest_best(data_yaml, base_dir=os.path.join("runs", "train")):
+    """runs/train 下在这个数据集上训练的最新 best.pt，别的数据集的模型打出来的难度分没有意义"""
+    candidates = [p for p in glob.glob(os.path.join(base_dir, "*", "weights", "best.pt"))
+                  if _trained_on(os.path.dirname(os.path.dirname(p)), data_yaml)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+
+# --- 选择 ---
+def k_center_greedy(embeddings, count, first=0):
+    """经典 k-center 贪心：每次选离已选集合最远的点，返回选中的下标"""
+    x = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+    selected = [first]
+    min_dist = np.linalg.norm(x - x[first], axis=1)
+    for _ in range(1, min(count, len(x))):
+        index = int(np.argmax(min_dist))
+        selected.append(index)
+        np.minimum(min_dist, np.linalg.norm(x - x[index], axis=1), out=min_dist)
+    return selected
+
+
+def select_subset(paths, embeddings, hardness=None, fraction=0.4, hard_fraction=0.1, hard_repeat=2):
+    """
+    先用 k-center 选出 fraction 比例、彼此差异最大的图片（从最难的那张开始），
+    再把最难的 hard_fraction 比例图片补进来并额外重复 hard_repeat-1 次。
+    返回训练列表（可能有重复）和统计信息。
+    """
+    n = len(paths)
+    count = max(1, int(round(n * fraction)))
+    hard = np.array([hardness.get(p, 0.0) for p in paths]) if hardness else None
+    first = int(np.argmax(hard)) if hard is not None else 0
+    chosen = k_center_greedy(embeddings, count, first)
+    selected = [paths[i] for i in chosen]
+
+    extra = []
+    if hard is not None and hard_fraction > 0:
+        hardest = np.argsort(-hard)[:max(1, int(round(n * hard_fraction)))]
+        chosen_set = set(chosen)
+        for i in hardest:
+            if i not in chosen_set:
+                selected.append(paths[i])
+            extra += [paths[i]] * (hard_repeat - 1)
+    stats = {
+        "images": n,
+        "diverse": len(chosen),
+        "unique": len(set(selected)),
+        "entries": len(selected) + len(extra),
+        "epoch_ratio": round((len(selected) + len(extra)) / max(n, 1), 3),
+    }
+    if hard is not None:
+        stats["mean_hardness_all"] = round(float(hard.mean()), 4)
+        stats["mean_hardness_selected"] = round(float(np.mean([hardness.get(p, 0.0) for p in selected])), 4)
+    return selected + extra, stats
+
+
+def write_subset(data_yaml, data, entries, stats, out_dir):
+    """写图片列表和新的 data.yaml；path 改成绝对路径，val/test 仍指向原数据集"""
+    os.makedirs(out_dir, exist_ok=True)
+    list_path = os.path.abspath(os.path.join(out_dir, "train.txt"))
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(entries) + "\n")
+    subset = dict(data)
+    subset["train"] = list_path
+    yaml_path = os.path.join(out_dir, "data.yaml")
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(subset, f, allow_unicode=True, sort_keys=False)
+    with open(os.path.join(out_dir, "selection.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump({"source": os.path.abspath(data_yaml), **stats}, f, allow_unicode=True, sort_keys=False)
+    return yaml_path
+
+
+def build_coreset(data_yaml, weights=None, fraction=0.4, hard_fraction=0.1, hard_repeat=2,
+                  embed_weights=EMBED_MODEL, imgsz=640, device="cpu", out_dir=None):
+    """
+    生成精简训练集，返回新 data.yaml 的路径和统计。weights 是上一次训练的模型，
+    用来给每张图打难度分；为 None 时自动找 runs/train 下在这个数据集上训练的最新 best.pt，找不到就只做多样性采样。
+    """
+    data = load_data_yaml(data_yaml)
+    name = _dataset_name(data_yaml)
+    out_dir = out_dir or os.path.join(CORESET_DIR, name)
+    paths = split_images(data, "train")
+    if not paths:
+        raise ValueError(f"{data_yaml} 的训练集里没有图片")
+
+    cache = EmbeddingCache(os.path.join(CORESET_DIR, name, "embeddings.npz"), embed_weights)
+    embeddings = cache.embed(paths, device=device)
+    paths = [p for p in paths if p in cache.entries]  # 读不出来的图片跳过
+
+    weights = weights or latest_best(data_yaml)
+    hardness = None
+    if weights is None:
+        print(f"runs/train 下没有用 {data_yaml} 训练的模型，跳过难度评分，只做多样性采样")
+    else:
+        print(f"用 {weights} 计算每张图片的损失")
+        hardness = hardness_scores(weights, paths, imgsz, device=device)
+        with open(os.path.join(os.path.dirname(cache.path), "hardness.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["image", "loss"])
+            writer.writerows(sorted(hardness.items(), key=lambda kv: -kv[1]))
+
+    entries, stats = select_subset(paths, embeddings, hardness, fraction, hard_fraction, hard_repeat)
+    stats.update(fraction=fraction, hard_fraction=hard_fraction, hard_repeat=hard_repeat, scorer=weights)
+    return write_subset(data_yaml, data, entries, stats, out_dir), stats
+
+
+def _best_map(run_dir):
+    tail = ResultsCsvTail(os.path.join(run_dir, "results.csv"))
+    tail.poll()
+    values = tail.get("metrics/mAP50-95(B)")
+    epochs = max(tail.rows, 1)
+    # time 列是训练开始后的累计秒数，不含数据集缓存等准备时间；旧版本 ultralytics 没有这一列时
+    # 才退回用 args.yaml 到 last.pt 的时间差估算
+    times = tail.get("time")
+    if times:
+        return max(values) if values else 0.0, times[-1] / epochs
+    start = os.path.getmtime(os.path.join(run_dir, "args.yaml"))
+    end = os.path.getmtime(os.path.join(run_dir, "weights", "last.pt"))
+    return max(values) if values else 0.0, (end - start) / epochs
+
+
+def compare_runs(full_run, subset_run, tolerance=0.01):
+    """对比全量训练和精简训练：每轮耗时之比，以及 mAP50-95 是否在容差内"""
+    full_map, full_epoch = _best_map(full_run)
+    sub_map, sub_epoch = _best_map(subset_run)
+    return {
+        "full_mAP50-95": round(full_map, 4),
+        "subset_mAP50-95": round(sub_map, 4),
+        "mAP_drop": round(full_map - sub_map, 4),
+        "epoch_time_ratio": round(sub_epoch / max(full_epoch, 1e-6), 3),
+        "within_tolerance": full_map - sub_map <= tolerance,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按多样性和难度挑选训练子集，生成新的数据集 yaml")
+    parser.add_argument("data", help="数据集 yaml，例如 PlantTrainData.yaml")
+    parser.add_argument("--weights", help="上一次训练的模型，用来算每张图的损失；默认 runs/train 下最新的 best.pt")
+    parser.add_argument("--fraction", type=float, default=0.4, help="k-center 选出的图片比例")
+    parser.add_argument("--hard-fraction", type=float, default=0.1, help="最难图片的比例")
+    parser.add_argument("--hard-repeat", type=int, default=2, help="最难图片在列表里出现的次数")
+    parser.add_argument("--embed-weights", default=EMBED_MODEL, help="提特征用的模型")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--out", help="输出目录，默认 runs/coreset/<数据集名>")
+    parser.add_argument("--compare", nargs=2, metavar=("FULL_RUN", "SUBSET_RUN"),
+                        help="只对比两次训练结果，例如 runs/train/exp runs/train/exp2")
+    parser.add_argument("--tolerance", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.compare:
+        result = compare_runs(*args.compare, tolerance=args.tolerance)
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        sys.exit(0 if result["within_tolerance"] else 1)
+
+    yaml_path, stats = build_coreset(args.data, args.weights, args.fraction, args.hard_fraction, args.hard_repeat,
+                                     args.embed_weights, args.imgsz, args.device, args.out)
+    print(f"已生成 {yaml_path}：{stats['images']} 张中选出 {stats['unique']} 张，"
+          f"每轮 {stats['entries']} 个样本（全量的 {stats['epoch_ratio']:.0%}）")
@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import subprocess
+from datetime import timedelta
+import yaml
+from Distill import _parse_overrides
+
+DIST_DIR = os.path.join("runs", "dist")
+DEFAULT_PORT = 29500
+TIMEOUT = 3 * 3600  # 和 ultralytics 的 DDP 一样，rank 0 验证期间其它 rank 最多等 3 小时
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def threads_per_rank(nproc, threads=None):
+    """每个 rank 的计算线程数：没有指定时把本机核数平分给本机的 rank，避免互相抢核"""
+    return threads or max(1, (os.cpu_count() or 1) // nproc)
+
+
+def resolve_run_name(project, name):
+    """
+    和 ultralytics 一样按 exp、exp2、exp3 递增出一个不存在的目录名。启动前就定下来再传给所有 rank，
+    否则每个 rank 各自递增，拿到的 save_dir 不一致。
+    """
+    if not os.path.exists(os.path.join(project, name)):
+        return name
+    n = 2
+    while os.path.exists(os.path.join(project, f"{name}{n}")):
+        n += 1
+    return f"{name}{n}"
+
+
+def rank_env(rank, local_rank, world_size, master_addr, master_port, threads, ifname=None):
+    env = dict(os.environ)
+    env.update({
+        "MASTER_ADDR": master_addr,
+        "MASTER_PORT": str(master_port),
+        "WORLD_SIZE": str(world_size),
+        "RANK": str(rank),
+        "LOCAL_RANK": str(local_rank),
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "OPENBLAS_NUM_THREADS": str(threads),
+        "DIST_THREADS": str(threads),
+    })
+    if ifname:
+        env["GLOO_SOCKET_IFNAME"] = ifname  # 多网卡的机器上指定 gloo 走哪块网卡
+    return env
+
+
+def launch(worker_args, nproc, nnodes=1, node_rank=0, master_addr="127.0.0.1", master_port=None, threads=None,
+           ifname=None, log_dir=None):
+    """
+    在本机起 nproc 个 rank（python -m DistTrain worker ...），多机时每台机器各运行一次，
+    nnodes/master_addr/master_port 相同，node_rank 不同。本机第一个 rank 的输出直接打到当前终端，
+    其余 rank 写到 log_dir/rank<N>.log。任何一个 rank 失败就结束其它 rank，返回它的退出码。
+    """
+    if master_port is None:
+        master_port = free_port() if nnodes == 1 else DEFAULT_PORT
+    world_size = nnodes * nproc
+    threads = threads_per_rank(nproc, threads)
+    log_dir = log_dir or os.path.join(DIST_DIR, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    procs, logs = [], []
+    for local_rank in range(nproc):
+        rank = node_rank * nproc + local_rank
+        env = rank_env(rank, local_rank, world_size, master_addr, master_port, threads, ifname)
+        out = None
+        if local_rank > 0:
+            out = open(os.path.join(log_dir, f"rank{rank}.log"), "w", encoding="utf-8")
+            logs.append(out)
+        # stdin 接一根管道：启动器不管怎么退出（包括 Windows 上被 terminate），worker 都能读到 EOF 自行结束
+        procs.append(subprocess.Popen([sys.executable, "-m", "DistTrain", "worker"] + worker_args, env=env,
+                                      stdin=subprocess.PIPE, stdout=out, stderr=subprocess.STDOUT if out else None))
+    print(f"已启动 {nproc} 个 rank（共 {world_size} 个，第 {node_rank} 台机器），每个 rank {threads} 线程，"
+          f"rendezvous {master_addr}:{master_port}", flush=True)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    previous = signal.signal(signal.SIGTERM, stop)
+    code = 0
+    try:
+        running = list(procs)
+        while running:
+            for p in list(running):
+                ret = p.poll()
+                if ret is None:
+                    continue
+                running.remove(p)
+                if ret != 0 and code == 0:
+                    code = ret
+                    print(f"rank 进程 {p.pid} 异常退出（{ret}），结束其它 rank，日志见 {log_dir}", flush=True)
+                    for other in running:
+                        other.terminate()
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        code = 1
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                p.kill()
+            p.stdin.close()
+        for f in logs:
+            f.close()
+        signal.signal(signal.SIGTERM, previous)
+    return code
+
+
+# --- worker：每个 rank 一个进程 ---
+def _watch_launcher():
+    """启动器退出后 stdin 会读到 EOF，这时不再等集合通信超时，直接退出"""
+    def watch():
+        try:
+            sys.stdin.read()
+        except Exception:
+            pass
+        os._exit(1)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def _patch_ultralytics():
+    """
+    ultralytics 8.0 的 DDP 只考虑了 CUDA：包模型时传 device_ids=[RANK]，dataset 缓存的 barrier 也带 device_ids，
+    在 CPU + gloo 下都会报错。这里把两处换成 CPU 能用的版本，其余的训练循环、分片采样、
+    只在 rank 0 验证和保存（results.csv、weights）都沿用 ultralytics 自己的逻辑。
+    """
+    from contextlib import contextmanager
+    import torch.distributed as dist
+    from torch.nn.parallel import DistributedDataParallel
+    import ultralytics.engine.trainer as engine
+    import ultralytics.models.yolo.detect.train as detect_train
+
+    def cpu_ddp(model, device_ids=None, **kwargs):
+        return DistributedDataParallel(model, **kwargs)
+
+    @contextmanager
+    def zero_first(local_rank):
+        initialized = dist.is_available() and dist.is_initialized()
+        if initialized and local_rank not in (-1, 0):
+            dist.barrier()
+        yield
+        if initialized and local_rank == 0:
+            dist.barrier()
+
+    engine.DDP = cpu_ddp
+    detect_train.torch_distributed_zero_first = zero_first
+
+
+def _make_trainer_class():
+    import torch
+    import torch.distributed as dist
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import RANK
+
+    class CpuDDPTrainer(DetectionTrainer):
+        """gloo 后端的 CPU 数据并行训练；batch 是所有 rank 加起来的总批大小，和单进程训练的含义一样"""
+
+        def __init__(self, overrides=None):
+            overrides = dict(overrides or {}, device="cpu", amp=False)
+            super().__init__(overrides=overrides)
+            self.world_size = int(os.environ.get("WORLD_SIZE", 1))
+
+        def _setup_ddp(self, world_size):
+            if not dist.is_initialized():
+                # MASTER_ADDR/MASTER_PORT 由启动器放在环境变量里
+                dist.init_process_group("gloo", timeout=timedelta(seconds=TIMEOUT), rank=RANK,
+                                        world_size=self.world_size)
+            self.device = torch.device("cpu")
+
+        def train(self):
+            # 1 个 rank 时也初始化进程组，DistributedSampler 需要它
+            self._setup_ddp(self.world_size)
+            try:
+                self._do_train(self.world_size)
+            finally:
+                dist.destroy_process_group()
+
+        def benchmark(self, iters=30, warmup=5):
+            """只跑固定步数的前向/反向/更新，不验证不保存，返回所有 rank 合计的 images/sec"""
+            self._setup_ddp(self.world_size)
+            try:
+                self._setup_train(self.world_size)
+                self.model.train()
+                loader = iter(self.train_loader)
+                images = 0
+                start = None
+                for i in range(warmup + iters):
+                    if i == warmup:
+                        dist.barrier()
+                        start = time.perf_counter()
+                    batch = self.preprocess_batch(next(loader))
+                    loss, _ = self.model(batch)
+                    loss.backward()
+                    self.optimizer.step()
+                    self.optimizer.zero_grad()
+                    if i >= warmup:
+                        images += batch["img"].shape[0]
+                dist.barrier()
+                elapsed = time.perf_counter() - start
+                total = torch.tensor([images], dtype=torch.float64)
+                dist.all_reduce(total)
+                return float(total.item()) / elapsed, elapsed
+            finally:
+                dist.destroy_process_group()
+
+    return CpuDDPTrainer
+
+
+def worker(overrides, bench=0, warmup=5, bench_out=None):
+    import torch
+    _watch_launcher()
+    threads = int(os.environ.get("DIST_THREADS", 1))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    _patch_ultralytics()
+    trainer = _make_trainer_class()(overrides=overrides)
+    if not bench:
+        trainer.train()
+        return
+    ips, elapsed = trainer.benchmark(bench, warmup)
+    if int(os.environ.get("RANK", 0)) == 0 and bench_out:
+        with open(bench_out, "w", encoding="utf-8") as f:
+            json.dump({"images_per_sec": ips, "seconds": elapsed, "threads": threads,
+                       "world_size": trainer.world_size}, f)
+
+
+# --- 扩展性报告：同一台机器上用不同 rank 数各跑一小段 ---
+def scaling_report(overrides, ranks=(1, 2, 4), iters=30, warmup=5, out_dir=None):
+    """
+    按 ranks 依次启动本机多 rank 训练，每次只跑 iters 步，统计所有 rank 合计的 images/sec，
+    写 scaling_report.yaml/txt。总批大小保持不变，相当于同一份训练配置换成不同的进程数。
+    """
+    out_dir = out_dir or os.path.join(DIST_DIR, time.strftime("scaling_%Y%m%d_%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    overrides = dict(overrides, project=out_dir, name="bench", exist_ok=True, plots=False, val=False)
+    rows = []
+    for n in ranks:
+        result_path = os.path.join(out_dir, f"ranks{n}.json")
+        args = [f"{k}={v}" for k, v in overrides.items()]
+        args += ["--bench", str(iters), "--warmup", str(warmup), "--bench-out", result_path]
+        print(f"--- {n} 个 rank ---", flush=True)
+        code = launch(args, n, log_dir=os.path.join(out_dir, f"logs_{n}"))
+        if code != 0 or not os.path.exists(result_path):
+            print(f"{n} 个 rank 的测试失败（退出码 {code}），跳过")
+            continue
+        with open(result_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        rows.append({"ranks": n, "threads_per_rank": result["threads"],
+                     "images_per_sec": round(result["images_per_sec"], 2), "seconds": round(result["seconds"], 2)})
+
+    base = next((r["images_per_sec"] / r["ranks"] for r in rows if r["ranks"] == min(ranks)), None)
+    for r in rows:
+        r["speedup"] = round(r["images_per_sec"] / (base * min(ranks)), 2) if base else None
+        r["efficiency"] = round(r["images_per_sec"] / (base * r["ranks"]), 2) if base else None
+    report = {"model": overrides.get("model"), "data": overrides.get("data"), "batch": overrides.get("batch"),
+              "imgsz": overrides.get("imgsz", 640), "iters": iters, "cpu_count": os.cpu_count(), "results": rows}
+    with open(os.path.join(out_dir, "scaling_report.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(report, f, allow_unicode=True, sort_keys=False)
+
+    lines = [f"{'rank 数':>8}{'线程/rank':>10}{'images/s':>12}{'加速比':>8}{'效率':>8}"]
+    for r in rows:
+        lines.append(f"{r['ranks']:>8}{r['threads_per_rank']:>10}{r['images_per_sec']:>12.2f}"
+                     f"{r['speedup'] or 0:>8.2f}{r['efficiency'] or 0:>8.0%}")
+    text = "\n".join(lines)
+    with open(os.path.join(out_dir, "scaling_report.txt"), "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    return report, text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用 gloo 后端在多个进程/多台机器上做 CPU 数据并行训练")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="启动本机的 rank，多机时每台机器各运行一次")
+    train.add_argument("--nproc", type=int, default=2, help="本机的 rank 数")
+    train.add_argument("--nnodes", type=int, default=1)
+    train.add_argument("--node-rank", type=int, default=0)
+    train.add_argument("--master-addr", default="127.0.0.1", help="rank 0 所在机器的地址")
+    train.add_argument("--master-port", type=int, help=f"单机时自动找空闲端口，多机默认 {DEFAULT_PORT}")
+    train.add_argument("--threads", type=int, help="每个 rank 的线程数，默认本机核数 / nproc")
+    train.add_argument("--ifname", help="多机时 gloo 使用的网卡名，例如 eth0")
+    train.add_argument("overrides", nargs="*", help="训练参数，和 yolo 命令一样写 key=value")
+
+    scale = sub.add_parser("scale", help="单机上比较不同 rank 数的训练吞吐")
+    scale.add_argument("--ranks", default="1,2,4")
+    scale.add_argument("--iters", type=int, default=30)
+    scale.add_argument("--warmup", type=int, default=5)
+    scale.add_argument("--out")
+    scale.add_argument("overrides", nargs="*")
+
+    work = sub.add_parser("worker", help="由启动器调用")
+    work.add_argument("--bench", type=int, default=0)
+    work.add_argument("--warmup", type=int, default=5)
+    work.add_argument("--bench-out")
+    work.add_argument("overrides", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        worker(_parse_overrides(args.overrides), args.bench, args.warmup, args.bench_out)
+        sys.exit(0)
+
+    overrides = _parse_overrides(args.overrides)
+    if "model" not in overrides or "data" not in overrides:
+        parser.error("需要 model=... data=...")
+    if args.command == "train":
+        project = str(overrides.get("project", "runs/train"))
+        name = str(overrides.get("name", "exp"))
+        if not overrides.get("exist_ok"):
+            name = resolve_run_name(project, name)
+        overrides.update(project=project, name=name, exist_ok=True)
+        worker_args = [f"{k}={v}" for k, v in overrides.items()]
+        sys.exit(launch(worker_args, args.nproc, args.nnodes, args.node_rank, args.master_addr, args.master_port,
+                        args.threads, args.ifname, log_dir=os.path.join(DIST_DIR, "logs", name)))
+    _, text = scaling_report(overrides, [int(n) for n in args.ranks.split(",")], args.iters, args.warmup, args.out)
+    print(text)
+    sys.exit(0)
@@ -0,0 +1,317 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+import yaml
+
+MODEL_DIR = os.path.join("Assets", "Model")
+DATA_DIR = os.path.join("Assets", "data")
+BASE_STUDENT = "yolov8n.yaml"
+
+
+def teacher_models(model_dir=MODEL_DIR):
+    """Assets/Model 下已发布的模型，都可以当老师"""
+    return sorted(glob.glob(os.path.join(model_dir, "*.pt")))
+
+
+def narrow_student_yaml(width, depth=0.33, base=BASE_STUDENT, path=None):
+    """
+    按 base 的结构生成更窄的学生模型 yaml：通道数乘 width（yolov8n 本身是 0.25），
+    写到 path 并返回路径。文件名不能带 n/s/m/l/x 结尾，否则 ultralytics 会按文件名改回标准规模。
+    """
+    from ultralytics.nn.tasks import yaml_model_load
+    cfg = yaml_model_load(base)
+    cfg["scales"] = {"c": [depth, width, 1024]}
+    cfg["scale"] = "c"
+    cfg.pop("yaml_file", None)
+    path = path or os.path.join("runs", "train", f"student_w{width:g}.yaml")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+class DistillLoss:
+    """
+    蒸馏损失：Detect 头输入的三层特征做特征蒸馏（学生特征经 1x1 卷积对齐到老师的通道数，
+    按老师特征的能量归一化后算 MSE），Detect 头输出里的分类 logit 做带温度的软标签 BCE。
+    检测损失本身不变，两项蒸馏损失按权重加在上面。
+    """
+
+    def __init__(self, teacher, student, feat_weight=1.0, kd_weight=1.0, temperature=2.0):
+        import torch
+        from torch import nn
+        self.torch = torch
+        self.teacher = teacher
+        self.feat_weight = feat_weight
+        self.kd_weight = kd_weight
+        self.temperature = temperature
+        s_head, t_head = student.model[-1], teacher.model[-1]
+        # 两个模型的 Detect 头输入通道数
+        s_channels = [seq[0].conv.in_channels for seq in s_head.cv2]
+        t_channels = [seq[0].conv.in_channels for seq in t_head.cv2]
+        device = next(student.parameters()).device
+        self.adapters = nn.ModuleList(nn.Conv2d(s, t, 1) for s, t in zip(s_channels, t_channels)).to(device)
+        self.reg_max = s_head.reg_max
+        self.use_kd = s_head.nc == t_head.nc
+        self.student_feats = []
+        self.teacher_feats = []
+        self.handles = []
+        self.base = None
+        self.sums = {"feat_loss": 0.0, "kd_loss": 0.0}
+        self.batches = 0
+        teacher.model[-1].register_forward_pre_hook(self._tap(self.teacher_feats))
+
+    @staticmethod
+    def _tap(store):
+        def hook(module, inputs):
+            # Detect.forward 会原地改写这个 list，先把输入特征的引用拷出来
+            store[:] = list(inputs[0])
+        return hook
+
+    def attach(self, model):
+        """把蒸馏损失挂到学生模型上：前向时截取特征，criterion 换成带蒸馏项的版本"""
+        if self.base is None:
+            self.base = getattr(model, "criterion", None) or model.init_criterion()
+        self.handles = [model.model[-1].register_forward_pre_hook(self._tap(self.student_feats))]
+        model.criterion = self
+
+    def detach(self, model):
+        """保存 checkpoint 前摘掉钩子和老师，存下来的学生模型和普通训练的一样"""
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        model.criterion = self.base
+
+    def __call__(self, preds, batch):
+        torch = self.torch
+        loss, items = self.base(preds, batch)
+        if not isinstance(preds, list) or not self.student_feats:
+            return loss, items  # 验证时不算蒸馏项
+        with torch.no_grad():
+            t_out = self.teacher(batch["img"])
+        t_preds = t_out[1] if isinstance(t_out, tuple) else t_out
+
+        feat = 0.0
+        for adapter, s, t in zip(self.adapters, self.student_feats, self.teacher_feats):
+            t = t.float()
+            feat = feat + torch.nn.functional.mse_loss(adapter(s.float()), t) / (t.pow(2).mean() + 1e-6)
+        feat = feat / len(self.adapters)
+
+        kd = torch.zeros((), device=feat.device)
+        if self.use_kd:
+            T = self.temperature
+            for s, t in zip(preds, t_preds):
+                s_cls = s[:, self.reg_max * 4:].float() / T
+                t_cls = torch.sigmoid(t[:, self.reg_max * 4:].float() / T)
+                kd = kd + torch.nn.functional.binary_cross_entropy_with_logits(s_cls, t_cls) * T * T
+            kd = kd / len(preds)
+
+        self.sums["feat_loss"] += float(feat)
+        self.sums["kd_loss"] += float(kd)
+        self.batches += 1
+        extra = (self.feat_weight * feat + self.kd_weight * kd) * batch["img"].shape[0]
+        # 和检测损失一样乘 batch size；新版本 loss 是按项的向量，平均摊到每一项上
+        return loss + extra / loss.numel(), items
+
+    def epoch_means(self):
+        means = {k: v / max(self.batches, 1) for k, v in self.sums.items()}
+        self.sums = {k: 0.0 for k in self.sums}
+        self.batches = 0
+        return means
+
+
+def _make_trainer_class():
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils.torch_utils import de_parallel
+    from ultralytics import YOLO
+
+    class DistillTrainer(DetectionTrainer):
+        """普通的 YOLO 检测训练，只是学生的损失里多了老师给的蒸馏项"""
+
+        def __init__(self, teacher, feat_weight=1.0, kd_weight=1.0, temperature=2.0, overrides=None):
+            super().__init__(overrides=overrides)
+            self.teacher_path = teacher
+            self.distill_args = (feat_weight, kd_weight, temperature)
+            self.distill = None
+            self.add_callback("on_train_epoch_end", DistillTrainer.log_distill)
+
+        @property
+        def adapters_path(self):
+            return self.wdir / "distill_adapters.pt"
+
+        def build_optimizer(self, model, *args, **kwargs):
+            """
+            _setup_train 里先建优化器、再建学习率调度、最后 resume，对齐卷积的参数组要在这里加进去，
+            调度器才会给它设 initial_lr，resume 时优化器的参数组数也才和 checkpoint 对得上。
+            """
+            import torch
+            optimizer = super().build_optimizer(model, *args, **kwargs)
+            student = de_parallel(model)
+            teacher = YOLO(self.teacher_path).model.to(self.device).float().eval()
+            for p in teacher.parameters():
+                p.requires_grad = False
+            self.distill = DistillLoss(teacher, student, *self.distill_args)
+            if not self.distill.use_kd:
+                print(f"老师的类别数 {teacher.model[-1].nc} 和数据集 {student.model[-1].nc} 不同，只做特征蒸馏")
+            if self.args.resume and self.adapters_path.exists():
+                # checkpoint 里只有学生，对齐卷积的权重单独存在 weights 目录下
+                self.distill.adapters.load_state_dict(torch.load(self.adapters_path, map_location=self.device))
+            # 对齐卷积单独一组参数，学习率和主干一样跟着 warmup 和调度走
+            optimizer.add_param_group({"params": list(self.distill.adapters.parameters()), "weight_decay": 0.0})
+            return optimizer
+
+        def _setup_train(self, world_size):
+            super()._setup_train(world_size)
+            self.distill.attach(de_parallel(self.model))
+
+        def save_model(self):
+            import torch
+            student = de_parallel(self.model)
+            self.distill.detach(student)
+            try:
+                super().save_model()
+                torch.save(self.distill.adapters.state_dict(), self.adapters_path)
+            finally:
+                self.distill.attach(student)
+
+        @staticmethod
+        def log_distill(trainer):
+            means = trainer.distill.epoch_means()
+            path = os.path.join(str(trainer.save_dir), "distill.csv")
+            new = not os.path.exists(path)
+            with open(path, "a", encoding="utf-8") as f:
+                if new:
+                    f.write("epoch,feat_loss,kd_loss\n")
+                f.write(f"{trainer.epoch + 1},{means['feat_loss']:.5f},{means['kd_loss']:.5f}\n")
+
+    return DistillTrainer
+
+
+def distill(teacher, student, data, feat_weight=1.0, kd_weight=1.0, temperature=2.0, **overrides):
+    """训练学生模型，返回训练器（save_dir、best、metrics 都在上面）"""
+    overrides.update(model=student, data=data)
+    trainer = _make_trainer_class()(teacher, feat_weight, kd_weight, temperature, overrides=overrides)
+    if overrides.get("workers") is not None:
+        from TrainProfiler import keep_workers
+        keep_workers(trainer, overrides["workers"])
+    trainer.train()
+    return trainer
+
+
+# --- 延迟 / mAP 对比报告 ---
+def measure_latency(weights, imgsz=640, runs=30, warmup=5, device="cpu"):
+    """按检测界面的用法逐张 predict，取推理耗时的中位数（毫秒）"""
+    import numpy as np
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    image = np.random.randint(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    times = []
+    for i in range(warmup + runs):
+        result = model.predict(image, imgsz=imgsz, device=device, verbose=False)[0]
+        if i >= warmup:
+            times.append(result.speed["inference"])
+    params = sum(p.numel() for p in model.model.parameters())
+    return statistics.median(times), params
+
+
+def teacher_map(teacher, data=None):
+    """
+    老师的 mAP：优先读检测界面性能指标页用的 Assets/data/<模型名>/mAP.txt，
+    没有这个文件时在同一个数据集上验证一次。返回 (mAP50-95, mAP50, 来源)。
+    """
+    name = os.path.splitext(os.path.basename(teacher))[0].strip().replace(" ", "_")
+    path = os.path.join(DATA_DIR, name, "mAP.txt")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            values = [line.split(":", 1)[1].strip() for line in f.readlines()[:2] if ":" in line]
+        try:
+            return float(values[0]), float(values[1]), path
+        except (IndexError, ValueError):
+            pass
+    from ultralytics import YOLO
+    metrics = YOLO(teacher).val(data=data, plots=False, verbose=False)
+    return metrics.box.map, metrics.box.map50, "val"
+
+
+def write_report(trainer, teacher, data, imgsz=640, device="cpu"):
+    """学生和老师在同一设备上比较推理延迟、参数量和 mAP，写 distill_report.yaml/txt 到训练目录"""
+    student_weights = str(trainer.best)
+    s_map = trainer.metrics.get("metrics/mAP50-95(B)", 0.0)
+    s_map50 = trainer.metrics.get("metrics/mAP50(B)", 0.0)
+    t_map, t_map50, source = teacher_map(teacher, data)
+    t_ms, t_params = measure_latency(teacher, imgsz, device=device)
+    s_ms, s_params = measure_latency(student_weights, imgsz, device=device)
+
+    report = {
+        "teacher": {"weights": teacher, "mAP50-95": round(t_map, 4), "mAP50": round(t_map50, 4),
+                    "latency_ms": round(t_ms, 2), "params": t_params, "map_source": source},
+        "student": {"weights": student_weights, "mAP50-95": round(float(s_map), 4), "mAP50": round(float(s_map50), 4),
+                    "latency_ms": round(s_ms, 2), "params": s_params},
+        "speedup": round(t_ms / max(s_ms, 1e-6), 2),
+        "mAP_drop": round(t_map - float(s_map), 4),
+        "imgsz": imgsz,
+        "device": device,
+    }
+    save_dir = str(trainer.save_dir)
+    with open(os.path.join(save_dir, "distill_report.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(report, f, allow_unicode=True, sort_keys=False)
+
+    lines = [f"{'':<10}{'mAP50-95':>10}{'mAP50':>10}{'延迟ms':>10}{'参数量':>12}"]
+    for role in ("teacher", "student"):
+        r = report[role]
+        lines.append(f"{role:<10}{r['mAP50-95']:>10.4f}{r['mAP50']:>10.4f}{r['latency_ms']:>10.2f}{r['params']:>12,}")
+    lines.append(f"加速 {report['speedup']}x，mAP50-95 下降 {report['mAP_drop']:.4f}（老师 mAP 来自 {source}）")
+    text = "\n".join(lines)
+    with open(os.path.join(save_dir, "distill_report.txt"), "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    return report, text
+
+
+def _parse_overrides(items):
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            value = yaml.safe_load(value)
+        except yaml.YAMLError:
+            pass
+        overrides[key] = value
+    return overrides
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用已发布的模型做老师蒸馏训练更小的学生模型")
+    parser.add_argument("--teacher", required=True, help="老师权重，例如 \"Assets/Model/car detector.pt\"")
+    parser.add_argument("--student", default="yolov8n.pt", help="学生模型，yolov8n.pt 或模型 yaml")
+    parser.add_argument("--width", type=float, help="按 yolov8n 结构生成更窄的学生，通道倍率（yolov8n 为 0.25）")
+    parser.add_argument("--data", required=True)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--lr0", type=float, default=0.01)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--project", default="runs/train")
+    parser.add_argument("--name", default="exp")
+    parser.add_argument("--feat-weight", type=float, default=1.0)
+    parser.add_argument("--kd-weight", type=float, default=1.0)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--report-device", default="cpu", help="测延迟用的设备")
+    parser.add_argument("overrides", nargs="*", help="其它训练参数，和 yolo 命令一样写 key=value")
+    args = parser.parse_args()
+
+    student = args.student
+    if args.width:
+        student = narrow_student_yaml(args.width, path=os.path.join(args.project, f"student_w{args.width:g}.yaml"))
+    start = time.time()
+    trainer = distill(args.teacher, student, args.data, args.feat_weight, args.kd_weight, args.temperature,
+                      epochs=args.epochs, batch=args.batch, lr0=args.lr0, imgsz=args.imgsz,
+                      project=args.project, name=args.name, **_parse_overrides(args.overrides))
+    print(f"蒸馏训练用时 {(time.time() - start) / 3600:.2f} 小时")
+    try:
+        _, text = write_report(trainer, args.teacher, args.data, args.imgsz, args.report_device)
+        print(text)
+    except Exception as e:
+        print("生成对比报告失败：", e)
+        sys.exit(1)
@@ -0,0 +1,243 @@
+import os
+import csv
+import sys
+import time
+import signal
+import threading
+import statistics
+from ReadMetrics import ResultsCsvTail
+
+STOP_LOG = os.path.join("runs", "early_stop_log.csv")
+DEFAULT_METRIC = "metrics/mAP50-95(B)"
+
+
+class Trial:
+    """一次正在运行的训练，对应一个 results.csv 和一个 yolo 子进程"""
+
+    def __init__(self, name, csv_path, process=None, max_epochs=None, metric=DEFAULT_METRIC, mode="max"):
+        self.name = name
+        self.csv_path = csv_path
+        self.process = process
+        self.max_epochs = max_epochs
+        self.metric = metric
+        self.mode = mode
+        self.tail = ResultsCsvTail(csv_path)
+        self.stopped = False
+        self.stop_reason = None
+        self.pending_reason = None
+        self.pending_since = None
+        self.checked_epoch = 0  # 规则上次检查时已有的轮数，一次 poll 可能跨过好几轮
+        self.saved_cpu_hours = 0.0
+
+    @property
+    def run_dir(self):
+        return os.path.dirname(self.csv_path)
+
+    @property
+    def epochs(self):
+        return self.tail.rows
+
+    def values(self):
+        return self.tail.get(self.metric)
+
+    def better(self, a, b):
+        return a > b if self.mode == "max" else a < b
+
+    def best_until(self, epoch):
+        """前 epoch 轮里的最好值"""
+        values = self.values()[:epoch]
+        if not values:
+            return None
+        return max(values) if self.mode == "max" else min(values)
+
+    def epoch_seconds(self):
+        # ultralytics 的 time 列是累计秒数，旧版本没有这一列
+        times = self.tail.get("time")
+        if times and self.epochs:
+            return times[-1] / self.epochs
+        return None
+
+    def finished(self):
+        if self.process is not None and self.process.poll() is not None:
+            return True
+        return self.max_epochs is not None and self.epochs >= self.max_epochs
+
+
+class PatienceRule:
+    """指标连续 patience 轮没有提升超过 min_delta 就停止"""
+
+    def __init__(self, patience=30, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+
+    def check(self, trial, controller):
+        values = trial.values()
+        if self.patience <= 0 or len(values) <= self.patience:
+            return None
+        best_index = 0
+        for i, value in enumerate(values):
+            if trial.better(value, values[best_index] + (self.min_delta if trial.mode == "max" else -self.min_delta)):
+                best_index = i
+        if len(values) - 1 - best_index >= self.patience:
+            return f"{self.patience} 轮内 {trial.metric} 没有提升（最好在第 {best_index + 1} 轮）"
+        return None
+
+
+class MedianStoppingRule:
+    """同一轮次下，当前最好值比其它 trial 的中位数差就停止"""
+
+    def __init__(self, grace_epochs=10, min_trials=3):
+        self.grace_epochs = grace_epochs
+        self.min_trials = min_trials
+
+    def check(self, trial, controller):
+        epoch = trial.epochs
+        if epoch < self.grace_epochs:
+            return None
+        others = [t.best_until(epoch) for t in controller.all_trials()
+                  if t is not trial and t.epochs >= epoch]
+        others = [v for v in others if v is not None]
+        if len(others) < self.min_trials - 1:
+            return None
+        median = statistics.median(others)
+        current = trial.best_until(epoch)
+        if current is not None and trial.better(median, current):
+            return f"第 {epoch} 轮最好值 {current:.4f} 低于其它 trial 中位数 {median:.4f}"
+        return None
+
+
+class SuccessiveHalvingRule:
+    """在 min_epochs * reduction^k 轮设检查点，只保留排名前 1/reduction 的 trial"""
+
+    def __init__(self, min_epochs=5, reduction=3):
+        self.min_epochs = min_epochs
+        self.reduction = reduction
+
+    def rungs(self, max_epochs):
+        rung = self.min_epochs
+        while max_epochs is None or rung < max_epochs:
+            yield rung
+            rung *= self.reduction
+            if max_epochs is None and rung > 10000:
+                break
+
+    def check(self, trial, controller):
+        # 两次 poll 之间可能写了好几轮，跨过的每个检查点都要判断
+        for rung in self.rungs(trial.max_epochs):
+            if rung > trial.epochs:
+                break
+            if rung <= trial.checked_epoch:
+                continue
+            reason = self.check_rung(trial, controller, rung)
+            if reason:
+                return reason
+        return None
+
+    def check_rung(self, trial, controller, rung):
+        scores = [t.best_until(rung) for t in controller.all_trials() if t.epochs >= rung]
+        scores = [v for v in scores if v is not None]
+        if len(scores) < self.reduction:
+            return None
+        scores.sort(reverse=(trial.mode == "max"))
+        keep = max(1, len(scores) // self.reduction)
+        cutoff = scores[keep - 1]
+        current = trial.best_until(rung)
+        if current is not None and trial.better(cutoff, current):
+            return f"第 {rung} 轮检查点未进入前 {keep}/{len(scores)}"
+        return None
+
+
+class EarlyStopController:
+    """
+    监视一个或多个 trial 的 results.csv，按规则提前结束训练：
+    等当前 epoch 的权重写完后再结束 yolo 进程，并记录节省的 CPU 时间。
+    """
+
+    def __init__(self, rules=None, log_path=STOP_LOG, cpu_threads=None, weight_timeout=120):
+        self.rules = rules if rules is not None else [PatienceRule()]
+        self.log_path = log_path
+        self.cpu_threads = cpu_threads or os.cpu_count() or 1
+        self.weight_timeout = weight_timeout
+        self.trials = {}
+        self.history = []  # 已结束的 trial，中位数/减半规则也要参考
+
+    def register(self, trial):
+        self.trials[trial.name] = trial
+        return trial
+
+    def all_trials(self):
+        return list(self.trials.values()) + self.history
+
+    def poll(self):
+        """检查所有 trial，返回本次被停止的 trial 列表"""
+        stopped = []
+        for name, trial in list(self.trials.items()):
+            new_rows = trial.tail.poll()
+            if trial.pending_reason is not None:
+                if self._weights_ready(trial):
+                    self.stop(trial, trial.pending_reason)
+                    stopped.append(trial)
+            elif new_rows:
+                for rule in self.rules:
+                    reason = rule.check(trial, self)
+                    if reason:
+                        trial.pending_reason = reason
+                        trial.pending_since = time.time()
+                        if self._weights_ready(trial):
+                            self.stop(trial, reason)
+                            stopped.append(trial)
+                        break
+                trial.checked_epoch = trial.epochs
+            if trial.stopped or trial.finished():
+                self.history.append(self.trials.pop(name))
+        return stopped
+
+    def _weights_ready(self, trial):
+        # results.csv 先写，权重后写；等 last.pt 比 csv 新再结束进程，保证 best.pt 是完整的
+        last = os.path.join(trial.run_dir, "weights", "last.pt")
+        try:
+            ready = os.path.getmtime(last) >= os.path.getmtime(trial.csv_path)
+        except OSError:
+            ready = False
+        return ready or time.time() - (trial.pending_since or time.time()) > self.weight_timeout
+
+    def _terminate(self, process):
+        if process is None or process.poll() is not None:
+            return
+        # 先发 Ctrl+C，让 yolo 自己收尾；超时再强制结束
+        try:
+            if sys.platform == "win32":
+                process.terminate()
+            else:
+                process.send_signal(signal.SIGINT)
+            process.wait(timeout=30)
+        except Exception:
+            process.terminate()
+            process.wait()
+
+    def stop(self, trial, reason):
+        """立即结束一个 trial（例如超出预算），同样记录节省的 CPU 时间"""
+        trial.stopped = True
+        trial.stop_reason = reason
+        trial.pending_reason = None
+        # 结束进程可能要等几十秒，放到后台线程，不阻塞 GUI 的定时器
+        threading.Thread(target=self._terminate, args=(trial.process,), daemon=True).start()
+
+        remaining = max(0, (trial.max_epochs or trial.epochs) - trial.epochs)
+        seconds = trial.epoch_seconds() or 0.0
+        trial.saved_cpu_hours = remaining * seconds * self.cpu_threads / 3600.0
+        self._log(trial)
+
+    def _log(self, trial):
+        folder = os.path.dirname(self.log_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        new_file = not os.path.exists(self.log_path)
+        with open(self.log_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["time", "trial", "run_dir", "stopped_epoch", "max_epochs", "best",
+                                 "saved_cpu_hours", "reason"])
+            writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), trial.name, trial.run_dir, trial.epochs,
+                             trial.max_epochs, trial.best_until(trial.epochs), f"{trial.saved_cpu_hours:.3f}",
+                             trial.stop_reason])
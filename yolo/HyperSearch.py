@@ -0,0 +1,314 @@
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import itertools
+import subprocess
+import yaml
+from TrainCommand import build_train_command
+from TrainProfiler import _dataset_name, load_recommendation
+from EarlyStopController import EarlyStopController, MedianStoppingRule, PatienceRule, Trial, DEFAULT_METRIC
+
+SEARCH_DIR = os.path.join("runs", "search")
+DATASETS = ["CarDetectorData.yaml", "FaceExpressionData.yaml", "PlantTrainData.yaml"]
+
+# 参数名 -> (类型, 取值)；loguniform/uniform 给 (下限, 上限)，choice 给候选列表
+DEFAULT_SPACE = {
+    "lr0": ("loguniform", (1e-4, 1e-1)),
+    "batch": ("choice", [8, 16, 32]),
+    "imgsz": ("choice", [480, 640]),
+    "mosaic": ("uniform", (0.0, 1.0)),
+    "fliplr": ("uniform", (0.0, 0.5)),
+    "hsv_h": ("uniform", (0.0, 0.03)),
+    "model": ("choice", ["yolov8n.pt", "yolov8s.pt"]),
+}
+
+# 网格搜索时连续参数取的点数
+GRID_POINTS = 3
+
+
+def _round(value):
+    return float(f"{value:.4g}")
+
+
+class RandomSampler:
+    def __init__(self, space, seed=None):
+        self.space = space
+        self.rng = random.Random(seed)
+
+    def sample_param(self, kind, values):
+        if kind == "choice":
+            return self.rng.choice(values)
+        low, high = values
+        if kind == "loguniform":
+            return _round(math.exp(self.rng.uniform(math.log(low), math.log(high))))
+        return _round(self.rng.uniform(low, high))
+
+    def suggest(self, history):
+        return {name: self.sample_param(kind, values) for name, (kind, values) in self.space.items()}
+
+
+class GridSampler:
+    """按笛卡尔积依次给出配置，连续参数取 GRID_POINTS 个等分点，取完后返回 None"""
+
+    def __init__(self, space, points=GRID_POINTS):
+        axes = []
+        for name, (kind, values) in space.items():
+            if kind == "choice":
+                axes.append([(name, v) for v in values])
+                continue
+            low, high = values
+            if kind == "loguniform":
+                low, high = math.log(low), math.log(high)
+            grid = [low + (high - low) * i / (points - 1) for i in range(points)]
+            if kind == "loguniform":
+                grid = [math.exp(v) for v in grid]
+            axes.append([(name, _round(v)) for v in grid])
+        self.configs = itertools.product(*axes)
+
+    def suggest(self, history):
+        try:
+            return dict(next(self.configs))
+        except StopIteration:
+            return None
+
+
+class TPESampler:
+    """
+    Tree-structured Parzen Estimator：前 n_startup 个随机采样，之后把已完成的 trial 按得分
+    分成好（前 gamma）/差两组，各自建核密度，从好组采 n_candidates 个候选，取 l(x)/g(x) 最大的。
+    每个参数单独建模。
+    """
+
+    def __init__(self, space, n_startup=5, gamma=0.25, n_candidates=24, seed=None):
+        self.space = space
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.random = RandomSampler(space, seed)
+        self.rng = self.random.rng
+
+    def suggest(self, history):
+        done = [h for h in history if h.get("score") is not None]
+        if len(done) < self.n_startup:
+            return self.random.suggest(history)
+        # 剪枝或超预算停掉的 trial 只有前几轮的分数，排在跑完的 trial 后面，不和完整训练的分数直接比
+        done.sort(key=lambda h: (h.get("status") == "complete", h["score"]), reverse=True)
+        n_good = max(1, int(math.ceil(self.gamma * len(done))))
+        good, bad = done[:n_good], done[n_good:] or done[-1:]
+        return {name: self._suggest_param(name, kind, values, good, bad)
+                for name, (kind, values) in self.space.items()}
+
+    def _suggest_param(self, name, kind, values, good, bad):
+        if kind == "choice":
+            # 类别参数：带平滑的频率作为概率
+            def probs(group):
+                counts = [1.0 + sum(1 for h in group if h["params"].get(name) == v) for v in values]
+                total = sum(counts)
+                return [c / total for c in counts]
+            l, g = probs(good), probs(bad)
+            candidates = self.rng.choices(range(len(values)), weights=l, k=self.n_candidates)
+            best = max(candidates, key=lambda i: l[i] / g[i])
+            return values[best]
+
+        log = kind == "loguniform"
+        low, high = (math.log(values[0]), math.log(values[1])) if log else values
+
+        def points(group):
+            xs = [h["params"][name] for h in group if name in h["params"]]
+            return [math.log(x) if log else x for x in xs]
+
+        good_x, bad_x = points(good), points(bad)
+        bandwidth = max((high - low) / max(len(good_x), 1) ** 0.5 / 2, 1e-6)
+
+        def density(x, xs):
+            # 高斯核 + 一个均匀先验，防止没见过的区域密度为 0
+            prior = 1.0 / (high - low)
+            if not xs:
+                return prior
+            kernel = sum(math.exp(-0.5 * ((x - m) / bandwidth) ** 2) for m in xs)
+            kernel /= len(xs) * bandwidth * math.sqrt(2 * math.pi)
+            return (kernel * len(xs) + prior) / (len(xs) + 1)
+
+        candidates = []
+        for _ in range(self.n_candidates):
+            center = self.rng.choice(good_x) if good_x else self.rng.uniform(low, high)
+            candidates.append(min(max(self.rng.gauss(center, bandwidth), low), high))
+        best = max(candidates, key=lambda x: density(x, good_x) / density(x, bad_x))
+        return _round(math.exp(best) if log else best)
+
+
+SAMPLERS = {"random": RandomSampler, "grid": GridSampler, "tpe": TPESampler}
+
+
+class HyperSearch:
+    """
+    对一个数据集做超参数搜索：每个 trial 是一个缩短轮数的 yolo 训练子进程，
+    最多 parallel 个同时跑，共用一个 EarlyStopController 做剪枝，总 CPU 时间不超过 budget_hours。
+    """
+
+    def __init__(self, data_yaml, sampler="tpe", space=None, epochs=20, parallel=2, max_trials=20,
+                 budget_hours=4.0, metric=DEFAULT_METRIC, seed=None, poll_interval=5):
+        self.data_yaml = data_yaml
+        self.space = space or DEFAULT_SPACE
+        if sampler == "grid":
+            self.sampler = GridSampler(self.space)
+        else:
+            self.sampler = SAMPLERS[sampler](self.space, seed=seed)
+        self.epochs = epochs
+        self.parallel = max(1, parallel)
+        self.max_trials = max_trials
+        self.budget_hours = budget_hours
+        self.metric = metric
+        self.poll_interval = poll_interval
+        self.name = _dataset_name(data_yaml)
+        self.project = os.path.join(SEARCH_DIR, self.name)
+        self.threads = max(1, (os.cpu_count() or 1) // self.parallel)
+        self.controller = EarlyStopController(
+            rules=[MedianStoppingRule(grace_epochs=max(2, epochs // 4), min_trials=3),
+                   PatienceRule(patience=max(3, epochs // 3))],
+            log_path=os.path.join(self.project, "early_stop_log.csv"),
+            cpu_threads=self.threads)
+        self.history = []
+        self.running = {}  # trial 名 -> (记录, 开始时间, Trial, 日志文件)
+        self.cpu_hours = 0.0
+
+    def remaining_hours(self):
+        running = sum(time.time() - start for _, start, _, _ in self.running.values()) * self.threads / 3600.0
+        return self.budget_hours - self.cpu_hours - running
+
+    def _command(self, name, params):
+        extra = {k: v for k, v in params.items() if k not in ("model", "batch", "lr0")}
+        recommend = load_recommendation(self.data_yaml)
+        if recommend:
+            extra.setdefault("workers", recommend["workers"])
+        extra.update({"exist_ok": True, "plots": False, "patience": 0, "device": "cpu"})
+        return build_train_command(params["model"], self.data_yaml, self.epochs, params["batch"], params["lr0"],
+                                   project=self.project, name=name, **extra)
+
+    def _launch(self, index, params):
+        name = f"trial_{index:03d}"
+        run_dir = os.path.join(self.project, name)
+        os.makedirs(run_dir, exist_ok=True)
+        env = dict(os.environ, OMP_NUM_THREADS=str(self.threads), MKL_NUM_THREADS=str(self.threads))
+        log = open(os.path.join(run_dir, "train.log"), "w", encoding="utf-8")
+        process = subprocess.Popen(self._command(name, params), stdout=log, stderr=subprocess.STDOUT,
+                                   env=env, text=True)
+        trial = Trial(name, os.path.join(run_dir, "results.csv"), process=process,
+                      max_epochs=self.epochs, metric=self.metric)
+        self.controller.register(trial)
+        record = {"trial": name, "params": params, "run_dir": run_dir, "score": None, "status": "running"}
+        self.running[name] = (record, time.time(), trial, log)
+        print(f"[{self.name}] 启动 {name}: {params}")
+
+    def _finish(self, name):
+        record, start, trial, log = self.running.pop(name)
+        trial.tail.poll()
+        if trial.process.poll() is None:
+            trial.process.wait()
+        log.close()
+        hours = (time.time() - start) * self.threads / 3600.0
+        self.cpu_hours += hours
+        values = trial.values()
+        record["score"] = max(values) if values else None
+        record["epochs"] = trial.epochs
+        record["cpu_hours"] = round(hours, 4)
+        if trial.stopped:
+            record["status"] = "pruned"
+            record["reason"] = trial.stop_reason
+        else:
+            record["status"] = "complete" if trial.process.returncode == 0 else "failed"
+        self.history.append(record)
+        self._write_trial(record)
+        score = "无" if record["score"] is None else f"{record['score']:.4f}"
+        print(f"[{self.name}] {name} {record['status']}，{self.metric}={score}，"
+              f"已用 {self.cpu_hours:.2f}/{self.budget_hours} CPU 小时")
+
+    def _write_trial(self, record):
+        # 和 yolo 写的 args.yaml 放在同一个目录，MetricsStore 导入时可以对照
+        with open(os.path.join(record["run_dir"], "search.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump({"dataset": self.data_yaml, "metric": self.metric, **record}, f,
+                           allow_unicode=True, sort_keys=False)
+
+    def _trial_hours(self):
+        done = [h["cpu_hours"] for h in self.history if h.get("cpu_hours")]
+        return sum(done) / len(done) if done else 0.0
+
+    def run(self):
+        index = 0
+        while True:
+            for trial in self.controller.poll():
+                print(f"[{self.name}] 剪枝 {trial.name}：{trial.stop_reason}")
+            for name, (_, _, trial, _) in list(self.running.items()):
+                if trial.process.poll() is not None:
+                    self._finish(name)
+
+            # 预计剩余预算不够再跑一个平均 trial 就不再启动新的
+            can_start = (index < self.max_trials and self.remaining_hours() > self._trial_hours()
+                         and len(self.running) < self.parallel)
+            while can_start:
+                params = self.sampler.suggest(self.history + [r for r, *_ in self.running.values()])
+                if params is None:
+                    self.max_trials = index
+                    break
+                self._launch(index, params)
+                index += 1
+                can_start = index < self.max_trials and len(self.running) < self.parallel
+
+            if not self.running:
+                break
+            if self.remaining_hours() < 0:
+                for name, (_, _, trial, _) in list(self.running.items()):
+                    if not trial.stopped:
+                        self.controller.stop(trial, "超出 CPU 时间预算")
+            time.sleep(self.poll_interval)
+        return self.best()
+
+    def best(self):
+        # 只在跑完全部轮数的 trial 里选，被剪枝的 trial 分数只代表前几轮
+        done = [h for h in self.history if h.get("status") == "complete" and h.get("score") is not None]
+        if not done:
+            return None
+        best = max(done, key=lambda h: h["score"])
+        with open(os.path.join(self.project, "best.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump({"dataset": self.data_yaml, "metric": self.metric, "best": best,
+                            "cpu_hours": round(self.cpu_hours, 4), "trials": len(self.history)},
+                           f, allow_unicode=True, sort_keys=False)
+        return best
+
+
+def search_datasets(datasets, budget_hours, **kwargs):
+    """多个数据集平分 CPU 时间预算，前面没用完的留给后面的数据集"""
+    results = {}
+    remaining = budget_hours
+    for i, data_yaml in enumerate(datasets):
+        share = remaining / (len(datasets) - i)
+        search = HyperSearch(data_yaml, budget_hours=share, **kwargs)
+        results[data_yaml] = search.run()
+        remaining -= search.cpu_hours
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO 超参数搜索")
+    parser.add_argument("data", nargs="*", default=DATASETS, help="数据集 yaml，默认三个数据集都搜")
+    parser.add_argument("--sampler", choices=list(SAMPLERS), default="tpe")
+    parser.add_argument("--budget", type=float, default=12.0, help="总 CPU 小时预算")
+    parser.add_argument("--epochs", type=int, default=20, help="每个 trial 的缩短轮数")
+    parser.add_argument("--parallel", type=int, default=2, help="同时运行的 trial 数")
+    parser.add_argument("--trials", type=int, default=20, help="每个数据集最多 trial 数")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    results = search_datasets(args.data, args.budget, sampler=args.sampler, epochs=args.epochs,
+                              parallel=args.parallel, max_trials=args.trials, seed=args.seed)
+    failed = False
+    for data_yaml, best in results.items():
+        if best is None:
+            print(f"{data_yaml}: 没有完成的 trial")
+            failed = True
+        else:
+            print(f"{data_yaml}: {best['score']:.4f} {best['params']} ({best['run_dir']})")
+    sys.exit(1 if failed else 0)
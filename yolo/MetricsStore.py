@@ -0,0 +1,209 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import yaml
+
+STORE_PATH = os.path.join("runs", "metrics.sqlite")
+RUN_ROOTS = [os.path.join("runs", "detect"), os.path.join("runs", "train")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     TEXT PRIMARY KEY,
+    name       TEXT,
+    path       TEXT,
+    model      TEXT,
+    data       TEXT,
+    epochs     INTEGER,
+    batch      INTEGER,
+    imgsz      INTEGER,
+    lr0        REAL,
+    args_json  TEXT,
+    header     TEXT,
+    csv_offset INTEGER DEFAULT 0,
+    csv_mtime  REAL DEFAULT 0,
+    rows       INTEGER DEFAULT 0,
+    updated_at REAL
+);
+-- 按 (run, 指标, epoch) 聚簇存储，读一条曲线就是一次连续的范围扫描
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    epoch  INTEGER NOT NULL,
+    value  REAL,
+    PRIMARY KEY (run_id, name, epoch)
+) WITHOUT ROWID;
+"""
+
+
+def downsample_lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，保留曲线形状的同时把点数压到 threshold"""
+    n = len(ys)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    out_x, out_y = [xs[0]], [ys[0]]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        next_start, next_end = end, min(int((i + 2) * bucket) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / max(next_end - next_start, 1)
+        avg_y = sum(ys[next_start:next_end]) / max(next_end - next_start, 1)
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        a = best
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+class MetricsStore:
+    """把所有训练 run 的 results.csv 和 args.yaml 汇总到一个 SQLite 库，增量更新"""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # --- 导入 ---
+    def find_runs(self, roots=None):
+        for root in roots or RUN_ROOTS:
+            if not os.path.isdir(root):
+                continue
+            for folder, _, files in os.walk(root):
+                if "results.csv" in files:
+                    yield folder
+
+    def ingest_all(self, roots=None):
+        """扫描所有 run 目录，返回本次新增的指标行数"""
+        added = 0
+        with self.conn:
+            for folder in self.find_runs(roots):
+                added += self.ingest_run(folder)
+        return added
+
+    def _read_args(self, folder):
+        args_path = os.path.join(folder, "args.yaml")
+        if not os.path.exists(args_path):
+            return {}
+        try:
+            with open(args_path, "r", encoding="utf-8") as f:
+                return yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError):
+            return {}
+
+    def ingest_run(self, folder):
+        run_id = os.path.normpath(folder).replace(os.sep, "/")
+        csv_path = os.path.join(folder, "results.csv")
+        stat = os.stat(csv_path)
+        row = self.conn.execute("SELECT csv_offset, csv_mtime, header, rows FROM runs WHERE run_id = ?",
+                                (run_id,)).fetchone()
+        offset, mtime, header, rows = row if row else (0, 0, None, 0)
+        if row and stat.st_size == offset and stat.st_mtime == mtime:
+            return 0
+        if stat.st_size < offset:
+            # results.csv 被重写，整条 run 重新导入
+            self.conn.execute("DELETE FROM metrics WHERE run_id = ?", (run_id,))
+            offset, header, rows = 0, None, 0
+
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            f.seek(offset)
+            chunk = f.read()
+        end = chunk.rfind("\n")
+        complete = chunk[:end + 1] if end >= 0 else ""
+        offset += len(complete.encode("utf-8"))
+
+        columns = json.loads(header) if header else None
+        records = []
+        for values in csv.reader(complete.splitlines()):
+            if not values:
+                continue
+            if columns is None:
+                columns = [name.strip() for name in values]
+                continue
+            try:
+                numbers = [float(v) for v in values]
+            except ValueError:
+                continue
+            epoch = int(numbers[columns.index("epoch")]) if "epoch" in columns else rows + 1
+            rows += 1
+            records += [(run_id, name, epoch, value) for name, value in zip(columns, numbers)
+                        if name != "epoch"]
+        self.conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)", records)
+
+        args = self._read_args(folder)
+        self.conn.execute(
+            """INSERT INTO runs (run_id, name, path, model, data, epochs, batch, imgsz, lr0, args_json,
+                                 header, csv_offset, csv_mtime, rows, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(run_id) DO UPDATE SET
+                   model = excluded.model, data = excluded.data, epochs = excluded.epochs,
+                   batch = excluded.batch, imgsz = excluded.imgsz, lr0 = excluded.lr0,
+                   args_json = excluded.args_json, header = excluded.header, csv_offset = excluded.csv_offset,
+                   csv_mtime = excluded.csv_mtime, rows = excluded.rows, updated_at = excluded.updated_at""",
+            (run_id, os.path.basename(folder), os.path.abspath(folder), args.get("model"), args.get("data"),
+             args.get("epochs"), args.get("batch"), args.get("imgsz"), args.get("lr0"),
+             json.dumps(args, ensure_ascii=False, default=str), json.dumps(columns) if columns else None,
+             offset, stat.st_mtime, rows, time.time()))
+        return len(records)
+
+    # --- 查询 ---
+    def list_runs(self):
+        cursor = self.conn.execute(
+            "SELECT run_id, name, model, data, epochs, batch, imgsz, lr0, rows FROM runs ORDER BY run_id")
+        keys = [d[0] for d in cursor.description]
+        return [dict(zip(keys, r)) for r in cursor.fetchall()]
+
+    def run_args(self, run_id):
+        row = self.conn.execute("SELECT args_json FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def metric_names(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT name FROM metrics ORDER BY name")]
+
+    def series(self, run_id, name, max_points=None):
+        rows = self.conn.execute("SELECT epoch, value FROM metrics WHERE run_id = ? AND name = ? ORDER BY epoch",
+                                 (run_id, name)).fetchall()
+        xs = [r[0] for r in rows]
+        ys = [r[1] for r in rows]
+        if max_points:
+            return downsample_lttb(xs, ys, max_points)
+        return xs, ys
+
+    def compare(self, run_ids, name, max_points=500):
+        """返回 {run_id: (epochs, values)}，长曲线自动降采样"""
+        return {run_id: self.series(run_id, name, max_points) for run_id in run_ids}
+
+    def best(self, name, run_ids=None, mode="max"):
+        """每个 run 在某指标上的最好值，按好坏排序；run_ids 为 None 时查所有 run，空列表返回空"""
+        if run_ids is not None and not run_ids:
+            return []
+        agg = "MAX" if mode == "max" else "MIN"
+        sql = f"SELECT run_id, {agg}(value) FROM metrics WHERE name = ?"
+        params = [name]
+        if run_ids is not None:
+            sql += f" AND run_id IN ({','.join('?' * len(run_ids))})"
+            params += list(run_ids)
+        rows = self.conn.execute(sql + " GROUP BY run_id", params).fetchall()
+        return sorted(rows, key=lambda r: r[1], reverse=(mode == "max"))
+
+
+if __name__ == "__main__":
+    store = MetricsStore()
+    print(f"新增 {store.ingest_all()} 条指标记录")
+    for run in store.list_runs():
+        print(f"{run['run_id']:<30} {str(run['data']):<28} epochs={run['rows']}")
+    store.close()
@@ -1,10 +1,19 @@
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from PyQt5.QtWidgets import QSizePolicy
-import matplotlib.pyplot as plt
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+import matplotlib
+matplotlib.rcParams['font.sans-serif'] = ['SimHei']
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+SERIES_COLORS = ['blue', 'green', 'orange', 'red', 'purple', 'brown', 'cyan', 'magenta']
+
+
 class PlotCanvas(FigureCanvas):
+    """
+    训练曲线画布：每条曲线对应一个持久的 Line2D，新数据只追加到已有曲线上，
+    再用 draw_idle 合并重绘，不再每秒 clear + 全量重画。
+    """
+
     def __init__(self, parent=None):
         self.fig = Figure()
         self.ax = self.fig.add_subplot(111)
@@ -12,39 +21,124 @@ class PlotCanvas(FigureCanvas):
         self.setParent(parent)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.updateGeometry()
+        self.mode = None
+        self.axes = {}   # 分组名 -> Axes
+        self.lines = {}  # (分组名, 序列名) -> Line2D
+        self.data = {}   # (分组名, 序列名) -> 已画的数据
         self.plot_empty()
 
     def plot_empty(self):
-        self.ax.clear()
+        self._reset_axes(None, [None])
         self.ax.set_title("训练指标")
         self.ax.set_xlabel("轮数")
         self.ax.set_ylabel("Loss")
-        self.draw()
+        self.draw_idle()
+
+    def _reset_axes(self, mode, groups):
+        self.fig.clear()
+        self.axes = {}
+        self.lines = {}
+        self.data = {}
+        for i, group in enumerate(groups):
+            self.axes[group] = self.fig.add_subplot(len(groups), 1, i + 1)
+        self.ax = self.axes[groups[0]]
+        self.mode = mode
+
+    def _ensure_mode(self, mode, layout):
+        """layout: [(分组名, 标题, y 轴名), ...]；模式不变时保留已有曲线"""
+        if self.mode == mode:
+            return
+        self._reset_axes(mode, [group for group, _, _ in layout])
+        for group, title, ylabel in layout:
+            ax = self.axes[group]
+            ax.set_title(title)
+            ax.set_xlabel("Epoch")
+            ax.set_ylabel(ylabel)
+        if len(layout) > 1:
+            self.fig.tight_layout()
+
+    def _append(self, group, name, values, color=None):
+        """只把新增的点追加到曲线，返回是否有变化"""
+        key = (group, name)
+        line = self.lines.get(key)
+        if line is None:
+            ax = self.axes[group]
+            color = color or SERIES_COLORS[len([k for k in self.lines if k[0] == group]) % len(SERIES_COLORS)]
+            line, = ax.plot([], [], label=name, color=color)
+            self.lines[key] = line
+            self.data[key] = ([], [])
+            ax.legend(loc='best', fontsize='small')
+        xs, ys = self.data[key]
+        if len(values) < len(ys):
+            # 数据变少说明换了一个 results.csv，重新开始
+            del xs[:], ys[:]
+        if len(values) == len(ys):
+            return False
+        start = len(ys)
+        xs.extend(range(start, len(values)))
+        ys.extend(values[start:])
+        line.set_data(xs, ys)
+        return True
+
+    def _refresh(self, changed):
+        if not changed:
+            return
+        for ax in self.axes.values():
+            ax.relim()
+            ax.autoscale_view()
+        self.draw_idle()
 
     def update_loss_curve(self, loss_list):
-        self.ax.clear()
-        self.ax.plot(loss_list, label="训练Loss", color='blue')
-        self.ax.set_title("训练Loss曲线")
-        self.ax.set_xlabel("Epoch")
-        self.ax.set_ylabel("Loss")
-        self.ax.legend()
-        self.draw()
+        self._ensure_mode('loss', [('loss', "训练Loss曲线", "Loss")])
+        self._refresh(self._append('loss', "训练Loss", loss_list, 'blue'))
 
     def update_map_curve(self, map50_list, map5095_list):
-        self.ax.clear()
-        self.ax.plot(map50_list, label="mAP@0.5", color='green')
-        self.ax.plot(map5095_list, label="mAP@0.5:0.95", color='orange')
-        self.ax.set_title("mAP 指标曲线")
-        self.ax.set_xlabel("Epoch")
-        self.ax.set_ylabel("mAP 值")
-        self.ax.legend()
-        self.draw()
+        self._ensure_mode('map', [('map', "mAP 指标曲线", "mAP 值")])
+        changed = self._append('map', "mAP@0.5", map50_list, 'green')
+        changed = self._append('map', "mAP@0.5:0.95", map5095_list, 'orange') or changed
+        self._refresh(changed)
 
     def update_custom_curve(self, values, title, label, color):
-        self.ax.clear()
-        self.ax.plot(values, label=label, color=color)
-        self.ax.set_title(title)
-        self.ax.set_xlabel("Epoch")
-        self.ax.set_ylabel(label)
-        self.ax.legend()
-        self.draw()
\ No newline at end of file
+        self._ensure_mode(('custom', title), [('custom', title, label)])
+        self._refresh(self._append('custom', label, values, color))
+
+    def update_series(self, groups, mode='series'):
+        """
+        同时显示多组曲线，groups: {分组标题: {序列名: 数据列表}}，
+        每个分组一个子图，例如 loss 分量 / P、R、mAP / 学习率。
+        """
+        layout = [(title, title, title) for title in groups]
+        self._ensure_mode((mode, tuple(groups)), layout)
+        changed = False
+        for title, series in groups.items():
+            for name, values in series.items():
+                changed = self._append(title, name, values) or changed
+        self._refresh(changed)
+
+    def set_series(self, title, series, ylabel=None):
+        """
+        叠加对比用：series 为 {名称: (xs, ys)}，已有曲线直接 set_data，
+        不再需要的曲线删除，只有曲线集合变化时才重建图例。
+        """
+        self._ensure_mode(('overlay', title), [('overlay', title, ylabel or title)])
+        ax = self.axes['overlay']
+        names = set(series)
+        changed = False
+        for key in [k for k in self.lines if k[1] not in names]:
+            self.lines.pop(key).remove()
+            self.data.pop(key, None)
+            changed = True
+        for i, (name, (xs, ys)) in enumerate(series.items()):
+            key = ('overlay', name)
+            line = self.lines.get(key)
+            if line is None:
+                line, = ax.plot([], [], label=name, color=SERIES_COLORS[i % len(SERIES_COLORS)])
+                self.lines[key] = line
+                changed = True
+            line.set_data(xs, ys)
+        if changed:
+            if self.lines:
+                ax.legend(loc='best', fontsize='small')
+            elif ax.get_legend() is not None:
+                ax.get_legend().remove()
+        self._refresh(True)
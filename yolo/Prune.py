@@ -0,0 +1,312 @@
+import os
+import sys
+import copy
+import math
+import time
+import argparse
+import statistics
+import yaml
+
+PRUNE_DIR = os.path.join("runs", "prune")
+MIN_CHANNELS = 8
+ROUND_TO = 8  # 保留的通道数凑成 8 的倍数，CPU 上的卷积实现按 8/16 通道分块，零头反而更慢
+
+
+# --- 可剪的通道组 ---
+# 只剪输出只被一个卷积使用的"内部"通道：剪掉生产者的输出通道和 BN，同时删掉消费者对应的输入通道，
+# 模块对外的通道数不变，残差相加和 C2f 的 split/concat 都不受影响。
+class ChannelGroup:
+    def __init__(self, name, producer, consumers):
+        self.name = name
+        self.producer = producer  # ultralytics Conv（conv + bn + act）
+        self.consumers = consumers  # [(父模块, 属性名, 重复次数)]，重复次数用于 SPPF 这种把同一组通道 concat 多次的情况
+
+    @property
+    def channels(self):
+        return self.producer.conv.out_channels
+
+    def importance(self, method="bn"):
+        """每个输出通道的重要性：BN 缩放系数的绝对值，或卷积核的 L1 范数"""
+        if method == "bn":
+            return self.producer.bn.weight.detach().abs()
+        return self.producer.conv.weight.detach().abs().sum(dim=(1, 2, 3))
+
+
+def channel_groups(model):
+    from torch import nn
+    from ultralytics.nn.modules import Bottleneck, SPPF, Detect
+
+    groups = []
+    for name, m in model.named_modules():
+        if isinstance(m, Bottleneck):
+            groups.append(ChannelGroup(f"{name}.cv1", m.cv1, [(m.cv2, "conv", 1)]))
+        elif isinstance(m, SPPF):
+            groups.append(ChannelGroup(f"{name}.cv1", m.cv1, [(m.cv2, "conv", 4)]))
+        elif isinstance(m, Detect):
+            for branch in ("cv2", "cv3"):
+                for i, seq in enumerate(getattr(m, branch)):
+                    # seq = Conv, Conv, nn.Conv2d：前两层的输出都只进入下一层
+                    groups.append(ChannelGroup(f"{name}.{branch}.{i}.0", seq[0], [(seq[1], "conv", 1)]))
+                    if isinstance(seq[2], nn.Conv2d):
+                        groups.append(ChannelGroup(f"{name}.{branch}.{i}.1", seq[1], [(seq, "2", 1)]))
+    return [g for g in groups if g.producer.conv.groups == 1]
+
+
+def _slice_conv(conv, out_idx=None, in_idx=None):
+    from torch import nn
+    weight = conv.weight.detach()
+    if out_idx is not None:
+        weight = weight[out_idx]
+    if in_idx is not None:
+        weight = weight[:, in_idx]
+    new = nn.Conv2d(weight.shape[1], weight.shape[0], conv.kernel_size, conv.stride, conv.padding,
+                    conv.dilation, 1, conv.bias is not None).to(weight.device)
+    new.weight.data.copy_(weight)
+    if conv.bias is not None:
+        bias = conv.bias.detach()
+        new.bias.data.copy_(bias[out_idx] if out_idx is not None else bias)
+    return new
+
+
+def _slice_bn(bn, idx):
+    from torch import nn
+    new = nn.BatchNorm2d(len(idx), bn.eps, bn.momentum).to(bn.weight.device)
+    new.weight.data.copy_(bn.weight.detach()[idx])
+    new.bias.data.copy_(bn.bias.detach()[idx])
+    new.running_mean.copy_(bn.running_mean[idx])
+    new.running_var.copy_(bn.running_var[idx])
+    return new
+
+
+def prune_group(group, keep):
+    """物理删除 group 里不在 keep 中的通道"""
+    import torch
+    keep = torch.as_tensor(sorted(keep), dtype=torch.long, device=group.producer.conv.weight.device)
+    c = group.channels
+    group.producer.conv = _slice_conv(group.producer.conv, out_idx=keep)
+    group.producer.bn = _slice_bn(group.producer.bn, keep)
+    for owner, attr, repeats in group.consumers:
+        in_idx = torch.cat([keep + k * c for k in range(repeats)])
+        setattr(owner, attr, _slice_conv(getattr(owner, attr), in_idx=in_idx))
+
+
+def plan_pruning(groups, ratio, method="bn"):
+    """
+    全局排序：每组的重要性除以组内均值后放在一起比较，删掉最低的 ratio 比例通道；
+    每组至少留 MIN_CHANNELS 个，保留数向上凑成 ROUND_TO 的倍数。返回 {组序号: 保留的通道下标}。
+    """
+    import torch
+    scores = [g.importance(method) for g in groups]
+    normalized = torch.cat([s / (s.mean() + 1e-12) for s in scores])
+    owners = torch.cat([torch.full((len(s),), i, dtype=torch.long) for i, s in enumerate(scores)])
+    remove = int(len(normalized) * ratio)
+    if remove == 0:
+        return {}
+    order = torch.argsort(normalized.cpu())[:remove]
+    counts = torch.bincount(owners[order], minlength=len(groups)).tolist()
+
+    plan = {}
+    for i, (group, score) in enumerate(zip(groups, scores)):
+        c = group.channels
+        keep_n = max(c - counts[i], MIN_CHANNELS)
+        keep_n = min(c, int(math.ceil(keep_n / ROUND_TO) * ROUND_TO))
+        if keep_n < c:
+            plan[i] = torch.argsort(score, descending=True)[:keep_n].tolist()
+    return plan
+
+
+def prune_model(model, ratio, method="bn"):
+    """在 model 上原地剪枝，返回 {组名: (原通道数, 保留通道数)}"""
+    groups = channel_groups(model)
+    changes = {}
+    for i, keep in plan_pruning(groups, ratio, method).items():
+        changes[groups[i].name] = (groups[i].channels, len(keep))
+        prune_group(groups[i], keep)
+    return changes
+
+
+# --- 代价 ---
+def count_gflops(model, imgsz=640):
+    """用前向钩子统计所有卷积的乘加次数，不依赖 thop"""
+    import torch
+    from torch import nn
+    macs = [0]
+
+    def hook(module, inputs, output):
+        kh, kw = module.kernel_size
+        macs[0] += output.numel() // output.shape[0] * (module.in_channels // module.groups) * kh * kw
+
+    model = copy.deepcopy(model).float().eval()
+    p = next(model.parameters())
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, nn.Conv2d)]
+    with torch.no_grad():
+        model(torch.zeros(1, 3, imgsz, imgsz, device=p.device))
+    for h in handles:
+        h.remove()
+    return 2 * macs[0] / 1e9
+
+
+def measure_latency(model, imgsz=640, runs=30, warmup=5):
+    """CPU 上单张推理耗时的中位数（毫秒），按部署时的样子先融合 conv+bn"""
+    import torch
+    model = copy.deepcopy(model).float().cpu().eval()
+    if hasattr(model, "fuse"):
+        model = model.fuse(verbose=False)
+    x = torch.zeros(1, 3, imgsz, imgsz)
+    times = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def count_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+# --- 剪枝 + 微调迭代 ---
+class PruneSession:
+    """
+    按 step 的比例逐轮剪枝，每轮剪完在原数据集上微调 epochs 轮，
+    直到 GFLOPs（或 CPU 延迟）降到目标比例，或 mAP50-95 比原模型掉得超过 map_budget。
+    超出预算的那一轮丢弃，结果用上一轮的模型。
+    """
+
+    def __init__(self, weights, data=None, target_flops=0.5, target_latency=None, map_budget=0.02, step=0.2,
+                 epochs=10, max_rounds=8, method="bn", imgsz=640, batch=16, name=None, **train_args):
+        from ultralytics.nn.tasks import attempt_load_one_weight
+        self.weights = weights
+        self.model, ckpt = attempt_load_one_weight(weights)
+        self.data = data or (ckpt.get("train_args") or {}).get("data")
+        if not self.data:
+            raise ValueError("模型里没有记录训练用的数据集，请指定 --data")
+        self.target_flops = target_flops
+        self.target_latency = target_latency
+        self.map_budget = map_budget
+        self.step = step
+        self.epochs = epochs
+        self.max_rounds = max_rounds
+        self.method = method
+        self.imgsz = imgsz
+        self.batch = batch
+        self.train_args = train_args
+        self.name = name or os.path.splitext(os.path.basename(weights))[0].replace(" ", "_")
+        self.project = os.path.join(PRUNE_DIR, self.name)
+        self.rounds = []
+
+    def evaluate(self, model, weights_map=None):
+        row = {"gflops": round(count_gflops(model, self.imgsz), 3),
+               "latency_ms": round(measure_latency(model, self.imgsz), 2),
+               "params": count_params(model)}
+        if weights_map is not None:
+            row["mAP50-95"] = round(float(weights_map), 4)
+        return row
+
+    def baseline_map(self):
+        from ultralytics import YOLO
+        metrics = YOLO(self.weights).val(data=self.data, imgsz=self.imgsz, batch=self.batch, plots=False,
+                                         project=self.project, name="baseline", exist_ok=True, verbose=False)
+        return metrics.box.map
+
+    def fine_tune(self, model, index):
+        from ultralytics.models.yolo.detect import DetectionTrainer
+        from ultralytics.nn.tasks import attempt_load_one_weight
+        overrides = dict(model=self.weights, data=self.data, epochs=self.epochs, imgsz=self.imgsz,
+                         batch=self.batch, project=self.project, name=f"round{index}", exist_ok=True,
+                         pretrained=False, warmup_epochs=0, **self.train_args)
+        trainer = DetectionTrainer(overrides=overrides)
+        # 直接把剪好的模块交给训练器：按 yaml 重建会变回原来的通道数
+        trainer.model = model
+        trainer.train()
+        best, _ = attempt_load_one_weight(str(trainer.best))
+        return best, trainer.metrics.get("metrics/mAP50-95(B)", 0.0), str(trainer.save_dir)
+
+    def reached_target(self, row, base):
+        if row["gflops"] <= base["gflops"] * (1 - self.target_flops):
+            return True
+        return bool(self.target_latency) and row["latency_ms"] <= base["latency_ms"] * (1 - self.target_latency)
+
+    def run(self):
+        base = self.evaluate(self.model, self.baseline_map())
+        base.update(round=0, run_dir=None)
+        self.rounds.append(base)
+        print(f"原模型: {base['gflops']} GFLOPs, {base['latency_ms']} ms, mAP50-95 {base['mAP50-95']}")
+
+        current, best_row = self.model, base
+        for index in range(1, self.max_rounds + 1):
+            candidate = copy.deepcopy(current)
+            changes = prune_model(candidate, self.step, self.method)
+            if not changes:
+                print("没有可以再剪的通道")
+                break
+            pruned = self.evaluate(candidate)
+            print(f"第 {index} 轮剪了 {len(changes)} 组通道: {pruned['gflops']} GFLOPs, {pruned['latency_ms']} ms")
+            tuned, map_value, run_dir = self.fine_tune(candidate, index)
+            row = self.evaluate(tuned, map_value)
+            row.update(round=index, run_dir=run_dir, drop=round(base["mAP50-95"] - row["mAP50-95"], 4))
+            self.rounds.append(row)
+            print(f"第 {index} 轮微调后 mAP50-95 {row['mAP50-95']}（下降 {row['drop']}）")
+            if row["drop"] > self.map_budget:
+                print(f"mAP 下降超过预算 {self.map_budget}，保留第 {best_row['round']} 轮的模型")
+                break
+            current, best_row = tuned, row
+            if self.reached_target(row, base):
+                print("已达到目标")
+                break
+        self.write_report(base, best_row)
+        return best_row
+
+    def write_report(self, base, best_row):
+        os.makedirs(self.project, exist_ok=True)
+        report = {
+            "weights": self.weights,
+            "data": self.data,
+            "method": self.method,
+            "target_flops": self.target_flops,
+            "target_latency": self.target_latency,
+            "map_budget": self.map_budget,
+            "result": best_row,
+            "flops_reduction": round(1 - best_row["gflops"] / base["gflops"], 3),
+            "speedup": round(base["latency_ms"] / max(best_row["latency_ms"], 1e-6), 2),
+            "rounds": self.rounds,
+        }
+        with open(os.path.join(self.project, "prune_report.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(report, f, allow_unicode=True, sort_keys=False)
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="结构化通道剪枝 + 微调")
+    parser.add_argument("weights", help="训练好的模型，例如 \"Assets/Model/car detector.pt\"")
+    parser.add_argument("--data", help="微调用的数据集 yaml，默认用模型训练时的数据集")
+    parser.add_argument("--target-flops", type=float, default=0.5, help="GFLOPs 要减少的比例")
+    parser.add_argument("--target-latency", type=float, help="CPU 延迟要减少的比例，和 GFLOPs 目标任一达到即停")
+    parser.add_argument("--map-budget", type=float, default=0.02, help="mAP50-95 最多允许下降多少")
+    parser.add_argument("--step", type=float, default=0.2, help="每轮剪掉可剪通道的比例")
+    parser.add_argument("--epochs", type=int, default=10, help="每轮微调轮数")
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--method", choices=["bn", "l1"], default="bn")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--store", action="store_true", help="把结果存进产物库，之后可以用 ArtifactStore promote 发布")
+    args = parser.parse_args()
+
+    session = PruneSession(args.weights, args.data, args.target_flops, args.target_latency, args.map_budget,
+                           args.step, args.epochs, args.rounds, args.method, args.imgsz, args.batch)
+    result = session.run()
+    if result["run_dir"] is None:
+        print("没有得到满足 mAP 预算的剪枝模型")
+        sys.exit(1)
+    print(f"结果: {result['run_dir']}，GFLOPs {result['gflops']}，延迟 {result['latency_ms']} ms，"
+          f"mAP50-95 {result['mAP50-95']}")
+    if args.store:
+        from ArtifactStore import ArtifactStore
+        store = ArtifactStore()
+        try:
+            name, version = store.save_run(result["run_dir"], name=f"{session.name}-pruned")
+            print(f"已保存为 {name} v{version}")
+        finally:
+            store.close()
@@ -0,0 +1,325 @@
+import os
+import sys
+import csv
+import glob
+import time
+import shutil
+import argparse
+import multiprocessing
+import numpy as np
+import yaml
+from Coreset import IMAGE_EXTS, label_path, load_data_yaml
+
+PSEUDO_DIR = os.path.join("runs", "pseudo")
+RESULTS_FILE = "pseudo_results.csv"
+QUEUE_FILE = "review_queue.csv"
+FIELDS = ["image", "label", "boxes", "uncertainty", "near_miss", "disagree", "min_score", "reason"]
+DEFAULT_CONF = 0.5
+MARGIN = 0.15  # 分数离阈值多近算"拿不准"，阈值以下这么多的框记为漏检嫌疑
+FUSE_IOU = 0.55  # 集成时不同模型的框重叠到多少算同一个目标
+
+_state = {}  # 进程池里每个进程各自的模型和参数
+
+
+# --- 阈值和类别 ---
+def parse_thresholds(items, default=DEFAULT_CONF):
+    """
+    每类置信度阈值：items 里是 "类别名=阈值"，或者一个 {类别名: 阈值} 的 yaml 文件。
+    返回 (默认阈值, {类别名: 阈值})。
+    """
+    thresholds = {}
+    for item in items or []:
+        if item.endswith((".yaml", ".yml")):
+            with open(item, "r", encoding="utf-8") as f:
+                thresholds.update({str(k): float(v) for k, v in (yaml.safe_load(f) or {}).items()})
+        else:
+            name, _, value = item.rpartition("=")
+            thresholds[name] = float(value)
+    return default, thresholds
+
+
+def class_names(models, data=None):
+    """输出数据集的类别表：给了 data yaml 时按它的 names，否则用第一个模型的类别"""
+    if data:
+        names = load_data_yaml(data)["names"]
+        return list(names.values()) if isinstance(names, dict) else list(names)
+    from ultralytics import YOLO
+    names = YOLO(models[0]).names
+    return [names[i] for i in sorted(names)]
+
+
+def find_images(folder):
+    return sorted(p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+                  if p.lower().endswith(IMAGE_EXTS) and f"{os.sep}labels{os.sep}" not in p)
+
+
+# --- 集成和不确定度 ---
+def box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def fuse(boxes, scores, classes, model_ids, voters, iou=FUSE_IOU):
+    """
+    同类的框按分数从高到低聚类（和簇里最高分的框 IoU >= iou 归为一簇），坐标按分数加权平均。
+    voters 是每个类别有几个模型能预测（集成里各模型的类别可以不同），也可以是一个整数表示所有类别都一样。
+    融合分数是各模型分数之和除以这个类别的 voters，只有部分模型看到的目标分数会被拉低；
+    agreement 是簇里不同模型数 / 这个类别的 voters。只有一个模型能预测的类别原样返回。
+    """
+    if len(boxes) == 0:
+        return boxes, scores, classes, np.ones(0, dtype=np.float32)
+    out_boxes, out_scores, out_classes, agreement = [], [], [], []
+    for c in np.unique(classes):
+        idx = np.where(classes == c)[0]
+        n = max(1, int(voters[c] if np.ndim(voters) else voters))
+        if n == 1:
+            out_boxes.extend(boxes[idx])
+            out_scores.extend(scores[idx])
+            out_classes.extend([c] * len(idx))
+            agreement.extend([1.0] * len(idx))
+            continue
+        idx = idx[np.argsort(-scores[idx])]
+        used = np.zeros(len(idx), dtype=bool)
+        for k in range(len(idx)):
+            if used[k]:
+                continue
+            members = np.where(~used & (box_iou(boxes[idx[k]], boxes[idx]) >= iou))[0]
+            # 每个模型在一簇里只算分数最高的一个框
+            picked, seen = [], set()
+            for m in members:
+                if model_ids[idx[m]] not in seen:
+                    seen.add(model_ids[idx[m]])
+                    picked.append(idx[m])
+            used[members] = True
+            w = scores[picked]
+            out_boxes.append((boxes[picked] * w[:, None]).sum(axis=0) / w.sum())
+            out_scores.append(w.sum() / n)
+            out_classes.append(c)
+            agreement.append(len(seen) / n)
+    return (np.array(out_boxes, dtype=np.float32).reshape(-1, 4), np.array(out_scores, dtype=np.float32),
+            np.array(out_classes, dtype=np.int64), np.array(agreement, dtype=np.float32))
+
+
+def uncertainty(scores, thresholds, agreement, keep):
+    """
+    每个框的不确定度取两者较大值：分数离本类阈值越近越接近 1（离开 MARGIN 以外为 0），
+    以及保留下来的框在集成里没看到它的模型比例。返回每个框的值，图片的不确定度取其中最大的。
+    """
+    closeness = np.clip(1.0 - np.abs(scores - thresholds) / MARGIN, 0.0, 1.0)
+    return np.maximum(closeness, np.where(keep, 1.0 - agreement, 0.0))
+
+
+# --- 进程池 ---
+def _init_worker(models, names, thresholds, imgsz, iou, threads, out_dir, folder):
+    import torch
+    from ultralytics import YOLO
+    torch.set_num_threads(threads)
+    default, per_class = thresholds
+    loaded = []
+    for path in models:
+        model = YOLO(path)
+        # 模型类别按名字映射到输出数据集的类别号，数据集里没有的类别丢掉
+        mapping = {i: names.index(n) for i, n in model.names.items() if n in names}
+        loaded.append((model, mapping))
+    voters = np.zeros(len(names), dtype=np.int64)  # 每个类别有几个模型能预测
+    for _, mapping in loaded:
+        voters[sorted(set(mapping.values()))] += 1
+    _state.update(models=loaded, names=names, imgsz=imgsz, iou=iou, out_dir=out_dir, folder=folder, voters=voters,
+                  thresholds=np.array([per_class.get(n, default) for n in names], dtype=np.float32))
+    # 推理阈值放低到最低阈值减 MARGIN，阈值下面的框用来判断漏检嫌疑
+    _state["low_conf"] = max(0.01, float(_state["thresholds"].min()) - MARGIN)
+
+
+def _decode(path):
+    import cv2
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)  # 兼容中文路径
+
+
+def _output_paths(image):
+    rel = os.path.relpath(image, _state["folder"])
+    out_image = os.path.join(_state["out_dir"], "train", "images", rel)
+    return out_image, label_path(out_image)
+
+
+def _link(src, dst):
+    if os.path.exists(dst):
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)  # 同一个盘上硬链接，不占空间
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _label_batch(paths):
+    """一个进程处理一批图片：批量推理、融合、按阈值写标注，返回每张图一行统计"""
+    frames, kept = [], []
+    for path in paths:
+        frame = _decode(path)
+        if frame is not None:
+            frames.append(frame)
+            kept.append(path)
+    if not frames:
+        return []
+    per_model = [model.predict(frames, conf=_state["low_conf"], iou=_state["iou"], imgsz=_state["imgsz"],
+                               verbose=False) for model, _ in _state["models"]]
+    thresholds = _state["thresholds"]
+    rows = []
+    for i, path in enumerate(kept):
+        boxes, scores, classes, model_ids = [], [], [], []
+        for m, (results, (_, mapping)) in enumerate(zip(per_model, _state["models"])):
+            r = results[i].boxes
+            for box, score, cls in zip(r.xyxyn.cpu().numpy(), r.conf.cpu().numpy(), r.cls.cpu().numpy().astype(int)):
+                if cls in mapping:
+                    boxes.append(box)
+                    scores.append(score)
+                    classes.append(mapping[cls])
+                    model_ids.append(m)
+        boxes, scores, classes, agreement = fuse(np.array(boxes, dtype=np.float32).reshape(-1, 4),
+                                                 np.array(scores, dtype=np.float32),
+                                                 np.array(classes, dtype=np.int64), np.array(model_ids), _state["voters"])
+        thr = thresholds[classes] if len(classes) else np.zeros(0, dtype=np.float32)
+        keep = scores >= thr
+        near_miss = int(((scores < thr) & (scores >= thr - MARGIN)).sum())
+        box_u = uncertainty(scores, thr, agreement, keep)
+
+        out_image, out_label = _output_paths(path)
+        _link(path, out_image)
+        os.makedirs(os.path.dirname(out_label), exist_ok=True)
+        with open(out_label, "w", encoding="utf-8") as f:
+            for (x1, y1, x2, y2), c in zip(boxes[keep], classes[keep]):
+                f.write(f"{c} {(x1 + x2) / 2:.6f} {(y1 + y2) / 2:.6f} {x2 - x1:.6f} {y2 - y1:.6f}\n")
+
+        reasons = []
+        if near_miss:
+            reasons.append(f"阈值附近漏掉 {near_miss} 个")
+        disagree = int((agreement[keep] < 1.0).sum())
+        if disagree:
+            reasons.append(f"{disagree} 个框模型意见不一")
+        if not keep.any():
+            reasons.append("无检测")
+        rows.append({
+            "image": path,
+            "label": out_label,
+            "boxes": int(keep.sum()),
+            "uncertainty": round(float(box_u.max()) if len(box_u) else 0.0, 4),
+            "near_miss": near_miss,
+            "disagree": disagree,
+            "min_score": round(float(scores[keep].min()), 4) if keep.any() else "",
+            "reason": "；".join(reasons),
+        })
+    return rows
+
+
+# --- 主流程 ---
+def done_images(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return {row["image"] for row in csv.DictReader(f)}
+
+
+def write_dataset_yaml(out_dir, names, data=None):
+    """输出目录本身就是一个 train/images、train/labels 结构的数据集；给了原数据集时沿用它的验证集"""
+    config = {"path": os.path.abspath(out_dir), "train": "train/images", "val": "train/images",
+              "nc": len(names), "names": names}
+    if data:
+        source = load_data_yaml(data)
+        val = source.get("val")
+        if val:
+            val = val if isinstance(val, list) else [val]
+            config["val"] = [v if os.path.isabs(v) else os.path.join(source["path"], v) for v in val]
+    path = os.path.join(out_dir, "data.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+def write_review_queue(out_dir):
+    """按不确定度从高到低排出人工复核的顺序"""
+    with open(os.path.join(out_dir, RESULTS_FILE), "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    rows.sort(key=lambda r: (-float(r["uncertainty"]), -int(r["near_miss"]), r["image"]))
+    path = os.path.join(out_dir, QUEUE_FILE)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:  # 带 BOM，Excel 直接打开不乱码
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path, rows
+
+
+def pseudo_label(folder, models, out_dir=None, data=None, thresholds=(DEFAULT_CONF, {}), imgsz=640, iou=0.7,
+                 workers=None, batch=8, overwrite=False):
+    """
+    用一个或多个模型给 folder 下的图片打伪标注，写到 out_dir/train/images|labels，
+    同时生成 data.yaml 和 review_queue.csv。已经处理过的图片（pseudo_results.csv 里有）会跳过。
+    workers 个进程各加载一份模型，每个进程的线程数为核数 / workers。
+    """
+    out_dir = out_dir or os.path.join(PSEUDO_DIR, os.path.basename(os.path.normpath(folder)))
+    os.makedirs(out_dir, exist_ok=True)
+    names = class_names(models, data)
+    results_path = os.path.join(out_dir, RESULTS_FILE)
+    if overwrite and os.path.exists(results_path):
+        os.remove(results_path)
+    done = done_images(results_path)
+    images = [p for p in find_images(folder) if p not in done]
+    print(f"{len(images)} 张待标注（已完成 {len(done)} 张），模型 {len(models)} 个，类别 {len(names)} 个")
+
+    if images:
+        workers = workers or max(1, min(4, (os.cpu_count() or 1) // 2))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        chunks = [images[i:i + batch] for i in range(0, len(images), batch)]
+        new = not os.path.exists(results_path)
+        start = time.time()
+        count = 0
+        with open(results_path, "a", encoding="utf-8", newline="") as f, \
+                multiprocessing.Pool(workers, _init_worker, (models, names, thresholds, imgsz, iou, threads,
+                                                             out_dir, folder)) as pool:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            if new:
+                writer.writeheader()
+            for rows in pool.imap_unordered(_label_batch, chunks):
+                writer.writerows(rows)
+                f.flush()  # 中途中断后按已写入的结果续跑
+                count += len(rows)
+                elapsed = time.time() - start
+                print(f"\r{count}/{len(images)}  {count / max(elapsed, 1e-6) * 3600:.0f} 张/小时", end="", flush=True)
+        print()
+
+    yaml_path = write_dataset_yaml(out_dir, names, data)
+    queue_path, rows = write_review_queue(out_dir) if os.path.exists(results_path) else (None, [])
+    return yaml_path, queue_path, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用已训练的模型（或多个模型集成）给未标注图片生成 YOLO 格式的伪标注")
+    parser.add_argument("folder", help="未标注图片所在目录（包含子目录）")
+    parser.add_argument("--model", nargs="+", required=True, help="一个或多个模型，多个时做集成")
+    parser.add_argument("--data", help="目标数据集 yaml：按它的类别编号，并沿用它的验证集")
+    parser.add_argument("--out", help="输出目录，默认 runs/pseudo/<目录名>")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF, help="默认置信度阈值")
+    parser.add_argument("--class-conf", nargs="*", help="每类阈值，例如 Ambulance=0.6 Car=0.4，或一个 yaml 文件")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS 的 IoU 阈值")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--workers", type=int, help="推理进程数，默认 min(4, 核数/2)")
+    parser.add_argument("--batch", type=int, default=8, help="每个进程每次推理的图片数")
+    parser.add_argument("--overwrite", action="store_true", help="忽略之前的结果全部重新标注")
+    parser.add_argument("--top", type=int, default=10, help="打印复核队列的前几项")
+    args = parser.parse_args()
+
+    yaml_path, queue_path, rows = pseudo_label(args.folder, args.model, args.out, args.data,
+                                               parse_thresholds(args.class_conf, args.conf), args.imgsz, args.iou,
+                                               args.workers, args.batch, args.overwrite)
+    print(f"数据集：{yaml_path}")
+    if queue_path:
+        boxes = sum(int(r["boxes"]) for r in rows)
+        print(f"共 {len(rows)} 张、{boxes} 个框，复核队列：{queue_path}")
+        for r in rows[:args.top]:
+            print(f"  {float(r['uncertainty']):.2f}  {r['image']}  {r['reason']}")
+    sys.exit(0)
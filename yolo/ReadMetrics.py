@@ -1,3 +1,4 @@
+import os
 import csv
 
 def read_metrics_from_results_csv(csv_path, extended=False):
@@ -33,3 +34,70 @@ def read_metrics_from_results_csv(csv_path, extended=False):
         return loss_list, map50_list, map5095_list, precision_list, recall_list
     else:
         return loss_list, map50_list, map5095_list
+
+
+class ResultsCsvTail:
+    """增量读取 ultralytics 的 results.csv：只解析新追加的行，按列累积"""
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.header = None
+        self.columns = {}
+        self.rows = 0
+
+    def poll(self):
+        """读取新行，返回本次新增的行数"""
+        try:
+            size = os.path.getsize(self.csv_path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            # 文件被重写了，从头再读
+            self.reset()
+        if size == self.offset:
+            return 0
+
+        with open(self.csv_path, 'r', encoding='utf-8', newline='') as f:
+            f.seek(self.offset)
+            chunk = f.read()
+        # 只处理完整的行，最后半行留到下次
+        end = chunk.rfind('\n')
+        if end < 0:
+            return 0
+        self.offset += len(chunk[:end + 1].encode('utf-8'))
+
+        added = 0
+        for row in csv.reader(chunk[:end + 1].splitlines()):
+            if not row:
+                continue
+            if self.header is None:
+                # 老版本 ultralytics 的列名两边带空格
+                self.header = [name.strip() for name in row]
+                self.columns = {name: [] for name in self.header}
+                continue
+            try:
+                values = [float(v) for v in row]
+            except ValueError:
+                continue
+            for name, value in zip(self.header, values):
+                self.columns[name].append(value)
+            added += 1
+        self.rows += added
+        return added
+
+    def get(self, *names):
+        """按候选列名取第一列存在的数据"""
+        for name in names:
+            if name in self.columns:
+                return self.columns[name]
+        return []
+
+    def total_loss(self, prefix='train/'):
+        loss_columns = [v for k, v in self.columns.items() if k.startswith(prefix) and k.endswith('_loss')]
+        if not loss_columns:
+            return self.get('loss')
+        return [sum(values) for values in zip(*loss_columns)]
@@ -0,0 +1,104 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+from MetricsStore import MetricsStore
+from PlotCanvas import PlotCanvas
+
+DEFAULT_METRIC = "metrics/mAP50-95(B)"
+
+
+class RunCompareWindow(QtWidgets.QMainWindow):
+    """多次训练对比：左侧勾选 run，右侧叠加显示同一指标"""
+
+    def __init__(self, store_path=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("多实验对比")
+        self.resize(1100, 650)
+        self.store = MetricsStore(store_path) if store_path else MetricsStore()
+
+        central = QtWidgets.QWidget(self)
+        layout = QtWidgets.QHBoxLayout(central)
+
+        left = QtWidgets.QVBoxLayout()
+        self.filterEdit = QtWidgets.QLineEdit()
+        self.filterEdit.setPlaceholderText("按名称 / 数据集过滤")
+        self.runList = QtWidgets.QListWidget()
+        self.runList.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.metricCombo = QtWidgets.QComboBox()
+        self.pointsSpin = QtWidgets.QSpinBox()
+        self.pointsSpin.setRange(50, 5000)
+        self.pointsSpin.setValue(500)
+        self.pointsSpin.setPrefix("最多点数: ")
+        self.refreshBtn = QtWidgets.QPushButton("扫描 runs 目录")
+        self.bestLabel = QtWidgets.QLabel()
+        self.bestLabel.setWordWrap(True)
+        left.addWidget(self.filterEdit)
+        left.addWidget(self.runList, 1)
+        left.addWidget(self.metricCombo)
+        left.addWidget(self.pointsSpin)
+        left.addWidget(self.refreshBtn)
+        left.addWidget(self.bestLabel)
+
+        self.plot_canvas = PlotCanvas(central)
+        layout.addLayout(left, 1)
+        layout.addWidget(self.plot_canvas, 3)
+        self.setCentralWidget(central)
+
+        self.refreshBtn.clicked.connect(self.refresh)
+        self.filterEdit.textChanged.connect(self.apply_filter)
+        self.runList.itemSelectionChanged.connect(self.update_plot)
+        self.metricCombo.currentTextChanged.connect(self.update_plot)
+        self.pointsSpin.valueChanged.connect(self.update_plot)
+
+        self.refresh()
+
+    def refresh(self):
+        added = self.store.ingest_all()
+        selected = set(self.selected_runs())
+        self.runList.blockSignals(True)
+        self.runList.clear()
+        for run in self.store.list_runs():
+            text = f"{run['run_id']}  [{run['data']}, {run['model']}, {run['rows']} epochs]"
+            item = QtWidgets.QListWidgetItem(text)
+            item.setData(Qt.UserRole, run['run_id'])
+            self.runList.addItem(item)
+            item.setSelected(run['run_id'] in selected)
+        self.runList.blockSignals(False)
+
+        current = self.metricCombo.currentText() or DEFAULT_METRIC
+        self.metricCombo.blockSignals(True)
+        self.metricCombo.clear()
+        self.metricCombo.addItems(self.store.metric_names())
+        self.metricCombo.setCurrentText(current)
+        self.metricCombo.blockSignals(False)
+
+        self.apply_filter(self.filterEdit.text())
+        self.statusBar().showMessage(f"新增 {added} 条指标记录，共 {self.runList.count()} 个 run")
+        self.update_plot()
+
+    def apply_filter(self, text):
+        text = text.strip().lower()
+        for i in range(self.runList.count()):
+            item = self.runList.item(i)
+            item.setHidden(bool(text) and text not in item.text().lower())
+
+    def selected_runs(self):
+        return [item.data(Qt.UserRole) for item in self.runList.selectedItems()]
+
+    def update_plot(self):
+        metric = self.metricCombo.currentText()
+        runs = self.selected_runs()
+        if not metric:
+            return
+        series = self.store.compare(runs, metric, self.pointsSpin.value())
+        self.plot_canvas.set_series(metric, series)
+        best = self.store.best(metric, runs, mode="min" if "loss" in metric else "max")
+        self.bestLabel.setText("\n".join(f"{run_id}: {value:.4f}" for run_id, value in best[:5]))
+
+    def closeEvent(self, event):
+        # 窗口由训练界面复用，关闭只是隐藏，数据库连接留到 shutdown 再关
+        self.hide()
+        event.ignore()
+
+    def shutdown(self):
+        self.store.close()
+        self.deleteLater()
@@ -0,0 +1,77 @@
+import sys
+
+
+def build_train_command(model, data, epochs, batch, lr0, project="runs/train", name="exp", **overrides):
+    """
+    拼出 yolo 训练命令行；overrides 里的其它参数（imgsz、mosaic、workers 等）原样追加为 key=value。
+    指定了 workers 时改用 python -m TrainCommand：yolo 命令在 CPU 上会把 workers 改回 0。
+    """
+    head = ["yolo", "task=detect", "mode=train"]
+    if overrides.get("workers") is not None:
+        head = [sys.executable, "-m", "TrainCommand"]
+    cmd = head + [
+        f"model={model}",
+        f"data={data}",
+        f"epochs={epochs}",
+        f"batch={batch}",
+        f"lr0={lr0}",
+        f"project={project}",
+        f"name={name}",
+    ]
+    for key, value in overrides.items():
+        if value is not None:
+            cmd.append(f"{key}={value}")
+    return cmd
+
+
+def build_distill_command(teacher, student, data, epochs, batch, lr0, project="runs/train", name="exp",
+                          width=None, **overrides):
+    """拼出蒸馏训练命令行；width 不为空时按 yolov8n 结构生成更窄的学生，student 被忽略"""
+    cmd = [
+        sys.executable, "-m", "Distill",
+        "--teacher", teacher,
+        "--student", student,
+        "--data", data,
+        "--epochs", str(epochs),
+        "--batch", str(batch),
+        "--lr0", str(lr0),
+        "--project", project,
+        "--name", name,
+    ]
+    if width:
+        cmd += ["--width", str(width)]
+    for key, value in overrides.items():
+        if value is not None:
+            cmd.append(f"{key}={value}")
+    return cmd
+
+
+def build_dist_command(model, data, epochs, batch, lr0, nproc, project="runs/train", name="exp", **overrides):
+    """拼出本机多进程 CPU 数据并行训练的命令行；batch 是所有 rank 合计的批大小"""
+    cmd = [
+        sys.executable, "-m", "DistTrain", "train",
+        "--nproc", str(nproc),
+        f"model={model}",
+        f"data={data}",
+        f"epochs={epochs}",
+        f"batch={batch}",
+        f"lr0={lr0}",
+        f"project={project}",
+        f"name={name}",
+    ]
+    for key, value in overrides.items():
+        if value is not None:
+            cmd.append(f"{key}={value}")
+    return cmd
+
+
+if __name__ == "__main__":
+    # 和 yolo 命令一样接受 key=value，只是训练时保留指定的 workers
+    from ultralytics import YOLO
+    from Distill import _parse_overrides
+    from TrainProfiler import keep_workers
+    overrides = _parse_overrides(sys.argv[1:])
+    model = YOLO(overrides.pop("model"))
+    if overrides.get("workers") is not None:
+        keep_workers(model, overrides["workers"])
+    model.train(**overrides)
@@ -3,31 +3,48 @@ import os
 import time
 import subprocess
 import threading
-import matplotlib.pyplot as plt
-from ReadLoss import read_loss_from_results_csv
-from ReadMetrics import read_metrics_from_results_csv
-from PyQt5 import QtWidgets, uic
-from PyQt5.QtWidgets import QFileDialog, QMessageBox, QPushButton
+import matplotlib
+from ReadMetrics import ResultsCsvTail
+from PyQt5 import QtWidgets
+from PyQt5.QtWidgets import QFileDialog, QMessageBox, QPushButton, QInputDialog
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import QTimer, Qt
 from PlotCanvas import PlotCanvas
-
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+from TrainProfiler import load_recommendation, _dataset_name
+from TrainCommand import build_train_command, build_distill_command, build_dist_command
+try:
+    from UiCache import load_ui
+except ImportError:  # UiCache 在 updated files 里，从 yolo/ 直接启动训练界面时退回 uic.loadUi
+    from PyQt5.uic import loadUi as load_ui
+from EarlyStopController import EarlyStopController, PatienceRule, Trial
+from ArtifactStore import ArtifactStore
+from Distill import teacher_models
+
+# 只设置 rcParams，不需要导入 pyplot
+matplotlib.rcParams['font.sans-serif'] = ['SimHei']
+matplotlib.rcParams['axes.unicode_minus'] = False
 
 CURRENT_TIME = time.time()
 LOG_FILE = "train_output.log"
-SAVE_MODEL_DIR = "saved_models"
+DETECTOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "updated files")
+
+# 蒸馏训练的学生：显示名 -> (学生模型, 通道倍率)，倍率为空时直接用学生模型
+DISTILL_STUDENTS = {
+    "当前选择的模型": (None, None),
+    "yolov8n 宽度减半": ("yolov8n.yaml", 0.125),
+    "yolov8n 宽度 1/4": ("yolov8n.yaml", 0.0625),
+}
 
 
 class YoloTrainerApp(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
-        uic.loadUi("Train.ui", self)
+        load_ui("Train.ui", self)
 
         self.btnSelectDataset.clicked.connect(self.select_dataset_folder)
         self.btnUploadDataset.clicked.connect(self.upload_dataset)
         self.btnStartTraining.clicked.connect(self.start_training)
+        self.plotSelect.addItem("全部指标")
         self.plotSelect.currentIndexChanged.connect(self.update_selected_plot)
 
         self.btnStopTraining = self.findChild(QPushButton, "btnStopTraining")
@@ -51,13 +68,33 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
         self.log_timer.timeout.connect(self.read_log_file)
         self.last_log_position = 0
 
+        self.compare_window = None
+        self.menuFile.addAction("多实验对比").triggered.connect(self.open_compare_window)
+        self.menuFile.addAction("早停设置...").triggered.connect(self.set_patience)
+        self.menuFile.addAction("蒸馏训练...").triggered.connect(self.start_distill_training)
+        self.menuFile.addAction("精简训练集...").triggered.connect(self.build_coreset)
+        self.menuFile.addAction("多进程训练...").triggered.connect(self.set_dist_ranks)
+        self.menuFile.addAction("伪标注...").triggered.connect(self.pseudo_label)
+
+        self.patience = 30  # mAP50-95 连续多少轮不提升就提前结束，0 表示关闭
+        self.early_stop = None
+        self.early_stopped = False
+        self.distill = None  # 下一次训练按蒸馏模式运行时的老师/学生设置
+        self.dist_ranks = 1  # 大于 1 时用 DistTrain 在本机起多个 CPU 进程做数据并行
+
         self.yolo_process = None
         self.current_results_csv = None
+        self.results_tail = None
+        self.plotted_rows = -1
+        self.previous_runs = None  # 本次训练开始前已有的 run 目录，这些目录里的 results.csv 不属于本次训练
 
     def closeEvent(self, event):
         if self.yolo_process and self.yolo_process.poll() is None:
             self.yolo_process.terminate()
             self.yolo_process.wait()
+        if self.compare_window is not None:
+            self.compare_window.shutdown()
+            self.compare_window = None
         event.accept()
 
     def log_text(self, text):
@@ -69,39 +106,89 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
             self.labelProgress.setText(status)
         QTimer.singleShot(0, update)
 
-    def update_selected_plot(self):
-        index = self.plotSelect.currentIndex()
-        csv_path = self.current_results_csv or self.get_latest_results_csv()
+    def get_results_tail(self):
+        if self.current_results_csv is None:
+            # 本次训练的 run 目录一出现就绑定，之后不再跟着别的 run 跳
+            self.current_results_csv = self.get_latest_results_csv()
+        csv_path = self.current_results_csv
         if not csv_path or not os.path.exists(csv_path):
-            self.log_text("无法找到 results.csv")
-            return
-
-        loss_list, map50_list, map5095_list, p_list, r_list = read_metrics_from_results_csv(csv_path,extended=True)
-
+            return None
+        if self.results_tail is None or self.results_tail.csv_path != csv_path:
+            self.results_tail = ResultsCsvTail(csv_path)
+        self.results_tail.poll()
+        return self.results_tail
+
+    def plot_from_tail(self, tail, index):
+        """按下拉框选项画图，返回是否有数据"""
         if index == 0:
+            loss_list = tail.total_loss()
             if loss_list:
                 self.update_loss_plot(loss_list)
-                self.log_text("显示训练 Loss 曲线")
-            else:
-                self.log_text("无有效 Loss 数据")
-        elif index == 1:
+            return bool(loss_list)
+        if index == 1:
+            map50_list = tail.get('metrics/mAP50(B)', 'map50')
             if map50_list:
-                self.update_map_plot(map50_list, map5095_list)
-                self.log_text("显示 mAP 曲线")
-            else:
-                self.log_text("无有效 mAP 数据")
-        elif index == 2:
+                self.update_map_plot(map50_list, tail.get('metrics/mAP50-95(B)', 'map50-95'))
+            return bool(map50_list)
+        if index == 2:
+            p_list = tail.get('metrics/precision(B)', 'precision')
             if p_list:
-                self.plot_canvas.update_custom_curve(p_list, title="Precision 曲线", label="Precision", color='green')
-                self.log_text("显示 Precision 曲线")
-            else:
-                self.log_text("无有效 Precision 数据")
-        elif index == 3:
+                self.update_custom_plot(p_list, "Precision 曲线", "Precision", 'green')
+            return bool(p_list)
+        if index == 3:
+            r_list = tail.get('metrics/recall(B)', 'recall')
             if r_list:
-                self.plot_canvas.update_custom_curve(r_list, title="Recall 曲线", label="Recall", color='orange')
-                self.log_text("显示 Recall 曲线")
-            else:
-                self.log_text("无有效 Recall 数据")
+                self.update_custom_plot(r_list, "Recall 曲线", "Recall", 'orange')
+            return bool(r_list)
+        if index == 4:
+            groups = {
+                "Loss": {k.split('/')[-1]: v for k, v in tail.columns.items() if k.startswith('train/')},
+                "指标": {k.split('/')[-1].replace('(B)', ''): v for k, v in tail.columns.items()
+                         if k.startswith('metrics/')},
+                "学习率": {k.split('/')[-1]: v for k, v in tail.columns.items() if k.startswith('lr/')},
+            }
+            groups = {title: series for title, series in groups.items() if series}
+            if groups and tail.rows:
+                QTimer.singleShot(0, lambda: self.plot_canvas.update_series(groups))
+            return bool(groups and tail.rows)
+        return False
+
+    def update_selected_plot(self):
+        index = self.plotSelect.currentIndex()
+        tail = self.get_results_tail()
+        if tail is None:
+            self.log_text("无法找到 results.csv")
+            return
+
+        name = self.plotSelect.currentText()
+        if self.plot_from_tail(tail, index):
+            self.log_text(f"显示 {name}")
+        else:
+            self.log_text(f"{name}：无有效数据")
+
+    def set_patience(self):
+        value, ok = QInputDialog.getInt(self, "早停设置", "mAP50-95 连续多少轮不提升就结束训练（0 表示关闭）：",
+                                        self.patience, 0, 1000)
+        if ok:
+            self.patience = value
+
+    def check_early_stop(self, csv_path):
+        if self.patience <= 0 or not self.yolo_process or self.yolo_process.poll() is not None:
+            return
+        if self.early_stop is None:
+            self.early_stop = EarlyStopController([PatienceRule(self.patience)])
+            self.early_stop.register(Trial("gui", csv_path, process=self.yolo_process, max_epochs=self.epochs))
+        for trial in self.early_stop.poll():
+            self.early_stopped = True
+            self.log_text(f"提前结束训练：{trial.stop_reason}，预计节省 {trial.saved_cpu_hours:.2f} CPU 小时")
+
+    def open_compare_window(self):
+        if self.compare_window is None:
+            from RunCompareWindow import RunCompareWindow
+            self.compare_window = RunCompareWindow()
+        else:
+            self.compare_window.refresh()
+        self.compare_window.show()
 
     def update_map_plot(self, map50_list, map5095_list):
         QTimer.singleShot(0, lambda: self.plot_canvas.update_map_curve(map50_list, map5095_list))
@@ -109,6 +196,9 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
     def update_loss_plot(self, loss_list):
         QTimer.singleShot(0, lambda: self.plot_canvas.update_loss_curve(loss_list))
 
+    def update_custom_plot(self, values, title, label, color):
+        QTimer.singleShot(0, lambda: self.plot_canvas.update_custom_curve(values, title=title, label=label, color=color))
+
     def select_dataset_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "选择数据集目录")
         if folder:
@@ -167,6 +257,12 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
         self.log_text("正在开始训练...\n")
 
         self.set_progress(0, "正在初始化训练任务...")
+        self.current_results_csv = None
+        self.previous_runs = set(os.listdir('runs/train')) if os.path.isdir('runs/train') else set()
+        self.results_tail = None
+        self.plotted_rows = -1
+        self.early_stop = None
+        self.early_stopped = False
         self.progressBar.setValue(0)
 
         with open(LOG_FILE, 'w', encoding='utf-8') as f:
@@ -178,6 +274,87 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
         thread.start()
         self.progress_timer.start(1000)
 
+    def start_distill_training(self):
+        """选一个已发布的模型当老师，用界面上的轮次/批大小/学习率训练学生"""
+        if not self.dataset_path:
+            QMessageBox.warning(self, "错误", "请先选择数据集目录！")
+            return
+        teachers = teacher_models()
+        if not teachers:
+            QMessageBox.warning(self, "错误", "Assets/Model 下没有可以当老师的模型")
+            return
+        names = [os.path.splitext(os.path.basename(t))[0] for t in teachers]
+        name, ok = QInputDialog.getItem(self, "蒸馏训练", "老师模型：", names, 0, False)
+        if not ok:
+            return
+        student, ok = QInputDialog.getItem(self, "蒸馏训练", "学生模型：", list(DISTILL_STUDENTS), 0, False)
+        if not ok:
+            return
+        model, width = DISTILL_STUDENTS[student]
+        self.distill = {"teacher": teachers[names.index(name)], "student": model, "width": width}
+        self.log_text(f"蒸馏训练：老师 {name}，学生 {student}")
+        self.start_training()
+
+    def set_dist_ranks(self):
+        value, ok = QInputDialog.getInt(self, "多进程训练", "CPU 训练的进程数（1 为普通训练）：",
+                                        self.dist_ranks, 1, max(1, os.cpu_count() or 1))
+        if ok:
+            self.dist_ranks = value
+
+    def build_coreset(self):
+        """按多样性和上一次训练的难度挑出子集，生成新的 data.yaml 并切换到它"""
+        if not self.dataset_path:
+            QMessageBox.warning(self, "错误", "请先选择数据集目录！")
+            return
+        fraction, ok = QInputDialog.getDouble(self, "精简训练集", "保留图片的比例：", 0.4, 0.05, 1.0, 2)
+        if not ok:
+            return
+        data_yaml = os.path.join(self.dataset_path, 'data.yaml')
+        cmd = [sys.executable, "-m", "Coreset", data_yaml, "--fraction", str(fraction)]
+        self.log_text("正在生成精简训练集...")
+
+        def run():
+            result = subprocess.run(cmd, capture_output=True, encoding='utf-8', errors='replace')
+            self.log_text((result.stdout + result.stderr).strip())
+            if result.returncode == 0:
+                out_dir = os.path.join("runs", "coreset", _dataset_name(data_yaml))
+                QTimer.singleShot(0, lambda: self.use_dataset(out_dir))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def pseudo_label(self):
+        """用已发布的模型给一批未标注图片生成 YOLO 标注和复核队列；选了数据集时按它的类别编号"""
+        folder = QFileDialog.getExistingDirectory(self, "选择未标注图片目录")
+        if not folder:
+            return
+        models = teacher_models()
+        if not models:
+            QMessageBox.warning(self, "错误", "Assets/Model 下没有可用的模型")
+            return
+        names = [os.path.splitext(os.path.basename(m))[0] for m in models]
+        choices = names + ["全部模型（集成）"] if len(models) > 1 else names
+        name, ok = QInputDialog.getItem(self, "伪标注", "使用的模型：", choices, 0, False)
+        if not ok:
+            return
+        selected = models if name not in names else [models[names.index(name)]]
+        cmd = [sys.executable, "-m", "PseudoLabel", folder, "--model"] + selected
+        data_yaml = os.path.join(self.dataset_path, 'data.yaml') if self.dataset_path else None
+        if data_yaml and os.path.exists(data_yaml):
+            cmd += ["--data", data_yaml]
+        self.log_text(f"正在生成伪标注：{folder}")
+
+        def run():
+            result = subprocess.run(cmd, capture_output=True, encoding='utf-8', errors='replace')
+            # 进度行用 \r 刷新，日志里只保留最后一次
+            lines = [line.rsplit("\r", 1)[-1] for line in (result.stdout + result.stderr).split("\n")]
+            self.log_text("\n".join(lines).strip())
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def use_dataset(self, folder):
+        self.dataset_path = folder
+        self.log_text(f"已切换到数据集：{folder}")
+
     def stop_training(self):
         if self.yolo_process and self.yolo_process.poll() is None:
             self.yolo_process.terminate()
@@ -189,24 +366,34 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
                 self.btnStopTraining.setEnabled(False)
 
     def run_yolo_subprocess(self, model_name):
+        distill, self.distill = self.distill, None
         data_yaml_path = os.path.join(self.dataset_path, 'data.yaml')
         if not os.path.exists(data_yaml_path):
             self.log_text("未找到 data.yaml，请确保数据目录正确")
             self.set_progress(0, "训练失败")
             return
 
-        cmd = [
-            "yolo",
-            "task=detect",
-            "mode=train",
-            f"model={model_name}",
-            f"data={data_yaml_path}",
-            f"epochs={self.epochs}",
-            f"batch={self.batch_size}",
-            f"lr0={self.lr}",
-            "project=runs/train",
-            "name=exp"
-        ]
+        extra = {}
+        # 如果之前用 TrainProfiler 按这次的批大小（imgsz 为默认的 640）测过该数据集，沿用推荐的数据加载配置，没测过就不沿用
+        recommend = load_recommendation(data_yaml_path, self.batch_size, 640)
+        if recommend:
+            extra["workers"] = recommend['workers']
+            extra["cache"] = recommend['cache']
+            self.log_text(f"使用推荐的数据加载配置：workers={recommend['workers']}，cache={recommend['cache']}")
+
+        if distill:
+            # 蒸馏训练同样写 runs/train/exp*/results.csv，进度、曲线和保存流程不变，结束时多一份对比报告
+            cmd = build_distill_command(distill["teacher"], distill["student"] or model_name, data_yaml_path,
+                                        self.epochs, self.batch_size, self.lr, project="runs/train", name="exp",
+                                        width=distill["width"], **extra)
+        elif self.dist_ranks > 1:
+            # rank 0 照常写 runs/train/exp*/results.csv 和 weights，界面的进度和保存流程不用改
+            self.log_text(f"使用 {self.dist_ranks} 个进程做 CPU 数据并行训练")
+            cmd = build_dist_command(model_name, data_yaml_path, self.epochs, self.batch_size, self.lr,
+                                     self.dist_ranks, project="runs/train", name="exp", **extra)
+        else:
+            cmd = build_train_command(model_name, data_yaml_path, self.epochs, self.batch_size, self.lr,
+                                      project="runs/train", name="exp", **extra)
 
         with open(LOG_FILE, 'w', encoding='utf-8') as logfile:
             try:
@@ -218,11 +405,11 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
                     errors='replace'
                 )
                 self.yolo_process.wait()
-                if self.yolo_process.returncode == 0:
+                if self.yolo_process.returncode == 0 or self.early_stopped:
                     self.set_progress(100, "训练完成")
-                    self.current_results_csv = self.get_latest_results_csv()
-                    self.handle_training_completion()
-                    self.update_final_results()
+                    self.current_results_csv = self.current_results_csv or self.get_latest_results_csv()
+                    # 保存/发布要弹对话框，回到 GUI 线程里做，这里是训练线程
+                    QTimer.singleShot(0, self.finish_training)
                 else:
                     self.set_progress(0, "训练中断")
             except Exception as e:
@@ -244,31 +431,24 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
                 self.last_log_position = f.tell()
 
     def update_progress_from_csv(self):
-        csv_path = self.current_results_csv or self.get_latest_results_csv()
-        if not csv_path or not os.path.exists(csv_path):
+        tail = self.get_results_tail()
+        if tail is not None:
+            self.check_early_stop(tail.csv_path)
+        # 没有新的 epoch 写入就什么都不做，曲线保持不变
+        if tail is None or tail.rows == self.plotted_rows:
             return
+        self.plotted_rows = tail.rows
 
-        index = self.plotSelect.currentIndex()
+        current_epoch = tail.rows
+        percent = int((current_epoch / self.epochs) * 100)
+        self.progressBar.setValue(min(percent, 100))
+        self.labelProgress.setText(f"训练进度：{current_epoch}/{self.epochs}")
+        self.plot_from_tail(tail, self.plotSelect.currentIndex())
+
+    def finish_training(self):
+        self.handle_training_completion()
+        self.update_final_results()
 
-        if index == 0:  # Loss
-            loss_list = read_loss_from_results_csv(csv_path)
-            if loss_list:
-                self.update_loss_plot(loss_list)
-                current_epoch = len(loss_list)
-                percent = int((current_epoch / self.epochs) * 100)
-                self.progressBar.setValue(min(percent, 100))
-                self.labelProgress.setText(f"训练进度：{current_epoch}/{self.epochs}")
-
-        elif index in [1, 2, 3]:  # mAP, precision, recall
-            loss_list, map50_list, map5095_list, p_list, r_list = read_metrics_from_results_csv(csv_path, extended=True)
-            if index == 1 and map50_list:
-                self.update_map_plot(map50_list, map5095_list)
-            elif index == 2 and p_list:
-                self.plot_canvas.update_custom_curve(p_list, title="Precision 曲线", label="Precision", color='green')
-            elif index == 3 and r_list:
-                self.plot_canvas.update_custom_curve(r_list, title="Recall 曲线", label="Recall", color='orange')
-            else:
-                self.plot_canvas.update_custom_curve(loss_list,title="Loss曲线", label="Loss", color='red')
     def update_final_results(self):
         self.plot_metrics_from_csv()
         self.plotSelect.setCurrentIndex(1)
@@ -284,17 +464,51 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
             "模型训练已完成，是否要保存模型文件？",
             QMessageBox.Yes | QMessageBox.No
         )
-        if reply == QMessageBox.Yes:
-            save_path = QFileDialog.getExistingDirectory(parent_widget, "选择保存模型的目录", SAVE_MODEL_DIR)
-            if save_path:
-                try:
-                    import shutil
-                    shutil.copytree(model_dir, os.path.join(save_path, os.path.basename(model_dir)), dirs_exist_ok=True)
-                    QMessageBox.information(parent_widget, "保存成功", f"模型已保存到：{save_path}")
-                except Exception as e:
-                    QMessageBox.warning(parent_widget, "保存失败", f"保存失败：{e}")
+        if reply != QMessageBox.Yes:
+            return
+        # 权重和指标按内容存入产物库，不再整目录复制训练预览图
+        store = ArtifactStore()
+        try:
+            name, version = store.save_run(model_dir)
+            self.log_text(f"模型已保存为 {name} v{version}")
+            target_name, ok = QInputDialog.getText(parent_widget, "发布模型",
+                                                   "发布到 Assets/Model 的模型名（取消则只保存不发布）：",
+                                                   text=name)
+            if ok and target_name.strip():
+                target = store.promote(name, version, target_name.strip())
+                self.build_model_metrics(target_name.strip(), target, store.versions(name)[version - 1]["data"])
+                QMessageBox.information(parent_widget, "保存成功", f"模型 {name} v{version} 已发布到：{target}")
             else:
-                QMessageBox.information(parent_widget, "提示", "未选择目录，未保存模型。")
+                QMessageBox.information(parent_widget, "保存成功", f"模型已保存为 {name} v{version}")
+        except Exception as e:
+            QMessageBox.warning(parent_widget, "保存失败", f"保存失败：{e}")
+        finally:
+            store.close()
+
+    def build_model_metrics(self, model_name, weights, data_yaml=None):
+        """发布后在后台进程里重新验证，生成检测界面性能指标页用的 mAP/表格/曲线文件"""
+        # MetricsService 在检测界面的目录里，按它的 Assets/data、Assets/diagram 生成文件
+        cmd = [sys.executable, os.path.join(DETECTOR_DIR, "MetricsService.py"), model_name,
+               "--weights", os.path.abspath(weights)]
+        if data_yaml:
+            cmd += ["--data", os.path.abspath(data_yaml)]
+        self.log_text(f"正在后台生成 {model_name} 的性能指标...")
+
+        def run():
+            try:
+                process = subprocess.Popen(cmd, cwd=DETECTOR_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           encoding='utf-8', errors='replace')
+            except OSError as e:
+                self.log_text(f"生成性能指标失败：{e}")
+                return
+            for line in process.stdout:
+                line = line.rsplit("\r", 1)[-1].strip()
+                if line:
+                    self.log_text(line)
+            if process.wait() != 0:
+                self.log_text(f"生成 {model_name} 的性能指标失败（退出码 {process.returncode}）")
+
+        threading.Thread(target=run, daemon=True).start()
 
     # --- 用户终止训练后延迟初始化 ---
     def delayed_reset_ui(self, delay_sec=2):
@@ -333,6 +547,9 @@ class YoloTrainerApp(QtWidgets.QMainWindow):
         latest_csv = None
         latest_time = 0
         for root, dirs, files in os.walk(base_dir):
+            run_dir = os.path.relpath(root, base_dir).split(os.sep)[0]
+            if self.previous_runs is not None and run_dir in self.previous_runs:
+                continue
             if 'results.csv' in files:
                 path = os.path.join(root, 'results.csv')
                 mtime = os.path.getmtime(path)
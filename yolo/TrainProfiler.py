@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import json
+import argparse
+import itertools
+import statistics
+import yaml
+
+PROFILE_DIR = os.path.join("runs", "profile")
+
+# 默认扫描的参数组合，每个组合只跑很少的 batch。训练时只会沿用 workers 和 cache，
+# batch/imgsz 要用 --batch/--imgsz 设成实际训练用的值，没测过训练用的值时不给推荐
+DEFAULT_SWEEP = {
+    "workers": [0, 2, 4, 8],
+    "batch": [16],
+    "cache": [False, "ram"],
+    "imgsz": [640],
+}
+
+
+class _ProfileDone(Exception):
+    """采样够了之后用来提前结束 model.train 的内部异常"""
+
+
+def _loader_queue_depth(trainer):
+    # InfiniteDataLoader 内部持有 torch 的迭代器，workers=0 时没有预取队列
+    loader = getattr(trainer, "train_loader", None)
+    iterator = getattr(loader, "iterator", None)
+    if iterator is None:
+        return 0
+    depth = getattr(iterator, "_tasks_outstanding", None)
+    if depth is not None:
+        return int(depth)
+    queue = getattr(iterator, "_data_queue", None)
+    try:
+        return queue.qsize() if queue is not None else 0
+    except (NotImplementedError, AttributeError):
+        return 0
+
+
+def _restore_workers(trainer, workers):
+    # 新版 ultralytics 在 CPU 上会把 workers 强制改成 0，这里改回要用的值
+    trainer.args.workers = workers
+
+
+def keep_workers(model, workers):
+    """让训练真正使用 workers 个加载进程（model 是 YOLO 或训练器）；测量和正式训练都要挂上，推荐值才有意义"""
+    model.add_callback("on_pretrain_routine_start", lambda trainer: _restore_workers(trainer, workers))
+
+
+class IterationProfiler:
+    """通过 ultralytics 回调统计每个 iteration 的数据等待时间和计算时间"""
+
+    def __init__(self, warmup=3, max_batches=30, workers=None):
+        self.warmup = warmup
+        self.max_batches = max_batches
+        self.workers = workers
+        self.data_wait = []
+        self.compute = []
+        self.queue_depth = []
+        self.images = 0
+        self.batches = 0
+        self._mark = None
+        self._batch_start = None
+
+    def attach(self, model):
+        model.add_callback("on_pretrain_routine_start", self.on_pretrain_routine_start)
+        model.add_callback("on_train_epoch_start", self.on_train_epoch_start)
+        model.add_callback("on_train_batch_start", self.on_train_batch_start)
+        model.add_callback("on_train_batch_end", self.on_train_batch_end)
+
+    def on_pretrain_routine_start(self, trainer):
+        if self.workers is not None:
+            _restore_workers(trainer, self.workers)
+
+    def on_train_epoch_start(self, trainer):
+        self._mark = time.perf_counter()
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        if self._mark is not None and self.batches >= self.warmup:
+            self.data_wait.append(now - self._mark)
+            self.queue_depth.append(_loader_queue_depth(trainer))
+        self._batch_start = now
+
+    def on_train_batch_end(self, trainer):
+        now = time.perf_counter()
+        if self.batches >= self.warmup:
+            self.compute.append(now - self._batch_start)
+            self.images += trainer.batch_size
+        self.batches += 1
+        self._mark = now
+        if self.batches >= self.warmup + self.max_batches:
+            raise _ProfileDone()
+
+    def summary(self):
+        if not self.compute:
+            return None
+        wait = sum(self.data_wait)
+        compute = sum(self.compute)
+        total = wait + compute
+        return {
+            "batches": len(self.compute),
+            "data_wait_ms": statistics.mean(self.data_wait) * 1000 if self.data_wait else 0.0,
+            "compute_ms": statistics.mean(self.compute) * 1000,
+            "data_wait_ratio": wait / total if total > 0 else 0.0,
+            "images_per_sec": self.images / total if total > 0 else 0.0,
+            "queue_depth": statistics.mean(self.queue_depth) if self.queue_depth else 0.0,
+        }
+
+
+def profile_config(data_yaml, model_name="yolov8n.pt", workers=0, batch=16, cache=False, imgsz=640,
+                   warmup=3, max_batches=30, device="cpu"):
+    """用给定的配置跑一小段训练，返回吞吐统计"""
+    from ultralytics import YOLO
+
+    model = YOLO(model_name)
+    profiler = IterationProfiler(warmup=warmup, max_batches=max_batches, workers=workers)
+    profiler.attach(model)
+    try:
+        model.train(
+            data=data_yaml,
+            epochs=1,
+            workers=workers,
+            batch=batch,
+            cache=cache,
+            imgsz=imgsz,
+            device=device,
+            val=False,
+            plots=False,
+            save=False,
+            project=PROFILE_DIR,
+            name="sweep",
+            exist_ok=True,
+            verbose=False,
+        )
+    except _ProfileDone:
+        pass
+
+    result = profiler.summary()
+    if result is not None:
+        result.update({"workers": workers, "batch": batch, "cache": cache, "imgsz": imgsz})
+    return result
+
+
+def sweep(data_yaml, grid=None, **kwargs):
+    grid = grid or DEFAULT_SWEEP
+    keys = list(grid.keys())
+    results = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        config = dict(zip(keys, values))
+        print(f"[profile] {config}")
+        try:
+            result = profile_config(data_yaml, **config, **kwargs)
+        except Exception as e:
+            print(f"[profile] 配置失败：{config} -> {e}")
+            continue
+        if result is None:
+            continue
+        print(f"[profile]   {result['images_per_sec']:.1f} img/s, "
+              f"数据等待 {result['data_wait_ms']:.1f} ms ({result['data_wait_ratio'] * 100:.0f}%), "
+              f"计算 {result['compute_ms']:.1f} ms, 队列深度 {result['queue_depth']:.1f}")
+        results.append(result)
+    return results
+
+
+def recommend(results, batch=None, imgsz=None):
+    """
+    只在训练实际使用的 batch/imgsz 下比较，挑 images/sec 最高的 workers/cache 组合；
+    不指定时取测过的最大值。没测过训练用的 batch/imgsz 时返回 None，
+    别的批大小下测出的 workers/cache 不一定适用。
+    """
+    if not results:
+        return None
+    if imgsz is None:
+        imgsz = max(r["imgsz"] for r in results)
+    candidates = [r for r in results if r["imgsz"] == imgsz]
+    if candidates and batch is None:
+        batch = max(r["batch"] for r in candidates)
+    candidates = [r for r in candidates if r["batch"] == batch]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda r: r["images_per_sec"])
+
+
+def _dataset_name(data_yaml):
+    # GUI 里数据集都叫 data.yaml，这时用所在目录名区分
+    name = os.path.splitext(os.path.basename(data_yaml))[0]
+    if name == "data":
+        name = os.path.basename(os.path.dirname(os.path.abspath(data_yaml))) or name
+    return name
+
+
+def recommendation_path(data_yaml):
+    name = _dataset_name(data_yaml)
+    return os.path.join(PROFILE_DIR, f"{name}_recommend.yaml")
+
+
+def sweep_path(data_yaml):
+    return os.path.join(PROFILE_DIR, f"{_dataset_name(data_yaml)}_sweep.json")
+
+
+def save_recommendation(data_yaml, best, results):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(recommendation_path(data_yaml), "w", encoding="utf-8") as f:
+        yaml.safe_dump({"data": data_yaml, "recommend": best}, f, allow_unicode=True, sort_keys=False)
+    with open(sweep_path(data_yaml), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_recommendation(data_yaml, batch=None, imgsz=None):
+    """
+    读取之前为该数据集保存的推荐配置，没有则返回 None。
+    给了训练用的 batch/imgsz 时按完整的测量结果在这组取值下重新挑选，
+    这组取值没测过也返回 None。
+    """
+    if batch is not None or imgsz is not None:
+        try:
+            with open(sweep_path(data_yaml), "r", encoding="utf-8") as f:
+                return recommend(json.load(f), batch, imgsz)
+        except (OSError, ValueError):
+            pass
+    path = recommendation_path(data_yaml)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            best = (yaml.safe_load(f) or {}).get("recommend")
+    except (OSError, yaml.YAMLError):
+        return None
+    if best and ((batch is not None and best.get("batch") != batch)
+                 or (imgsz is not None and best.get("imgsz") != imgsz)):
+        return None
+    return best
+
+
+def _parse_list(text, cast):
+    values = []
+    for item in text.split(","):
+        item = item.strip()
+        if cast is None:
+            values.append(False if item.lower() in ("false", "0", "none") else item)
+        else:
+            values.append(cast(item))
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO 训练数据加载/吞吐分析")
+    parser.add_argument("data", help="数据集 yaml，例如 CarDetectorData.yaml")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--workers", default="0,2,4,8")
+    parser.add_argument("--batch", default="16", help="训练时用的批大小，可以逗号分隔测多个")
+    parser.add_argument("--cache", default="false,ram")
+    parser.add_argument("--imgsz", default="640", help="训练时用的图片尺寸，可以逗号分隔测多个")
+    parser.add_argument("--batches", type=int, default=30, help="每个配置采样的 batch 数")
+    args = parser.parse_args()
+
+    grid = {
+        "workers": _parse_list(args.workers, int),
+        "batch": _parse_list(args.batch, int),
+        "cache": _parse_list(args.cache, None),
+        "imgsz": _parse_list(args.imgsz, int),
+    }
+    results = sweep(args.data, grid, model_name=args.model, max_batches=args.batches)
+    best = recommend(results, grid["batch"][0], grid["imgsz"][0])
+    if best is None:
+        print("没有得到有效的测量结果")
+        sys.exit(1)
+    save_recommendation(args.data, best, results)
+    print("推荐配置：", best)
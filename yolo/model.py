@@ -1,4 +1,5 @@
 from ultralytics import YOLO
+from TrainProfiler import load_recommendation, keep_workers
 """
 import sys,os,PyQt5
 from PyQt5.QtWidgets import QMainWindow, QApplication
@@ -30,10 +31,15 @@ if __name__ == "__main__":
 # 加载预训练模型
 model = YOLO('yolov8n.pt')
 #model("liuwei.gif",show=True,save=True)
+# 用 python TrainProfiler.py FaceExpressionData.yaml --batch 32 测出的数据加载配置（没测过 batch=32 时用原来的设置）
+recommend = load_recommendation('FaceExpressionData.yaml', batch=32, imgsz=640) or {}
+keep_workers(model, recommend.get('workers', 0))
+# 用 python Coreset.py FaceExpressionData.yaml 生成精简训练集后，可以把 data 换成 runs/coreset/FaceExpressionData/data.yaml
 # 训练配置
 results = model.train(
     data='FaceExpressionData.yaml',  # 数据集配置文件
-    workers=0,
+    workers=recommend.get('workers', 0),
+    cache=recommend.get('cache', False),
     epochs=5,           # 训练轮次
     batch=32,             # 每轮批量
     imgsz=640,            # 图片尺寸
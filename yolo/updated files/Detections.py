@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+from functools import lru_cache
+
+
+def empty_detections():
+    return {
+        "boxes": np.zeros((0, 4), dtype=np.float32),
+        "scores": np.zeros((0,), dtype=np.float32),
+        "classes": np.zeros((0,), dtype=np.int32),
+        "labels": [],
+        "sources": [],
+    }
+
+
+def results_to_detections(result, source=None):
+    """把 ultralytics 的 Results 转成统一的检测结果字典，source 标记来自哪个模型"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+    classes = boxes.cls.cpu().numpy().astype(np.int32)
+    return {
+        "boxes": boxes.xyxy.cpu().numpy().astype(np.float32),
+        "scores": boxes.conf.cpu().numpy().astype(np.float32),
+        "classes": classes,
+        "labels": [result.names[int(c)] for c in classes],
+        "sources": [source] * len(classes),
+    }
+
+
+def concat_detections(dets_list):
+    dets_list = [d for d in dets_list if len(d["labels"]) > 0]
+    if not dets_list:
+        return empty_detections()
+    return {
+        "boxes": np.concatenate([d["boxes"] for d in dets_list]),
+        "scores": np.concatenate([d["scores"] for d in dets_list]),
+        "classes": np.concatenate([d["classes"] for d in dets_list]),
+        "labels": [label for d in dets_list for label in d["labels"]],
+        "sources": [source for d in dets_list for source in d["sources"]],
+    }
+
+
+def offset_detections(dets, ox, oy):
+    if len(dets["labels"]) and (ox or oy):
+        dets["boxes"][:, [0, 2]] += ox
+        dets["boxes"][:, [1, 3]] += oy
+    return dets
+
+
+def display_label(label, source):
+    return f"{source}:{label}" if source else label
+
+
+def count_by_label(dets):
+    counts = {}
+    for label, source in zip(dets["labels"], dets["sources"]):
+        key = display_label(label, source)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def format_counts(counts):
+    if not counts:
+        return "未检测到目标"
+    return "\n".join(f"{name}: {num}" for name, num in sorted(counts.items()))
+
+
+@lru_cache(maxsize=None)
+def class_color(index):
+    # 按类别编号生成固定颜色，保证同一类别在每帧里颜色一致；RandomState 创建较慢，结果缓存
+    rng = np.random.RandomState(index * 7 + 3)
+    return tuple(int(c) for c in rng.randint(60, 255, size=3))
+
+
+def draw_detections(frame, dets):
+    annotated = frame.copy()
+    ids = dets.get("ids")
+    for i, (box, score, cls, label, source) in enumerate(zip(dets["boxes"], dets["scores"], dets["classes"],
+                                                             dets["labels"], dets["sources"])):
+        x1, y1, x2, y2 = [int(v) for v in box]
+        color = class_color(int(cls))
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+        text = f"{display_label(label, source)} {score:.2f}"
+        if ids is not None:
+            text = f"#{int(ids[i])} {text}"
+        cv2.putText(annotated, text, (x1, max(y1 - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return annotated
+
+
+def detections_to_json(dets):
+    """转成可以直接 json.dumps 的列表，给推理服务等非 Qt 场景使用"""
+    items = []
+    ids = dets.get("ids")
+    for i, (box, score, cls, label, source) in enumerate(zip(dets["boxes"], dets["scores"], dets["classes"],
+                                                             dets["labels"], dets["sources"])):
+        item = {
+            "label": label,
+            "class": int(cls),
+            "score": round(float(score), 4),
+            "box": [round(float(v), 1) for v in box],
+        }
+        if source:
+            item["source"] = source
+        if ids is not None:
+            item["id"] = int(ids[i])
+        items.append(item)
+    return items
@@ -0,0 +1,373 @@
+import os
+import sys
+import json
+import glob
+import time
+import queue
+import argparse
+import threading
+import cv2
+import numpy as np
+from QualityController import percentile
+
+CHUNK_BYTES = 64 << 20  # 每个分块约 64MB：分辨率越高每块帧数越少，写一块的耗时和内存占用都差不多
+WRITE_QUEUE = 3  # 最多几个写满的分块排队等写盘，磁盘跟不上时 write 会阻塞而不是无限占内存
+REPLAY_MODES = ("original", "fixed", "max")
+
+
+class FrameRecorder:
+    """
+    把原始帧和采集时间戳写进一个录制目录：每 chunk_frames 帧一个 chunk_XXXXX.npy（(N, H, W, 3) uint8，
+    回放时可以直接 mmap），compress=True 时改写 npz 压缩包。chunk_frames 不指定时按 chunk_bytes 和第一帧的大小算。
+    写盘在后台线程里做，采集线程只把帧拷进分块缓冲；每写完一个分块就更新 meta.json 和时间戳，
+    录制中途程序崩溃也能回放已经落盘的部分。
+    """
+
+    def __init__(self, path, chunk_frames=None, compress=False, source=None, chunk_bytes=CHUNK_BYTES):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.chunk_bytes = chunk_bytes
+        self.compress = compress
+        self.source = source
+        self.shape = None
+        self.buffer = None
+        self.count = 0  # 当前分块里的帧数
+        self.chunks = 0  # 已经落盘的分块数
+        self.queued = 0  # 已经交给写盘线程的分块数
+        self.timestamps = []
+        self.started = None
+        self.error = None
+        self.free = queue.Queue()  # 写完可以复用的分块缓冲
+        self.jobs = queue.Queue(maxsize=WRITE_QUEUE)
+        self.writer = None
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def frames(self):
+        return len(self.timestamps)
+
+    def _start(self, frame):
+        self.shape = frame.shape
+        if not self.chunk_frames:
+            self.chunk_frames = max(1, self.chunk_bytes // frame.nbytes)
+        # 一块在采集、最多 WRITE_QUEUE 块排队、一块正在写，缓冲总数固定，不会越录越占内存
+        for _ in range(WRITE_QUEUE + 2):
+            self.free.put(np.empty((self.chunk_frames,) + self.shape, dtype=np.uint8))
+        self.buffer = self.free.get()
+        self.started = time.time()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def write(self, frame, timestamp=None):
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        if self.error is not None:
+            raise self.error
+        if self.shape is None:
+            self._start(frame)
+        if frame.shape != self.shape:
+            # 摄像头中途换了分辨率，统一缩放到开始时的尺寸
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        self.buffer[self.count] = frame
+        self.count += 1
+        self.timestamps.append(timestamp)
+        if self.count == self.chunk_frames:
+            self._flush()
+            self.buffer = self.free.get()
+
+    def _flush(self):
+        """把当前分块交给写盘线程；队列满时在这里等，不在采集线程里写文件"""
+        if self.count == 0:
+            return
+        self.jobs.put((self.queued, self.buffer, self.count, len(self.timestamps)))
+        self.queued += 1
+        self.buffer = None
+        self.count = 0
+
+    def _write_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            index, buffer, count, frames = job
+            try:
+                if self.error is None:
+                    name = os.path.join(self.path, f"chunk_{index:05d}")
+                    data = buffer[:count]
+                    if self.compress:
+                        np.savez_compressed(name + ".npz", frames=data)
+                    else:
+                        np.save(name + ".npy", data)
+                    self.chunks = index + 1
+                    self._write_meta(frames)
+            except Exception as e:
+                self.error = e  # 下一次 write / close 时在调用方线程里抛出
+            finally:
+                self.free.put(buffer)
+
+    def _write_meta(self, frames):
+        stamps = np.asarray(self.timestamps[:frames], dtype=np.float64)
+        np.save(os.path.join(self.path, "timestamps.npy"), stamps - stamps[0])
+        duration = float(stamps[-1] - stamps[0]) if len(stamps) > 1 else 0.0
+        meta = {
+            "shape": list(self.shape),
+            "frames": len(stamps),
+            "chunk_frames": self.chunk_frames,
+            "chunks": self.chunks,
+            "compressed": self.compress,
+            "fps": (len(stamps) - 1) / duration if duration > 0 else 0.0,
+            "duration": duration,
+            "source": self.source,
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+        }
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def close(self):
+        if self.writer is not None:
+            self._flush()
+            self.jobs.put(None)
+            self.writer.join()
+            self.writer = None
+        self.buffer = None
+        while not self.free.empty():
+            self.free.get()
+        if self.error is not None:
+            raise self.error
+
+
+class RecordingCapture:
+    """包一层 cv2.VideoCapture：读到的每一帧连同读出时刻一起录下来，对调用方完全透明"""
+
+    def __init__(self, cap, path, chunk_frames=None, compress=False, source="摄像头"):
+        self.cap = cap
+        self.recorder = FrameRecorder(path, chunk_frames, compress, source)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        ret, frame = self.cap.read()
+        if ret:
+            self.recorder.write(frame, time.perf_counter())
+        return ret, frame
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.recorder.close()
+        self.cap.release()
+
+
+def load_meta(path):
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Recording:
+    """按帧号随机读取录制文件；npy 分块用 mmap 打开，npz 分块解压后缓存当前这一块"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = load_meta(path)
+        self.timestamps = np.load(os.path.join(path, "timestamps.npy"))
+        self.chunk_frames = self.meta["chunk_frames"]
+        self.chunk_files = sorted(glob.glob(os.path.join(path, "chunk_*.np[yz]")))
+        self.frames = min(len(self.timestamps), self.meta["frames"])
+        self._cached = (None, None)
+
+    def chunk(self, index):
+        if self._cached[0] != index:
+            path = self.chunk_files[index]
+            if path.endswith(".npy"):
+                data = np.load(path, mmap_mode="r")
+            else:
+                with np.load(path) as archive:
+                    data = archive["frames"]
+            self._cached = (index, data)
+        return self._cached[1]
+
+    def frame(self, i):
+        return self.chunk(i // self.chunk_frames)[i % self.chunk_frames]
+
+
+class ReplayCapture:
+    """
+    把录制文件当成摄像头读，接口和 cv2.VideoCapture 一样，DetectionWorker 直接使用。
+    mode="original" 按录制时的时间戳出帧，"fixed" 按固定 fps，"max" 不等待、一帧不丢。
+    前两种模式和真摄像头一样只保留最新帧：处理跟不上时，read 返回已经到时间的最新一帧，中间的记为丢帧。
+    每一帧从"到达时刻"到调用方处理完（frame_done 或下一次 read）的时间记为端到端延迟。
+    """
+
+    def __init__(self, path, mode="original", fps=None, loop=False):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"未知的回放模式: {mode}")
+        self.recording = Recording(path)
+        self.mode = mode
+        self.fps = fps or self.recording.meta.get("fps") or 30.0
+        self.loop = loop
+        self.position = 0
+        self.start = None
+        self.pending = None  # 已经交给调用方、还没处理完的那一帧的到达时刻
+        self.latencies = []
+        self.dropped = 0
+        self.delivered = 0
+        self.finished_at = None
+
+    def arrival(self, i):
+        """第 i 帧相对开始回放的到达时间（秒）"""
+        if self.mode == "original":
+            return float(self.recording.timestamps[i])
+        if self.mode == "fixed":
+            return i / self.fps
+        return 0.0
+
+    def isOpened(self):
+        return self.recording.frames > 0
+
+    def frame_done(self):
+        if self.pending is not None:
+            self.latencies.append(time.perf_counter() - self.pending)
+            self.pending = None
+
+    def read(self, image=None):
+        self.frame_done()
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        total = self.recording.frames
+        if self.position >= total:
+            if not self.loop:
+                self.finished_at = self.finished_at or now
+                return False, None
+            self.position = 0
+            self.start = now
+        i = self.position
+        if self.mode != "max":
+            elapsed = now - self.start
+            # 已经到时间的帧里只取最新的一帧，跳过的都算丢帧
+            while i + 1 < total and self.arrival(i + 1) <= elapsed:
+                i += 1
+            self.dropped += i - self.position
+            wait = self.arrival(i) - elapsed
+            if wait > 0:
+                time.sleep(wait)
+            arrived = self.start + self.arrival(i)
+        else:
+            arrived = now
+        self.position = i + 1
+        self.delivered += 1
+        self.pending = arrived
+        frame = np.array(self.recording.frame(i))  # mmap 上的只读视图复制一份，和摄像头每次读出新数组一样
+        if image is not None:
+            image[:] = frame
+            return True, image
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.recording.meta["shape"][1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.recording.meta["shape"][0]
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0  # 帧数返回 0，DetectionWorker 按摄像头处理，不显示进度条
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.frame_done()
+        self.finished_at = self.finished_at or time.perf_counter()
+
+    def stats(self):
+        wall = (self.finished_at or time.perf_counter()) - (self.start or time.perf_counter())
+        offered = self.delivered + self.dropped
+        lat = [v * 1000 for v in self.latencies]
+        return {
+            "mode": self.mode,
+            "frames": self.recording.frames,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "drop_rate": self.dropped / offered if offered else 0.0,
+            "fps": self.delivered / wall if wall > 0 else 0.0,
+            "latency_mean_ms": sum(lat) / len(lat) if lat else 0.0,
+            "latency_p50_ms": percentile(lat, 50),
+            "latency_p95_ms": percentile(lat, 95),
+            "latency_max_ms": max(lat) if lat else 0.0,
+            "wall_seconds": wall,
+        }
+
+    def stats_text(self):
+        s = self.stats()
+        return (f"回放({s['mode']}) {s['delivered']}/{s['frames']} 帧, 丢帧 {s['dropped']} ({s['drop_rate']:.1%}), "
+                f"延迟 p50 {s['latency_p50_ms']:.0f}ms p95 {s['latency_p95_ms']:.0f}ms")
+
+
+def record_camera(path, camera=0, seconds=30.0, chunk_frames=None, compress=False):
+    cap = RecordingCapture(cv2.VideoCapture(camera), path, chunk_frames, compress, source=f"摄像头 {camera}")
+    if not cap.isOpened():
+        raise RuntimeError("无法打开摄像头")
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < seconds:
+            ret, _ = cap.read()
+            if not ret:
+                break
+    finally:
+        cap.release()
+    return cap.recorder.frames
+
+
+def replay_benchmark(path, model_name, mode="original", fps=None, conf=0.5, iou=0.5, tracker=False):
+    """不开界面，用 DetectionWorker 的同一条处理路径跑一遍录制文件，返回回放统计"""
+    from RunDetector import DetectionWorker
+    from ModelRegistry import default_registry
+    from Tracker import ByteTracker
+    worker = DetectionWorker(default_registry().get(model_name), lambda: (conf, iou, 0.0), "回放", path,
+                             tracker=ByteTracker() if tracker else None, replay_mode=mode, replay_fps=fps)
+    worker.run()  # 直接在当前线程里跑，信号没有连接，只是空发
+    return worker.capture.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="录制摄像头原始帧，或按原速/固定帧率/最快速度回放测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path", help="录制目录，例如 recordings/desk.rec")
+    rec.add_argument("--camera", type=int, default=0)
+    rec.add_argument("--seconds", type=float, default=30.0)
+    rec.add_argument("--chunk", type=int, help="每个分块的帧数，默认按约 64MB 一块计算")
+    rec.add_argument("--compress", action="store_true", help="分块用 npz 压缩（不能 mmap，体积小）")
+    info = sub.add_parser("info")
+    info.add_argument("path")
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("--model", required=True, help="Assets/Model 下的模型名")
+    rep.add_argument("--mode", choices=REPLAY_MODES, default="original")
+    rep.add_argument("--fps", type=float, help="fixed 模式的帧率")
+    rep.add_argument("--track", action="store_true", help="同时开启目标跟踪")
+    rep.add_argument("--output", help="把统计写成 json")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        frames = record_camera(args.path, args.camera, args.seconds, args.chunk, args.compress)
+        print(f"已录制 {frames} 帧到 {args.path}")
+    elif args.command == "info":
+        for key, value in load_meta(args.path).items():
+            print(f"{key}: {value}")
+    else:
+        stats = replay_benchmark(args.path, args.model, args.mode, args.fps, tracker=args.track)
+        for key, value in stats.items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+    sys.exit(0)
@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import http.client
+from urllib.parse import urlsplit, parse_qs, unquote, quote
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from Detections import results_to_detections, detections_to_json
+from ModelRegistry import default_registry
+
+# 延迟直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.total}")
+        return lines
+
+
+class ModelBatcher:
+    """
+    一个模型的动态批处理：请求先进有界队列，批处理协程凑够 max_batch
+    或者等到最早的请求超过 max_latency 就一起推理。队列满了直接拒绝。
+    """
+
+    def __init__(self, name, registry, executor, replicas=1, max_batch=8, max_latency=0.02, max_queue=64):
+        self.name = name
+        self.registry = registry
+        self.executor = executor
+        self.replicas = replicas
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.batch_sizes = Histogram(BATCH_BUCKETS)
+        self.rejected = 0
+        self._tasks = []
+
+    def start(self):
+        # 每个副本一个批处理协程，各自持有一份模型实例
+        for replica in range(self.replicas):
+            self._tasks.append(asyncio.ensure_future(self._batch_loop(replica)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, frame, conf, iou, wait=False):
+        future = asyncio.get_running_loop().create_future()
+        item = (frame, conf, iou, future, time.perf_counter())
+        if wait:
+            await self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                raise QueueFull(self.name)
+        return await future
+
+    async def _collect(self):
+        first = await self.queue.get()
+        batch = [first]
+        deadline = first[4] + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self, replica):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # ultralytics 一次 predict 只能用一组 conf/iou，按参数分组
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[1], item[2]), []).append(item)
+            for (conf, iou), items in groups.items():
+                frames = [item[0] for item in items]
+                try:
+                    outputs = await loop.run_in_executor(self.executor, self._predict, replica, frames, conf, iou)
+                except Exception as e:
+                    for item in items:
+                        if not item[3].done():
+                            item[3].set_exception(e)
+                    continue
+                self.batch_sizes.observe(len(items))
+                now = time.perf_counter()
+                for item, output in zip(items, outputs):
+                    self.latency.observe(now - item[4])
+                    if not item[3].done():
+                        item[3].set_result(output)
+
+    def _predict(self, replica, frames, conf, iou):
+        model = self.registry.get(self.name, replica=replica)
+        results = model.predict(frames, conf=conf, iou=iou, verbose=False)
+        return [detections_to_json(results_to_detections(r)) for r in results]
+
+
+class InferenceServer:
+    def __init__(self, host="127.0.0.1", port=8600, registry=None, replicas=1, max_batch=8,
+                 max_latency=0.02, max_queue=64, max_body=256 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.registry = registry or default_registry()
+        self.replicas = replicas
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_workers=max(2, replicas * 4), thread_name_prefix="infer")
+        self.batchers = {}
+        self.requests = {}
+        self._server = None
+
+    def batcher(self, name):
+        batcher = self.batchers.get(name)
+        if batcher is None:
+            if name not in self.registry.available():
+                return None
+            batcher = ModelBatcher(name, self.registry, self.executor, self.replicas,
+                                   self.max_batch, self.max_latency, self.max_queue)
+            batcher.start()
+            self.batchers[name] = batcher
+        return batcher
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        print(f"推理服务已启动: http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=False)
+
+    # --- HTTP ---
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split(" ", 2)
+        if len(parts) != 3:
+            raise ValueError("请求行格式错误")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise ValueError("Content-Length 不是整数")
+        if length < 0:
+            raise ValueError("Content-Length 不能为负数")
+        if length > self.max_body:
+            raise PayloadTooLarge()
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def count(self, route, status):
+        key = (route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    async def respond(self, writer, status, body, content_type="application/json", route="other"):
+        self.count(route, status)
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await self.read_request(reader)
+            except PayloadTooLarge:
+                await self.respond(writer, 413, {"error": "请求体过大"})
+                return
+            except ValueError as e:
+                await self.respond(writer, 400, {"error": f"请求格式错误: {e}"})
+                return
+            if request is None:
+                return
+            method, target, headers, body = request
+            url = urlsplit(target)
+            path = unquote(url.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            if path == "/metrics" and method == "GET":
+                await self.respond(writer, 200, self.render_metrics().encode("utf-8"),
+                                   "text/plain; version=0.0.4", route="metrics")
+            elif path == "/models" and method == "GET":
+                await self.respond(writer, 200, {"available": self.registry.available(),
+                                                 "loaded": self.registry.loaded()}, route="models")
+            elif path.startswith("/detect/"):
+                await self.handle_detect(writer, method, path[len("/detect/"):], query, body)
+            elif path.startswith("/video/"):
+                await self.handle_video(writer, method, path[len("/video/"):], query, body)
+            else:
+                await self.respond(writer, 404, {"error": "未知接口"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            try:
+                await self.respond(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    def parse_params(self, query):
+        """conf / iou 不是数字时抛 ValueError，由调用方回 400"""
+        return float(query.get("conf", 0.5)), float(query.get("iou", 0.5))
+
+    def write_chunk(self, writer, obj):
+        chunk = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(f"{len(chunk):X}\r\n".encode("latin-1") + chunk + b"\r\n")
+
+    async def handle_detect(self, writer, method, name, query, body):
+        route = "detect"
+        if method != "POST":
+            await self.respond(writer, 405, {"error": "请使用 POST 上传图片"}, route=route)
+            return
+        batcher = self.batcher(name)
+        if batcher is None:
+            await self.respond(writer, 404, {"error": f"模型不存在: {name}"}, route=route)
+            return
+        frame = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            await self.respond(writer, 400, {"error": "无法解码图片"}, route=route)
+            return
+        try:
+            conf, iou = self.parse_params(query)
+        except ValueError:
+            await self.respond(writer, 400, {"error": "conf / iou 必须是数字"}, route=route)
+            return
+        try:
+            detections = await batcher.submit(frame, conf, iou)
+        except QueueFull:
+            await self.respond(writer, 429, {"error": "队列已满，请稍后重试"}, route=route)
+            return
+        await self.respond(writer, 200, {"model": name, "detections": detections}, route=route)
+
+    async def handle_video(self, writer, method, name, query, body):
+        route = "video"
+        if method != "POST":
+            await self.respond(writer, 405, {"error": "请使用 POST 上传视频"}, route=route)
+            return
+        batcher = self.batcher(name)
+        if batcher is None:
+            await self.respond(writer, 404, {"error": f"模型不存在: {name}"}, route=route)
+            return
+        if batcher.queue.full():
+            await self.respond(writer, 429, {"error": "队列已满，请稍后重试"}, route=route)
+            return
+        try:
+            conf, iou = self.parse_params(query)
+            stride = max(1, int(query.get("stride", 1)))
+        except ValueError:
+            await self.respond(writer, 400, {"error": "conf / iou / stride 必须是数字"}, route=route)
+            return
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp4")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        cap = cv2.VideoCapture(tmp_path)
+        try:
+            if not cap.isOpened():
+                await self.respond(writer, 400, {"error": "无法解码视频"}, route=route)
+                return
+            self.count(route, 200)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                         b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+            index = 0
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    ret, frame = await loop.run_in_executor(self.executor, cap.read)
+                    if not ret:
+                        break
+                    if index % stride == 0:
+                        # 视频帧在队列满时等待而不是拒绝，靠有界队列把背压传回解码
+                        detections = await batcher.submit(frame, conf, iou, wait=True)
+                        self.write_chunk(writer, {"frame": index, "detections": detections})
+                        await writer.drain()
+                    index += 1
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # 200 的头已经发出去了，不能再回一个完整的 500：用一行错误结束这个流
+                self.count(route, 500)
+                self.write_chunk(writer, {"frame": index, "error": str(e)})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            cap.release()
+            os.remove(tmp_path)
+
+    def render_metrics(self):
+        lines = ["# TYPE yolo_requests_total counter"]
+        for (route, status), count in sorted(self.requests.items()):
+            lines.append(f'yolo_requests_total{{route="{route}",status="{status}"}} {count}')
+        lines.append("# TYPE yolo_queue_depth gauge")
+        for name, batcher in self.batchers.items():
+            lines.append(f'yolo_queue_depth{{model="{name}"}} {batcher.queue.qsize()}')
+        lines.append("# TYPE yolo_rejected_total counter")
+        for name, batcher in self.batchers.items():
+            lines.append(f'yolo_rejected_total{{model="{name}"}} {batcher.rejected}')
+        lines.append("# TYPE yolo_request_latency_seconds histogram")
+        for name, batcher in self.batchers.items():
+            lines += batcher.latency.render("yolo_request_latency_seconds", f'model="{name}"')
+        lines.append("# TYPE yolo_batch_size histogram")
+        for name, batcher in self.batchers.items():
+            lines += batcher.batch_sizes.render("yolo_batch_size", f'model="{name}"')
+        return "\n".join(lines) + "\n"
+
+
+class InferenceClient:
+    """本地测试用的简单客户端"""
+
+    def __init__(self, host="127.0.0.1", port=8600, timeout=60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn.request(method, path, body=body)
+        return conn, conn.getresponse()
+
+    def models(self):
+        conn, resp = self._request("GET", "/models")
+        try:
+            return json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def metrics(self):
+        conn, resp = self._request("GET", "/metrics")
+        try:
+            return resp.read().decode("utf-8")
+        finally:
+            conn.close()
+
+    def detect(self, model, image_path, conf=0.5, iou=0.5):
+        """返回 (状态码, 响应 JSON)"""
+        with open(image_path, "rb") as f:
+            body = f.read()
+        conn, resp = self._request("POST", f"/detect/{quote(model)}?conf={conf}&iou={iou}", body)
+        try:
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def stream_video(self, model, video_path, conf=0.5, iou=0.5, stride=1):
+        """逐帧产出检测结果"""
+        with open(video_path, "rb") as f:
+            body = f.read()
+        conn, resp = self._request("POST", f"/video/{quote(model)}?conf={conf}&iou={iou}&stride={stride}", body)
+        try:
+            if resp.status != 200:
+                raise RuntimeError(f"{resp.status}: {resp.read().decode('utf-8', 'replace')}")
+            for line in resp:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO 本地推理服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--replicas", type=int, default=1, help="每个模型加载几份实例")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-latency-ms", type=float, default=20, help="凑批最多等待的毫秒数")
+    parser.add_argument("--max-queue", type=int, default=64, help="每个模型的排队上限，超过返回 429")
+    parser.add_argument("--preload", nargs="*", default=[], help="启动时预加载的模型名")
+    args = parser.parse_args()
+
+    server = InferenceServer(args.host, args.port, replicas=args.replicas, max_batch=args.max_batch,
+                             max_latency=args.max_latency_ms / 1000.0, max_queue=args.max_queue)
+    for model_name in args.preload:
+        for i in range(args.replicas):
+            server.registry.get(model_name, replica=i)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        sys.exit(0)
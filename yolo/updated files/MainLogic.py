@@ -1,12 +1,22 @@
 import os
+import time
 import cv2
 import PyQt5
 from RunDetector import DetectionWorker
-from PyQt5 import uic, QtWidgets
-from PyQt5.QtWidgets import QMessageBox, QFileDialog, QDockWidget
-from PyQt5.QtGui import QImage, QPixmap, QIcon
+from MotionGate import MotionGate, RoiSelector, draw_roi
+from Tracker import ByteTracker
+from ModelRegistry import default_registry
+from MetricsCache import MetricsCache
+from MetricsService import safe_name
+from QualityController import QualityController, MULTI_STREAM_LADDERS
+from ResourceMonitor import ResourceMonitor, MB
+from Renderer import default_renderer
+from VideoIndex import VideoIndex
+from UiCache import load_ui
+from PyQt5 import QtWidgets
+from PyQt5.QtWidgets import QMessageBox, QFileDialog, QDockWidget, QInputDialog
+from PyQt5.QtGui import QImage, QPixmap, QIcon, QKeySequence
 from PyQt5.QtCore import Qt
-from ultralytics import YOLO
 
 dirname = os.path.dirname(PyQt5.__file__)
 qt_dir = os.path.join(dirname, 'Qt5', 'plugins', 'platforms')
@@ -15,10 +25,16 @@ os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = qt_dir
 class LogicMixin(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
-        uic.loadUi("./Assets/UI/DetectorGUI.ui", self)
+        load_ui("./Assets/UI/DetectorGUI.ui", self)
 
         self.last_frame = None
+        self.source_size = None  # 上一次检测的原始帧大小，last_frame 是缩放后的显示帧
         self.model = None
+        self.model_name = None
+        self.extra_models = {}  # 并行检测的附加模型 name -> YOLO
+        self.cascade_models = []  # (name, YOLO, 上游模型名, 上游类别)
+        self.roi_points = []
+        self.gate_stats = ""
         self.file_path = None
         self.filePath = None
         self.input_type = None
@@ -101,8 +117,89 @@ class LogicMixin(QtWidgets.QMainWindow):
         self.viewMenu.settingDockAction.triggered.connect(self.toggle_setting_dock)
         self.viewMenu.tabDockAction.triggered.connect(self.toggle_tab_dock)
 
+        # --- 性能指标页：解析结果和缩放好的曲线图都走缓存 ---
+        self.metrics_cache = MetricsCache(self)
+        self.metrics_cache.image_ready.connect(self.on_metric_image_ready)
         self.modelCombo_5.currentTextChanged.connect(self.update_metric_display)
-
+        self.modelCombo_5.currentTextChanged.connect(self.update_metric_image)
+        self.comboBox_2.currentTextChanged.connect(self.update_metric_image)
+        self.metrics_cache.prerender(self.model_choices(), self.curve_choices(), self.label.size())
+
+        # --- 多模型菜单 ---
+        self.multiModelMenu = self.menubar.addMenu("多模型")
+        self.multiModelMenu.addAction("添加并行模型...").triggered.connect(self.add_parallel_model)
+        self.multiModelMenu.addAction("添加级联模型...").triggered.connect(self.add_cascade_model)
+        self.multiModelMenu.addAction("清除附加模型").triggered.connect(self.clear_extra_models)
+
+        # --- 运动门控 / ROI 菜单 ---
+        self.roi_selector = RoiSelector(self.videoLabel, self.current_frame_size, self)
+        self.roi_selector.roi_changed.connect(self.on_roi_changed)
+        self.gateMenu = self.menubar.addMenu("运动门控")
+        self.motionGateAction = self.gateMenu.addAction("静止画面跳过检测")
+        self.motionGateAction.setCheckable(True)
+        self.gateMenu.addAction("绘制 ROI（左键加点，右键结束）").triggered.connect(self.roi_selector.start)
+        self.gateMenu.addAction("清除 ROI").triggered.connect(lambda: self.on_roi_changed([]))
+
+        # --- 目标跟踪菜单 ---
+        self.detect_interval = 1
+        self.trackMenu = self.menubar.addMenu("目标跟踪")
+        self.trackAction = self.trackMenu.addAction("启用跟踪（按 ID 去重计数）")
+        self.trackAction.setCheckable(True)
+        self.trackMenu.addAction("检测间隔...").triggered.connect(self.set_detect_interval)
+
+        # --- 多路视频菜单 ---
+        self.streamMenu = self.menubar.addMenu("多路视频")
+        self.streamMenu.addAction("打开多路视频...").triggered.connect(self.run_multi_stream)
+
+        # --- 监视文件夹：增量检测持续上传的图片 ---
+        self.watchMenu = self.menubar.addMenu("监视文件夹")
+        self.watchMenu.addAction("选择文件夹并开始监视...").triggered.connect(self.run_watch_folder)
+
+        # --- 录制与回放：摄像头画面录下来，之后在没有摄像头的机器上按原节奏复现 ---
+        self.replay = ("original", None)
+        self.recordMenu = self.menubar.addMenu("录制与回放")
+        self.recordAction = self.recordMenu.addAction("检测摄像头时录制原始帧")
+        self.recordAction.setCheckable(True)
+        self.recordMenu.addAction("打开录制文件回放...").triggered.connect(self.select_replay)
+
+        # --- 性能菜单：自适应画质 / 多进程解码 ---
+        self.adaptive_target = None  # None 或 ("fps" / "latency", 目标值)
+        self.operating_point = ""
+        self.shared_decoders = 0
+        self.perfMenu = self.menubar.addMenu("性能")
+        self.perfMenu.addAction("自适应画质：目标 FPS...").triggered.connect(lambda: self.set_adaptive_target("fps"))
+        self.perfMenu.addAction("自适应画质：目标 p95 延迟...").triggered.connect(
+            lambda: self.set_adaptive_target("latency"))
+        self.perfMenu.addAction("关闭自适应画质").triggered.connect(lambda: self.set_adaptive_target(None))
+        self.perfMenu.addAction("视频多进程解码...").triggered.connect(self.set_shared_decoders)
+
+        # --- 资源监控：长时间运行时查内存增长 ---
+        self.frames_emitted = 0  # 工作线程发出的帧数（在工作线程里计数）
+        self.frames_shown = 0  # 界面实际显示的帧数，两者之差是积压在 Qt 事件队列里的帧
+        self.resource_monitor = ResourceMonitor()
+        self.resource_monitor.register("pending_frames", lambda: self.frames_emitted - self.frames_shown)
+        self.resource_monitor.register("sprite_cache", lambda: len(default_renderer().sprites))
+        self.resource_monitor.register("tracked_ids", self.tracked_id_count)
+        self.perfMenu.addSeparator()
+        self.monitorAction = self.perfMenu.addAction("资源监控")
+        self.monitorAction.setCheckable(True)
+        self.monitorAction.toggled.connect(self.toggle_resource_monitor)
+        self.perfMenu.addAction("导出诊断包...").triggered.connect(self.export_diagnostics)
+
+        # --- 视频索引：检测过的视频按类别跳转，进度条下面显示目标密度 ---
+        self.video_index = None
+        self.seek_label = None  # 按类别跳转时的类别，None 表示不筛选
+        self.heatmapLabel = QtWidgets.QLabel(self)
+        self.heatmapLabel.setFixedHeight(8)
+        self.heatmapLabel.setScaledContents(True)
+        self.verticalLayout_3.insertWidget(self.verticalLayout_3.indexOf(self.videoProgressSlider) + 1,
+                                           self.heatmapLabel)
+        self.heatmapLabel.hide()
+        self.indexMenu = self.menubar.addMenu("视频索引")
+        self.indexMenu.addAction("按类别跳转...").triggered.connect(self.select_seek_label)
+        self.indexMenu.addAction("下一处", lambda: self.seek_occurrence(True), QKeySequence("Ctrl+Right"))
+        self.indexMenu.addAction("上一处", lambda: self.seek_occurrence(False), QKeySequence("Ctrl+Left"))
+        self.indexMenu.addAction("跳到最密集的片段").triggered.connect(self.seek_densest)
 
     def toggle_setting_dock(self):
         if self.settingDock.isVisible():
@@ -122,18 +219,215 @@ class LogicMixin(QtWidgets.QMainWindow):
 
     def load_model(self):
         try:
-            model_name = "Assets/Model/" + self.modelCombo_5.currentText() + ".pt"
-            self.model = YOLO(model_name)
+            model_name = default_registry().path(self.modelCombo_5.currentText())
+            self.model = default_registry().get(self.modelCombo_5.currentText())
+            self.model_name = self.modelCombo_5.currentText()
             self.statusbar.showMessage(f"模型加载成功: {model_name}")
             self.update_metric_display(self.modelCombo_5.currentText())
+            self.update_metric_image()
+            self.load_video_index()
+        except Exception as e:
+            self.statusbar.showMessage(f"错误: {str(e)}")
+            self.model = None
 
-            self.modelCombo_5.currentTextChanged.connect(self.update_metric_image)
-            self.comboBox_2.currentTextChanged.connect(self.update_metric_image)
+    def model_choices(self):
+        return [self.modelCombo_5.itemText(i) for i in range(self.modelCombo_5.count())]
 
+    def add_parallel_model(self):
+        if self.model is None:
+            QMessageBox.warning(self, "警告", "请先加载主模型！")
+            return
+        choices = [name for name in self.model_choices() if name != self.model_name and name not in self.extra_models]
+        name, ok = QInputDialog.getItem(self, "添加并行模型", "模型：", choices, 0, False)
+        if not ok or not name:
+            return
+        try:
+            self.extra_models[name] = default_registry().get(name)
+            self.statusbar.showMessage(f"已添加并行模型: {name}")
+        except Exception as e:
+            self.statusbar.showMessage(f"错误: {str(e)}")
 
+    def add_cascade_model(self):
+        if self.model is None:
+            QMessageBox.warning(self, "警告", "请先加载主模型！")
+            return
+        name, ok = QInputDialog.getItem(self, "添加级联模型", "在检测框内运行的模型：", self.model_choices(), 0, False)
+        if not ok or not name:
+            return
+        parents = [self.model_name] + list(self.extra_models.keys())
+        parent, ok = QInputDialog.getItem(self, "添加级联模型", "上游模型：", parents, 0, False)
+        if not ok or not parent:
+            return
+        classes, ok = QInputDialog.getText(self, "添加级联模型", "上游类别（逗号分隔，留空表示全部）：")
+        if not ok:
+            return
+        parent_classes = [c.strip() for c in classes.split(",") if c.strip()]
+        try:
+            self.cascade_models.append((name, default_registry().get(name), parent, parent_classes))
+            self.statusbar.showMessage(f"已添加级联模型: {parent} -> {name}")
         except Exception as e:
             self.statusbar.showMessage(f"错误: {str(e)}")
-            self.model = None
+
+    def clear_extra_models(self):
+        self.extra_models.clear()
+        self.cascade_models.clear()
+        self.statusbar.showMessage("已清除附加模型")
+
+    def build_pipeline(self):
+        if not self.extra_models and not self.cascade_models:
+            return None
+        from MultiModelPipeline import MultiModelPipeline  # 需要 torch，只在多模型时导入
+        pipeline = MultiModelPipeline({self.model_name: self.model})
+        for name, model in self.extra_models.items():
+            pipeline.add_model(name, model)
+        for name, model, parent, parent_classes in self.cascade_models:
+            if parent in pipeline.models:
+                pipeline.add_cascade(f"{parent}>{name}", model, parent, parent_classes)
+        return pipeline
+
+    def current_frame_size(self):
+        # 检测时显示的是缩到显示尺寸的帧，ROI 坐标要按原始帧算
+        if self.worker is not None and self.worker.source_size is not None:
+            return self.worker.source_size
+        if self.source_size is not None:
+            return self.source_size
+        if self.last_frame is None:
+            return None
+        h, w = self.last_frame.shape[:2]
+        return w, h
+
+    def on_roi_changed(self, points):
+        self.roi_points = points
+        if self.worker and self.worker.motion_gate is not None:
+            # 画完才生效，画的过程中不打断检测
+            if not self.roi_selector.active:
+                self.worker.motion_gate.set_roi(points)
+        if self.last_frame is not None:
+            self.display_image(self.last_frame)
+
+    def build_motion_gate(self):
+        enabled = self.motionGateAction.isChecked()
+        if not enabled and not self.roi_points:
+            return None
+        gate = MotionGate(enabled=enabled)
+        gate.set_roi(self.roi_points)
+        return gate
+
+    def set_detect_interval(self):
+        value, ok = QInputDialog.getInt(self, "检测间隔", "每隔几帧检测一次（中间帧只做跟踪）：",
+                                        self.detect_interval, 1, 30)
+        if ok:
+            self.detect_interval = value
+            self.trackAction.setChecked(True)
+            if self.worker:
+                self.worker.detect_interval = value
+
+    def set_adaptive_target(self, mode):
+        if mode is None:
+            self.adaptive_target = None
+            self.operating_point = ""
+            self.statusbar.showMessage("已关闭自适应画质（下次检测生效）")
+            return
+        if mode == "fps":
+            value, ok = QInputDialog.getDouble(self, "自适应画质", "目标 FPS：", 25, 1, 240, 1)
+        else:
+            value, ok = QInputDialog.getDouble(self, "自适应画质", "目标 p95 延迟（毫秒）：", 100, 5, 5000, 0)
+        if ok:
+            self.adaptive_target = (mode, value)
+            self.statusbar.showMessage("自适应画质已设置（下次检测生效）")
+
+    def build_controller(self, ladders=None):
+        """ladders 按目标类型（fps / latency）给出工作点列表，不给时用默认的"""
+        if self.adaptive_target is None:
+            return None
+        mode, value = self.adaptive_target
+        return QualityController(mode, value, ladder=(ladders or {}).get(mode))
+
+    def set_shared_decoders(self):
+        value, ok = QInputDialog.getInt(self, "多进程解码", "视频文件的解码进程数（0 表示不用）：",
+                                        self.shared_decoders, 0, 16)
+        if ok:
+            self.shared_decoders = value
+
+    def on_operating_point(self, text):
+        self.operating_point = text
+
+    def tracked_id_count(self):
+        tracker = getattr(self.worker, "tracker", None)
+        return sum(len(ids) for ids in tracker.seen.values()) if tracker is not None else 0
+
+    def toggle_resource_monitor(self, enabled):
+        if enabled:
+            self.resource_monitor.start()
+            self.statusbar.showMessage("资源监控已开启（开启期间 tracemalloc 会让内存分配变慢一些）")
+        else:
+            self.resource_monitor.stop()
+            self.statusbar.showMessage("资源监控已关闭")
+
+    def export_diagnostics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出诊断包", "diagnostics.zip", "Zip 文件 (*.zip)")
+        if not path:
+            return
+        state = {
+            "model": self.model_name,
+            "input_type": self.input_type,
+            "path": self.filePath or self.file_path,
+            "detecting": self.worker is not None,
+            "adaptive_target": self.adaptive_target,
+            "operating_point": self.operating_point,
+            "detect_interval": self.detect_interval,
+            "shared_decoders": self.shared_decoders,
+            "frames_emitted": self.frames_emitted,
+            "frames_shown": self.frames_shown,
+        }
+        try:
+            self.statusbar.showMessage(f"诊断包已保存：{self.resource_monitor.write_bundle(path, state)}")
+        except Exception as e:
+            QMessageBox.critical(self, "导出失败", str(e))
+
+    def count_emitted(self, _frame):
+        self.frames_emitted += 1
+
+    def show_worker_frame(self, frame):
+        self.frames_shown += 1
+        self.display_image(frame)
+
+    def update_fps_label(self, fps):
+        text = f"FPS: {fps:.2f}"
+        if self.operating_point:
+            text += f"  {self.operating_point}"
+        latest = self.resource_monitor.latest if self.resource_monitor.running else None
+        if latest:
+            text += f"  RSS {latest['rss'] / MB:.0f}MB"
+            if self.resource_monitor.growing():
+                text += "（持续增长）"
+        if self.gate_stats:
+            text += f"    {self.gate_stats}"
+        self.FPS.setText(text)
+
+    def select_replay(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择录制目录（*.rec）", "recordings")
+        if not folder:
+            return
+        if not os.path.exists(os.path.join(folder, "meta.json")):
+            QMessageBox.warning(self, "错误", "不是录制目录（缺少 meta.json）")
+            return
+        modes = {"按录制时的节奏": "original", "固定帧率": "fixed", "最快（不丢帧）": "max"}
+        label, ok = QInputDialog.getItem(self, "回放", "出帧方式：", list(modes), 0, False)
+        if not ok:
+            return
+        fps = None
+        if modes[label] == "fixed":
+            fps, ok = QInputDialog.getDouble(self, "回放", "帧率：", 30, 1, 240, 1)
+            if not ok:
+                return
+        self.replay = (modes[label], fps)
+        self.input_type = "回放"
+        self.filePath = folder
+        self.file_path = None
+        self.detectBtn_5.setEnabled(True)
+        self.load_video_index()
+        self.statusbar.showMessage(f"已加载录制: {os.path.basename(folder)}（{label}）")
 
     def select_file(self, input_type):
         try:
@@ -146,6 +440,7 @@ class LogicMixin(QtWidgets.QMainWindow):
                     if frame is not None:
                         self.file_path = file
                         self.filePath = None
+                        self.source_size = None  # 换了输入源，ROI 按新的帧大小换算
                         self.detectBtn_5.setEnabled(True)
                         self.statusbar.showMessage(f"已加载图片: {os.path.basename(file)}")
                         self.display_image(frame)
@@ -154,6 +449,7 @@ class LogicMixin(QtWidgets.QMainWindow):
                 if file:
                     self.filePath = file
                     self.file_path = None
+                    self.source_size = None
                     self.detectBtn_5.setEnabled(True)
                     cap = cv2.VideoCapture(file)
                     ret, frame = cap.read()
@@ -164,17 +460,25 @@ class LogicMixin(QtWidgets.QMainWindow):
             elif input_type == "摄像头":
                 self.filePath = None
                 self.file_path = None
+                self.source_size = None
                 self.detectBtn_5.setEnabled(True)
                 self.statusbar.showMessage("准备使用摄像头")
+            self.load_video_index()
         except Exception as e:
             QMessageBox.critical(self, "文件选择失败", str(e))
 
     def display_image(self, cv_img):
         try:
-            self.last_frame = cv_img.copy()
+            # 工作线程每帧发出的都是新画好的图，不会再被改写，直接保存引用，不用每帧再复制一份
+            self.last_frame = cv_img
             rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
             h, w, ch = rgb_image.shape
             bytes_per_line = ch * w
+            if self.roi_points:
+                source = self.current_frame_size()
+                scale = w / source[0] if source else 1.0
+                points = [(x * scale, y * scale) for x, y in self.roi_points]
+                draw_roi(rgb_image, points, closed=not self.roi_selector.active)
             qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
             self.videoLabel.setPixmap(QPixmap.fromImage(qt_image).scaled(
                 self.videoLabel.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
@@ -191,6 +495,8 @@ class LogicMixin(QtWidgets.QMainWindow):
         self.resizeDocks([self.settingDock], [new_setting_height], Qt.Vertical)
         self.resizeDocks([self.tabDock], [new_tab_width], Qt.Horizontal)
         self.resizeDocks([self.tabDock], [new_tab_height], Qt.Vertical)
+        if self.worker is not None:
+            self.worker.display_size = (self.videoLabel.width(), self.videoLabel.height())
         if self.last_frame is not None:
             self.display_image(self.last_frame)
 
@@ -207,16 +513,117 @@ class LogicMixin(QtWidgets.QMainWindow):
         def get_current_params():
             return self.confSpin_5.value(), self.loUSpinBox_5.value(), self.delaySpinBox_5.value()
 
-        self.worker = DetectionWorker(self.model, get_current_params, self.input_type, path)
-        self.worker.frame_processed.connect(self.display_image)
+        record_path = None
+        if self.input_type == "摄像头" and self.recordAction.isChecked():
+            record_path = os.path.join("recordings", time.strftime("camera_%Y%m%d_%H%M%S.rec"))
+
+        if self.input_type == "视频":
+            # 同一视频、同一组模型接着上次的索引往里加，跳过的片段这次补上
+            self.video_index = VideoIndex.open(path, self.index_key())
+
+        self.gate_stats = ""
+        self.worker = DetectionWorker(self.model, get_current_params, self.input_type, path,
+                                      pipeline=self.build_pipeline(), motion_gate=self.build_motion_gate(),
+                                      tracker=ByteTracker() if self.trackAction.isChecked() else None,
+                                      detect_interval=self.detect_interval, controller=self.build_controller(),
+                                      shared_decoders=self.shared_decoders, record_path=record_path,
+                                      replay_mode=self.replay[0], replay_fps=self.replay[1],
+                                      video_index=self.video_index if self.input_type == "视频" else None)
+        self.worker.display_size = (self.videoLabel.width(), self.videoLabel.height())
+        self.operating_point = ""
+        self.worker.operating_point_updated.connect(self.on_operating_point)
+        self.worker.frame_processed.connect(self.count_emitted, Qt.DirectConnection)
+        self.worker.frame_processed.connect(self.show_worker_frame)
         self.worker.result_updated.connect(lambda text: self.resultDisplay.setText(text))
-        self.worker.fps_updated.connect(lambda fps: self.FPS.setText(f"FPS: {fps:.2f}"))
+        self.worker.fps_updated.connect(self.update_fps_label)
+        self.worker.stats_updated.connect(lambda text: setattr(self, "gate_stats", text))
         self.worker.progress_updated.connect(self.update_progress_slider)
         self.worker.finished.connect(self.on_worker_finished)
 
         self.worker.start()
         self.detectBtn_5.setEnabled(False)
-        self.statusbar.showMessage("检测中...")
+        self.statusbar.showMessage(f"检测中...（录制到 {record_path}）" if record_path else "检测中...")
+        self.is_paused = False
+        self.detection_started = True
+
+    def run_multi_stream(self):
+        if self.model is None:
+            QMessageBox.warning(self, "警告", "请先加载模型！")
+            return
+        if self.worker and self.worker.isRunning():
+            QMessageBox.information(self, "提示", "检测已在运行中")
+            return
+        text, ok = QInputDialog.getMultiLineText(
+            self, "多路视频", "每行一个视频源：摄像头编号、视频文件，或 “rtsp://地址 | 替代用的本地文件”")
+        sources = [line.strip() for line in text.splitlines() if line.strip()] if ok else []
+        if not sources:
+            return
+        batch, ok = QInputDialog.getInt(self, "多路视频", "每批最多几帧：", min(len(sources), 4), 1, 32)
+        if not ok:
+            return
+        fps_cap, ok = QInputDialog.getDouble(self, "多路视频", "每路帧率上限（0 表示不限）：", 0, 0, 120, 1)
+        if not ok:
+            return
+
+        from MultiStream import MultiStreamWorker
+
+        def get_current_params():
+            return self.confSpin_5.value(), self.loUSpinBox_5.value(), self.delaySpinBox_5.value()
+
+        self.gate_stats = ""
+        self.roi_points = []
+        self.worker = MultiStreamWorker(self.model, get_current_params, sources, max_batch=batch,
+                                        fps_cap=fps_cap or None, controller=self.build_controller(MULTI_STREAM_LADDERS))
+        self.worker.display_size = (self.videoLabel.width(), self.videoLabel.height())
+        self.operating_point = ""
+        self.worker.operating_point_updated.connect(self.on_operating_point)
+        self.worker.frame_processed.connect(self.count_emitted, Qt.DirectConnection)
+        self.worker.frame_processed.connect(self.show_worker_frame)
+        self.worker.result_updated.connect(lambda text: self.resultDisplay.setText(text))
+        self.worker.fps_updated.connect(self.update_fps_label)
+        self.worker.stats_updated.connect(lambda text: setattr(self, "gate_stats", text))
+        self.worker.finished.connect(self.on_worker_finished)
+
+        self.worker.start()
+        self.detectBtn_5.setEnabled(False)
+        self.statusbar.showMessage(f"多路检测中（{len(sources)} 路）...")
+        self.is_paused = False
+        self.detection_started = True
+
+    def run_watch_folder(self):
+        if self.model is None:
+            QMessageBox.warning(self, "警告", "请先加载模型！")
+            return
+        if self.worker and self.worker.isRunning():
+            QMessageBox.information(self, "提示", "检测已在运行中")
+            return
+        folder = QFileDialog.getExistingDirectory(self, "选择要监视的文件夹")
+        if not folder:
+            return
+
+        from WatchFolder import WatchFolderWorker, model_version
+
+        def get_current_params():
+            return self.confSpin_5.value(), self.loUSpinBox_5.value(), self.delaySpinBox_5.value()
+
+        # 清单按模型版本记录，换了权重的同名模型会把文件夹重新检测一遍
+        version = model_version(default_registry().path(self.model_name), self.model_name)
+        self.gate_stats = ""
+        self.roi_points = []
+        self.worker = WatchFolderWorker(self.model, get_current_params, folder, version)
+        self.worker.display_size = (self.videoLabel.width(), self.videoLabel.height())
+        self.operating_point = ""
+        self.worker.frame_processed.connect(self.count_emitted, Qt.DirectConnection)
+        self.worker.frame_processed.connect(self.show_worker_frame)
+        self.worker.result_updated.connect(lambda text: self.resultDisplay.setText(text))
+        self.worker.fps_updated.connect(self.update_fps_label)
+        self.worker.stats_updated.connect(lambda text: setattr(self, "gate_stats", text))
+        self.worker.progress_updated.connect(self.update_progress_slider)
+        self.worker.finished.connect(self.on_worker_finished)
+
+        self.worker.start()
+        self.detectBtn_5.setEnabled(False)
+        self.statusbar.showMessage(f"正在监视文件夹：{folder}")
         self.is_paused = False
         self.detection_started = True
 
@@ -239,114 +646,180 @@ class LogicMixin(QtWidgets.QMainWindow):
         self.detectBtn_5.setEnabled(True)
         self.stopBtn.setIcon(QIcon("./Assets/Picture/stop.png"))
         self.statusbar.showMessage("检测结束")
+        if self.worker is not None:
+            self.source_size = self.worker.source_size
         self.worker = None
+        self.update_heatmap()
         self.is_paused = False
         self.detection_started = False
 
     def update_progress_slider(self, current, total):
         self.videoProgressSlider.setMaximum(total)
         self.videoProgressSlider.setValue(current)
+        if self.video_index is not None and current % 150 == 0:
+            self.update_heatmap()
 
     def forward_video(self):
-        if self.worker:
+        if self.seek_label is not None:
+            self.seek_occurrence(True)
+        elif self.worker:
             self.worker.target_frame_index = self.worker.current_frame_index + 10
 
     def backward_video(self):
-        if self.worker:
+        if self.seek_label is not None:
+            self.seek_occurrence(False)
+        elif self.worker:
             self.worker.target_frame_index = max(0, self.worker.current_frame_index - 10)
 
     def slider_released(self):
+        frame = self.videoProgressSlider.value()
+        if self.seek_label is not None and self.video_index is not None:
+            # 按类别筛选时拖到哪里都对齐到最近一次出现的位置
+            frame = self.video_index.nearest(self.seek_label, frame)
+            if frame is None:
+                return
+        self.seek_to(frame)
+
+    # --- 视频索引 ---
+    def index_key(self):
+        """索引按模型组合区分，并行/级联模型检测出的类别名带着来源前缀"""
+        names = [self.model_name] + list(self.extra_models) + [f"{p}>{n}" for n, _, p, _ in self.cascade_models]
+        return "+".join(names)
+
+    def load_video_index(self):
+        """选中的视频用当前模型检测过时读出索引，进度条可以直接跳转，下面显示密度"""
+        self.video_index = None
+        self.seek_label = None
+        if self.input_type == "视频" and self.filePath and self.model_name:
+            self.video_index = VideoIndex.find(self.filePath, self.index_key())
+        if self.video_index is not None:
+            self.videoProgressSlider.setMaximum(self.video_index.total_frames)
+            self.statusbar.showMessage(self.video_index.summary().replace("\n", "；"))
+        self.update_heatmap()
+
+    def update_heatmap(self):
+        if self.video_index is None:
+            self.heatmapLabel.hide()
+            return
+        strip = self.video_index.heatmap(self.seek_label, max(self.heatmapLabel.width(), 200), 8)
+        rgb = cv2.cvtColor(strip, cv2.COLOR_BGR2RGB)
+        h, w = rgb.shape[:2]
+        self.heatmapLabel.setPixmap(QPixmap.fromImage(QImage(rgb.data, w, h, w * 3, QImage.Format_RGB888).copy()))
+        self.heatmapLabel.show()
+
+    def current_video_frame(self):
+        if self.worker is not None and self.input_type == "视频":
+            return max(0, self.worker.current_frame_index - 1)  # current_frame_index 是下一帧
+        return self.videoProgressSlider.value()
+
+    def seek_to(self, frame):
+        """检测进行中时交给工作线程跳转；已经结束时只解码这一帧显示出来，不再推理"""
         if self.worker:
-            self.worker.target_frame_index = self.videoProgressSlider.value()
+            self.worker.target_frame_index = frame
+            return
+        if self.input_type != "视频" or not self.filePath:
+            return
+        cap = cv2.VideoCapture(self.filePath)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        ret, image = cap.read()
+        cap.release()
+        if ret:
+            self.display_image(image)
+        self.videoProgressSlider.setValue(frame)
+
+    def select_seek_label(self):
+        if self.video_index is None:
+            QMessageBox.information(self, "提示", "当前视频还没有用这个模型检测过，没有索引")
+            return
+        labels = sorted(self.video_index.labels, key=self.video_index.frame_count, reverse=True)
+        items = ["（不筛选）"] + [f"{label}  {len(self.video_index.intervals(label))} 段" for label in labels]
+        item, ok = QInputDialog.getItem(self, "按类别跳转", "类别：", items, 0, False)
+        if not ok:
+            return
+        self.seek_label = None if item == items[0] else labels[items.index(item) - 1]
+        self.update_heatmap()
+        if self.seek_label is not None:
+            self.seek_occurrence(True)
+
+    def seek_occurrence(self, forward):
+        if self.video_index is None or self.seek_label is None:
+            return
+        current = self.current_video_frame()
+        if forward:
+            frame = self.video_index.next_occurrence(self.seek_label, current)
+        else:
+            frame = self.video_index.prev_occurrence(self.seek_label, current)
+        if frame is None:
+            self.statusbar.showMessage(f"{'后面' if forward else '前面'}没有 {self.seek_label} 了")
+            return
+        self.seek_to(frame)
+        self.statusbar.showMessage(f"{self.seek_label}：第 {frame} 帧（{frame / self.video_index.fps:.1f}s）")
+
+    def seek_densest(self):
+        if self.video_index is None:
+            return
+        frame = self.video_index.densest(self.seek_label)
+        if frame is not None:
+            self.seek_to(frame)
+            self.statusbar.showMessage(f"最密集的片段从 {frame / self.video_index.fps:.1f}s 开始")
 
     def closeEvent(self, event):
         if self.worker:
             self.worker.stop()
             self.worker.wait()
+        self.metrics_cache.close()
+        self.resource_monitor.stop()
         event.accept()
 
     def update_metric_display(self, model_name: str):
-        """根据模型名读取 mAP.txt 并更新到四个 QTextBrowser，仅显示冒号后的值"""
-        safe_name = model_name.replace(" ", "_")
-        txt_path = os.path.join("Assets", "data", safe_name, "mAP.txt")
-
-        if not os.path.exists(txt_path):
-            self.textBrowser_6.setPlainText("N/A")
-            self.textBrowser_7.setPlainText("N/A")
-            self.textBrowser_8.setPlainText("N/A")
-            self.textBrowser_9.setPlainText("N/A")
-            return
-
+        """根据模型名取 mAP.txt 的解析结果并更新到四个 QTextBrowser，仅显示冒号后的值"""
+        browsers = [self.textBrowser_6, self.textBrowser_7, self.textBrowser_8, self.textBrowser_9]
         try:
-            with open(txt_path, "r", encoding="utf-8") as f:
-                lines = [line.strip() for line in f.readlines()]
-
-            def extract_value(line):
-                return line.split(":", 1)[1].strip() if ":" in line else "N/A"
-
-            self.textBrowser_6.setPlainText(extract_value(lines[0]) if len(lines) > 0 else "N/A")
-            self.textBrowser_7.setPlainText(extract_value(lines[1]) if len(lines) > 1 else "N/A")
-            self.textBrowser_8.setPlainText(extract_value(lines[2]) if len(lines) > 2 else "N/A")
-            self.textBrowser_9.setPlainText(extract_value(lines[3]) if len(lines) > 3 else "N/A")
-
-            self.update_result_list(model_name)
-
-
+            data = self.metrics_cache.metrics(model_name)
         except Exception as e:
-            self.textBrowser_6.setPlainText("读取错误")
-            self.textBrowser_7.setPlainText("读取错误")
-            self.textBrowser_8.setPlainText("读取错误")
+            for browser in browsers[:3]:
+                browser.setPlainText("读取错误")
             self.textBrowser_9.setPlainText(str(e))
+            return
 
+        if data is None:
+            for browser in browsers:
+                browser.setPlainText("N/A")
+            self.listWidget.clear()
+            return
 
-    def update_result_list(self, model_name: str):
-        """读取模型目录中的 result.txt 文件，并更新 listWidget"""
-        safe_name = model_name.replace(" ", "_")
-        txt_path = os.path.join("Assets", "data", safe_name, "table.txt")
+        for browser, value in zip(browsers, data["values"]):
+            browser.setPlainText(value)
+        self.update_result_list(model_name)
 
+    def update_result_list(self, model_name: str):
+        """用缓存里的 table.txt 内容更新 listWidget"""
         self.listWidget.clear()
+        data = self.metrics_cache.metrics(model_name)
+        if data:
+            self.listWidget.addItems(data["table"])
 
-        if not os.path.exists(txt_path):
-            self.listWidget.addItem("table.txt 文件不存在")
-            self.listWidget.clear()
-            return
-
-        try:
-            with open(txt_path, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f.readlines()]
-            for line in lines:
-                if line:  # 忽略空行
-                    self.listWidget.addItem(line)
-        except Exception as e:
-            self.listWidget.addItem(f"读取失败: {e}")
+    def curve_choices(self):
+        return [self.comboBox_2.itemText(i).strip() for i in range(self.comboBox_2.count())]
 
     def update_metric_image(self):
-        model_name = self.modelCombo_5.currentText().replace(" ", "_")
+        model_name = self.modelCombo_5.currentText()
         curve_name = self.comboBox_2.currentText().strip()
-        img_path = os.path.join("Assets", "diagram", model_name, f"{curve_name}.png")
-
-        if not os.path.exists(img_path):
-            print("[警告] 路径不存在：", img_path)
-            self.label.clear()
-            self.label.setText("图像未找到")
-            return
-
-        pixmap = QPixmap(img_path)
-        if pixmap.isNull():
-            print("[错误] 加载图像失败：", img_path)
-            self.label.setText("图像加载失败")
+        image = self.metrics_cache.image(model_name, curve_name, self.label.size())
+
+        if image is None:
+            if not os.path.exists(self.metrics_cache.image_path(model_name, curve_name)):
+                self.label.clear()
+                self.label.setText("图像未找到")
+            else:
+                # 后台还在缩放，完成后 on_metric_image_ready 再刷新
+                self.label.setText("图像加载中...")
             return
 
-        if self.label.width() > 10 and self.label.height() > 10:
-            scaled = pixmap.scaled(self.label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.label.setPixmap(scaled)
-        else:
-            self.label.setPixmap(pixmap)
-
+        self.label.setPixmap(QPixmap.fromImage(image))
         self.label.setAlignment(Qt.AlignCenter)
 
-
-
-
-
-
+    def on_metric_image_ready(self, model_name, curve_name):
+        if (safe_name(model_name) == safe_name(self.modelCombo_5.currentText())
+                and curve_name == self.comboBox_2.currentText().strip()):
+            self.update_metric_image()
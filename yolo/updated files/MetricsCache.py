@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal, Qt, QSize
+from PyQt5.QtGui import QImage
+from MetricsService import DATA_DIR, DIAGRAM_DIR, safe_name, read_map_values, read_table
+
+
+class MetricsCache(QObject):
+    """
+    性能指标页的缓存：mAP.txt / table.txt 按模型解析一次，
+    曲线图在后台线程里按显示尺寸预先缩放好（QImage 可以在非 GUI 线程处理），
+    文件被重新生成（mtime 变化）时自动失效。
+    """
+
+    image_ready = pyqtSignal(str, str)  # 模型名, 曲线名
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._metrics = {}  # 模型名 -> (mtime, 数据)
+        self._images = {}  # (模型名, 曲线名) -> (mtime, 尺寸, QImage)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def metrics(self, model_name):
+        """返回 {"values": [4 个指标], "table": [每行文本]}，文件不存在时返回 None"""
+        name = safe_name(model_name)
+        map_path = os.path.join(DATA_DIR, name, "mAP.txt")
+        table_path = os.path.join(DATA_DIR, name, "table.txt")
+        key = (self._mtime(map_path), self._mtime(table_path))
+        if key[0] is None:
+            return None
+        cached = self._metrics.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+        data = {"values": read_map_values(map_path),
+                "table": read_table(table_path) if key[1] is not None else []}
+        self._metrics[name] = (key, data)
+        return data
+
+    def image_path(self, model_name, curve):
+        return os.path.join(DIAGRAM_DIR, safe_name(model_name), f"{curve}.png")
+
+    def image(self, model_name, curve, size):
+        """
+        取已经缩放到 size 的曲线图；还没准备好时返回 None 并安排后台渲染，
+        渲染完成后发 image_ready。size 不同但已有旧尺寸的图时先返回旧图。
+        """
+        key = (safe_name(model_name), curve)
+        path = self.image_path(model_name, curve)
+        mtime = self._mtime(path)
+        if mtime is None:
+            return None
+        with self._lock:
+            cached = self._images.get(key)
+        if cached and cached[0] == mtime:
+            if cached[1] != (size.width(), size.height()):
+                self._schedule(model_name, curve, size)
+            return cached[2]
+        self._schedule(model_name, curve, size)
+        return None
+
+    def prerender(self, model_names, curves, size):
+        for model_name in model_names:
+            for curve in curves:
+                if os.path.exists(self.image_path(model_name, curve)):
+                    self._schedule(model_name, curve, size)
+
+    def _schedule(self, model_name, curve, size):
+        job = (safe_name(model_name), curve, size.width(), size.height())
+        with self._lock:
+            if job in self._pending:
+                return
+            self._pending.add(job)
+        self._executor.submit(self._render, model_name, curve, QSize(size), job)
+
+    def _render(self, model_name, curve, size, job):
+        try:
+            path = self.image_path(model_name, curve)
+            mtime = self._mtime(path)
+            image = QImage(path)
+            if image.isNull():
+                return
+            if size.width() > 10 and size.height() > 10:
+                image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            with self._lock:
+                self._images[job[:2]] = (mtime, job[2:], image)
+            self.image_ready.emit(model_name, curve)
+        finally:
+            with self._lock:
+                self._pending.discard(job)
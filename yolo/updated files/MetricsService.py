@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import argparse
+
+DATA_DIR = os.path.join("Assets", "data")
+DIAGRAM_DIR = os.path.join("Assets", "diagram")
+MODEL_DIR = os.path.join("Assets", "Model")
+CURVES = ["P_curve", "R_curve", "PR_curve", "F1_curve"]
+MAP_LABELS = [
+    "AP (mAP@0.5;0.95)",
+    "AP@0.5 (mAP@0.5)",
+    "AP@0.75 (mAP@0.75)",
+    "APs per category (mAP@0.5;0.95 per category)",
+]
+
+
+def safe_name(model_name):
+    return model_name.strip().replace(" ", "_")
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def build_metrics(model_name, weights=None, data=None):
+    """
+    对模型跑一次验证，生成性能指标页用的 mAP.txt、table.txt 和 P/R/PR/F1 曲线图，
+    和 validate.py 手动跑出来的内容一致。返回生成的文件列表。
+    """
+    from ultralytics import YOLO
+    name = safe_name(model_name)
+    weights = weights or os.path.join(MODEL_DIR, model_name + ".pt")
+    model = YOLO(weights)
+    kwargs = {"plots": True, "project": os.path.join("runs", "metrics"), "name": name, "exist_ok": True}
+    if data:
+        kwargs["data"] = data
+    metrics = model.val(**kwargs)  # 不传 data 时用模型训练时记住的数据集
+
+    box = metrics.box
+    maps = "[" + ", ".join(f"{v:.5g}" for v in box.maps) + "]"
+    values = [box.map, box.map50, box.map75, maps]
+    map_path = os.path.join(DATA_DIR, name, "mAP.txt")
+    _write_atomic(map_path, "".join(f"{label}: {value}\n" for label, value in zip(MAP_LABELS, values)))
+
+    names = metrics.names
+    per_image = getattr(metrics, "nt_per_image", None)
+    per_class = getattr(metrics, "nt_per_class", None)
+
+    def row(label, images, instances, p, r, ap50):
+        return f"{label:<24}{images:<12}{instances:<12}{p:<10.3g}{r:<10.3g}{ap50:.3g}"
+
+    mp, mr, map50, _ = box.mean_results()
+    # 验证集图片总数不在 metrics 里，"all" 行留空
+    lines = [row("all", "", int(per_class.sum()) if per_class is not None else "", mp, mr, map50)]
+    for i, c in enumerate(box.ap_class_index):
+        p, r, ap50, _ = box.class_result(i)
+        lines.append(row(names[int(c)],
+                         int(per_image[c]) if per_image is not None else "",
+                         int(per_class[c]) if per_class is not None else "", p, r, ap50))
+    table_path = os.path.join(DATA_DIR, name, "table.txt")
+    _write_atomic(table_path, "\n".join(lines))
+
+    written = [map_path, table_path]
+    diagram = os.path.join(DIAGRAM_DIR, name)
+    os.makedirs(diagram, exist_ok=True)
+    for curve in CURVES:
+        # 新版本 ultralytics 的文件名带 Box 前缀
+        for candidate in (f"{curve}.png", f"Box{curve}.png"):
+            src = os.path.join(str(metrics.save_dir), candidate)
+            if os.path.exists(src):
+                dst = os.path.join(diagram, f"{curve}.png")
+                shutil.copyfile(src, dst + ".tmp")
+                os.replace(dst + ".tmp", dst)
+                written.append(dst)
+                break
+    return written
+
+
+def read_map_values(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f.readlines()]
+    values = [line.split(":", 1)[1].strip() if ":" in line else "N/A" for line in lines[:4]]
+    return values + ["N/A"] * (4 - len(values))
+
+
+def read_table(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成性能指标页的 mAP/表格/曲线文件")
+    parser.add_argument("model", help="Assets/Model 下的模型名，例如 \"car detector\"")
+    parser.add_argument("--weights", help="权重路径，默认 Assets/Model/<model>.pt")
+    parser.add_argument("--data", help="验证用的数据集 yaml，默认用训练时的数据集")
+    args = parser.parse_args()
+    try:
+        for path in build_metrics(args.model, args.weights, args.data):
+            print("已生成", path)
+    except Exception as e:
+        print("生成失败：", e)
+        sys.exit(1)
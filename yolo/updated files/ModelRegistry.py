@@ -0,0 +1,64 @@
+import os
+import threading
+
+MODEL_DIR = os.path.join("Assets", "Model")
+
+
+class ModelRegistry:
+    """
+    按名字加载并缓存 Assets/Model 下的 .pt 模型，GUI 和推理服务共用。
+    replica 用来给同一个模型加载多份实例（YOLO 对象本身不是线程安全的）。
+    """
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.model_dir, name + ".pt")
+
+    def available(self):
+        if not os.path.isdir(self.model_dir):
+            return []
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.model_dir) if f.endswith(".pt"))
+
+    def get(self, name, replica=0):
+        """
+        缓存按文件的 (inode, 大小, 修改时间) 校验：训练界面发布新版本会原子替换 .pt，
+        下一次 get 就加载新权重，不用重启程序。
+        """
+        key = (name, replica)
+        path = self.path(name)
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                raise FileNotFoundError(f"模型文件不存在: {path}")
+            stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+            cached = self._models.get(key)
+            if cached is None or cached[0] != stamp:
+                from ultralytics import YOLO
+                cached = (stamp, YOLO(path))
+                self._models[key] = cached
+            return cached[1]
+
+    def loaded(self):
+        with self._lock:
+            return sorted({name for name, _ in self._models})
+
+    def unload(self, name=None):
+        with self._lock:
+            for key in list(self._models):
+                if name is None or key[0] == name:
+                    del self._models[key]
+
+
+_default_registry = None
+
+
+def default_registry():
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ModelRegistry()
+    return _default_registry
@@ -0,0 +1,185 @@
+import cv2
+import numpy as np
+from PyQt5.QtCore import QObject, QEvent, Qt, pyqtSignal
+from Detections import empty_detections
+
+
+class MotionGate:
+    """
+    固定摄像头用的运动门控：在缩小的灰度图上做帧差，
+    画面几乎没变化时跳过检测，直接复用上一次的检测结果。
+    """
+
+    def __init__(self, scale_width=160, pixel_threshold=25, area_ratio=0.002, max_skip=30, enabled=True):
+        self.enabled = enabled  # False 时只做 ROI 裁剪，不做帧差跳帧
+        self.scale_width = scale_width
+        self.pixel_threshold = pixel_threshold  # 灰度差超过多少算变化像素
+        self.area_ratio = area_ratio  # 变化像素占比超过多少才重新检测
+        self.max_skip = max_skip  # 连续跳过这么多帧后强制检测一次，防止漂移
+        self.roi = None
+        self._roi_mask = None
+        self._reference = None
+        self._skipped_in_row = 0
+        self.last_detections = empty_detections()
+        self.total = 0
+        self.skipped = 0
+
+    def reset(self):
+        self._reference = None
+        self._skipped_in_row = 0
+        self.last_detections = empty_detections()
+        self.total = 0
+        self.skipped = 0
+
+    def set_roi(self, points):
+        """points 为原图坐标下的多边形顶点 [(x, y), ...]，传 None 或少于 3 个点表示取消"""
+        self.roi = np.array(points, dtype=np.int32) if points and len(points) >= 3 else None
+        self._roi_mask = None
+        self._reference = None
+
+    def _small_gray(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.scale_width / float(w)
+        small = cv2.resize(frame, (self.scale_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        if self.roi is not None:
+            if self._roi_mask is None or self._roi_mask.shape != gray.shape:
+                self._roi_mask = np.zeros(gray.shape, dtype=np.uint8)
+                cv2.fillPoly(self._roi_mask, [(self.roi * scale).astype(np.int32)], 255)
+            gray = cv2.bitwise_and(gray, self._roi_mask)
+        return gray
+
+    def should_detect(self, frame):
+        self.total += 1
+        if not self.enabled:
+            return True
+        gray = self._small_gray(frame)
+        if self._reference is None or self._skipped_in_row >= self.max_skip:
+            self._reference = gray
+            self._skipped_in_row = 0
+            return True
+
+        diff = cv2.absdiff(gray, self._reference)
+        changed = np.count_nonzero(diff > self.pixel_threshold)
+        if changed > self.area_ratio * diff.size:
+            # 只在真的检测时更新参考帧，缓慢变化也能累计到阈值
+            self._reference = gray
+            self._skipped_in_row = 0
+            return True
+
+        self._skipped_in_row += 1
+        self.skipped += 1
+        return False
+
+    def roi_crop(self, frame):
+        """返回 ROI 外接矩形区域和它在原图中的偏移；没有 ROI 时返回整帧"""
+        if self.roi is None:
+            return frame, (0, 0)
+        h, w = frame.shape[:2]
+        x, y, rw, rh = cv2.boundingRect(self.roi)
+        x, y = max(0, x), max(0, y)
+        x2, y2 = min(w, x + rw), min(h, y + rh)
+        return frame[y:y2, x:x2], (x, y)
+
+    def filter_roi(self, dets):
+        """只保留中心点落在 ROI 多边形内的检测框"""
+        if self.roi is None or len(dets["labels"]) == 0:
+            return dets
+        centers = (dets["boxes"][:, :2] + dets["boxes"][:, 2:]) / 2
+        contour = self.roi.reshape(-1, 1, 2)
+        keep = [i for i, (cx, cy) in enumerate(centers)
+                if cv2.pointPolygonTest(contour, (float(cx), float(cy)), False) >= 0]
+        return {
+            "boxes": dets["boxes"][keep],
+            "scores": dets["scores"][keep],
+            "classes": dets["classes"][keep],
+            "labels": [dets["labels"][i] for i in keep],
+            "sources": [dets["sources"][i] for i in keep],
+        }
+
+    def skip_rate(self):
+        return self.skipped / self.total if self.total else 0.0
+
+    def stats_text(self):
+        return f"跳帧率: {self.skip_rate() * 100:.1f}% ({self.skipped}/{self.total})"
+
+
+class RoiSelector(QObject):
+    """
+    在 videoLabel 上画 ROI：左键依次加顶点，右键或双击结束。
+    坐标会从控件坐标换算回原始帧坐标。
+    """
+    roi_changed = pyqtSignal(list)
+
+    def __init__(self, label, frame_size_getter, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.frame_size_getter = frame_size_getter  # 返回当前帧 (w, h)
+        self.points = []
+        self.active = False
+
+    def start(self):
+        self.points = []
+        self.active = True
+        self.label.installEventFilter(self)
+        self.roi_changed.emit([])
+
+    def finish(self):
+        self.active = False
+        self.label.removeEventFilter(self)
+        if len(self.points) < 3:
+            self.points = []
+        self.roi_changed.emit(list(self.points))
+
+    def map_to_frame(self, pos):
+        size = self.frame_size_getter()
+        if not size:
+            return None
+        fw, fh = size
+        lw, lh = self.label.width(), self.label.height()
+        scale = min(lw / fw, lh / fh)
+        shown_w, shown_h = fw * scale, fh * scale
+        align = self.label.alignment()
+        if align & Qt.AlignHCenter:
+            ox = (lw - shown_w) / 2
+        elif align & Qt.AlignRight:
+            ox = lw - shown_w
+        else:
+            ox = 0
+        if align & Qt.AlignTop:
+            oy = 0
+        elif align & Qt.AlignBottom:
+            oy = lh - shown_h
+        else:
+            oy = (lh - shown_h) / 2
+        x = (pos.x() - ox) / scale
+        y = (pos.y() - oy) / scale
+        if x < 0 or y < 0 or x > fw or y > fh:
+            return None
+        return int(x), int(y)
+
+    def eventFilter(self, obj, event):
+        if not self.active or obj is not self.label:
+            return False
+        if event.type() == QEvent.MouseButtonDblClick:
+            self.finish()
+            return True
+        if event.type() == QEvent.MouseButtonPress:
+            if event.button() == Qt.RightButton:
+                self.finish()
+            else:
+                point = self.map_to_frame(event.pos())
+                if point is not None:
+                    self.points.append(point)
+                    self.roi_changed.emit(list(self.points))
+            return True
+        return False
+
+
+def draw_roi(frame, points, closed=True):
+    if not points:
+        return frame
+    pts = np.array(points, dtype=np.int32).reshape(-1, 1, 2)
+    cv2.polylines(frame, [pts], closed and len(points) >= 3, (0, 255, 255), 2)
+    return frame
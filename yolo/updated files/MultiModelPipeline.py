@@ -0,0 +1,143 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import torch
+from Detections import results_to_detections, concat_detections, empty_detections, offset_detections
+
+
+def letterbox(frame, imgsz=640, color=(114, 114, 114)):
+    """等比缩放并填充成 imgsz x imgsz，返回 (填充后的图, 缩放比例, (左, 上) 填充量)"""
+    h, w = frame.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (w, h) else frame
+    left = (imgsz - new_w) // 2
+    top = (imgsz - new_h) // 2
+    padded = cv2.copyMakeBorder(resized, top, imgsz - new_h - top, left, imgsz - new_w - left,
+                                cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (left, top)
+
+
+def to_tensor(image):
+    # BGR HWC uint8 -> RGB BCHW float(0~1)，ultralytics 直接接受这种张量输入
+    rgb = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1))
+    return torch.from_numpy(rgb).unsqueeze(0).float().div_(255.0)
+
+
+def unletterbox_boxes(boxes, ratio, pad, frame_shape):
+    if len(boxes) == 0:
+        return boxes
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    h, w = frame_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+    return boxes
+
+
+class CascadeStage:
+    """级联阶段：只在 parent 模型检出的 parent_classes 区域里再跑一次 model"""
+
+    def __init__(self, name, model, parent, parent_classes=None, pad=0.1, min_size=16):
+        self.name = name
+        self.model = model
+        self.parent = parent
+        self.parent_classes = set(parent_classes) if parent_classes else None
+        self.pad = pad
+        self.min_size = min_size
+
+
+class MultiModelPipeline:
+    """
+    单次解码、多模型检测：每帧只做一次 letterbox，共享同一个张量，
+    各个模型在线程池里并行推理，结果合并后用 sources 标记来源模型。
+    例如 yolov8n 找 person，再把 person 区域交给 emotion detector 做级联。
+    """
+
+    def __init__(self, models=None, imgsz=640, max_workers=None):
+        self.imgsz = imgsz
+        self.models = {}
+        self.cascades = []
+        self._locks = {}
+        for name, model in (models or {}).items():
+            self.add_model(name, model)
+        self._max_workers = max_workers
+        self._executor = None
+
+    def add_model(self, name, model):
+        self.models[name] = model
+        self._locks[name] = threading.Lock()
+
+    def add_cascade(self, name, model, parent, parent_classes=None, **kwargs):
+        if parent not in self.models:
+            raise ValueError(f"级联的上游模型不存在: {parent}")
+        self.cascades.append(CascadeStage(name, model, parent, parent_classes, **kwargs))
+        self._locks[name] = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            workers = self._max_workers or max(1, len(self.models) + len(self.cascades))
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="multi-model")
+        return self._executor
+
+    def _run_model(self, name, tensor, conf, iou, ratio, pad, frame_shape):
+        # 同一个 YOLO 对象的 predictor 不是线程安全的，不同模型之间可以并行
+        with self._locks[name]:
+            result = self.models[name].predict(tensor, conf=conf, iou=iou, imgsz=self.imgsz, verbose=False)[0]
+        dets = results_to_detections(result, source=name)
+        dets["boxes"] = unletterbox_boxes(dets["boxes"], ratio, pad, frame_shape)
+        return dets
+
+    def _crop_regions(self, stage, frame, parent_dets):
+        h, w = frame.shape[:2]
+        crops, offsets = [], []
+        for box, label in zip(parent_dets["boxes"], parent_dets["labels"]):
+            if stage.parent_classes is not None and label not in stage.parent_classes:
+                continue
+            x1, y1, x2, y2 = box
+            bw, bh = x2 - x1, y2 - y1
+            if bw < stage.min_size or bh < stage.min_size:
+                continue
+            x1 = int(max(0, x1 - bw * stage.pad))
+            y1 = int(max(0, y1 - bh * stage.pad))
+            x2 = int(min(w, x2 + bw * stage.pad))
+            y2 = int(min(h, y2 + bh * stage.pad))
+            crops.append(frame[y1:y2, x1:x2])
+            offsets.append((x1, y1))
+        return crops, offsets
+
+    def _run_cascade(self, stage, frame, parent_dets, conf, iou):
+        crops, offsets = self._crop_regions(stage, frame, parent_dets)
+        if not crops:
+            return empty_detections()
+        with self._locks[stage.name]:
+            results = stage.model.predict(crops, conf=conf, iou=iou, verbose=False)
+        outputs = []
+        for result, (ox, oy) in zip(results, offsets):
+            outputs.append(offset_detections(results_to_detections(result, source=stage.name), ox, oy))
+        return concat_detections(outputs)
+
+    def process(self, frame, conf, iou):
+        padded, ratio, pad = letterbox(frame, self.imgsz)
+        tensor = to_tensor(padded)
+
+        futures = {
+            name: self.executor.submit(self._run_model, name, tensor, conf, iou, ratio, pad, frame.shape)
+            for name in self.models
+        }
+        outputs = {name: future.result() for name, future in futures.items()}
+
+        cascade_futures = [
+            self.executor.submit(self._run_cascade, stage, frame, outputs[stage.parent], conf, iou)
+            for stage in self.cascades
+        ]
+        merged = list(outputs.values()) + [future.result() for future in cascade_futures]
+        return concat_detections(merged)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
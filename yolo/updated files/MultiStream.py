@@ -0,0 +1,364 @@
+import math
+import time
+import argparse
+import threading
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from Detections import results_to_detections, count_by_label, format_counts
+from Renderer import default_renderer
+
+
+def parse_source(text):
+    """
+    一行一个视频源：摄像头编号（0、1…）、视频文件，或 RTSP 地址；
+    RTSP 可以用 “地址 | 本地文件” 指定连不上时替代用的录像。
+    """
+    uri, _, fallback = text.partition("|")
+    uri, fallback = uri.strip(), fallback.strip() or None
+    if uri.isdigit():
+        return {"name": f"摄像头{uri}", "uri": int(uri), "fallback": fallback}
+    name = uri.rsplit("/", 1)[-1] or uri
+    return {"name": name, "uri": uri, "fallback": fallback}
+
+
+class StreamReader(threading.Thread):
+    """
+    一个视频源一个解码线程，只保留最新的一帧：推理跟不上时旧帧直接丢掉，
+    不会越积越多。视频文件按原始帧率读取并循环播放，模拟实时流。
+    """
+
+    def __init__(self, index, name, uri, fallback=None, loop=True):
+        super().__init__(daemon=True)
+        self.index = index
+        self.name = name
+        self.uri = uri
+        self.fallback = fallback
+        self.loop = loop
+        self.using_fallback = False
+        self.running = True
+        self.opened = threading.Event()
+        self.failed = False
+        self.decoded = 0
+        self._lock = threading.Lock()
+        self._latest = None  # (序号, 帧, 时间戳)
+        self._taken = 0  # 最后取走的帧序号
+        self.processed = 0  # 取走的帧数，decoded - processed 就是没被处理就被覆盖的帧
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.uri)
+        if not cap.isOpened() and self.fallback:
+            cap.release()
+            cap = cv2.VideoCapture(self.fallback)
+            self.using_fallback = True
+        return cap
+
+    def is_file(self):
+        return self.using_fallback or (isinstance(self.uri, str) and "://" not in self.uri)
+
+    def _interval(self, cap):
+        """视频文件（包括断流后换上的替代录像）按原始帧率放，实时源不限速"""
+        if not self.is_file():
+            return 0.0
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return 1.0 / fps if fps and fps > 0 else 1.0 / 25
+
+    def run(self):
+        cap = self._open()
+        if not cap.isOpened():
+            self.failed = True
+            self.running = False
+            self.opened.set()
+            return
+        self.opened.set()
+        interval = self._interval(cap)
+        next_time = time.perf_counter()
+        while self.running:
+            ret, frame = cap.read()
+            if not ret:
+                if self.is_file() and self.loop:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                if isinstance(self.uri, str) and "://" in self.uri and not self.using_fallback:
+                    # 网络流断开，等一会儿重连
+                    cap.release()
+                    time.sleep(1.0)
+                    cap = self._open()
+                    # 重连失败时可能换成了替代录像，按它的帧率重新限速
+                    interval = self._interval(cap)
+                    next_time = time.perf_counter()
+                    continue
+                break
+            self.decoded += 1
+            with self._lock:
+                self._latest = (self.decoded, frame, time.perf_counter())
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+        cap.release()
+        self.running = False
+
+    def take(self):
+        """取最新帧，没有新帧时返回 None"""
+        with self._lock:
+            latest = self._latest
+        if latest is None or latest[0] == self._taken:
+            return None
+        self._taken = latest[0]
+        self.processed += 1
+        return latest
+
+    def dropped(self):
+        return max(0, self.decoded - self.processed)
+
+    def stop(self):
+        self.running = False
+
+
+class StreamState:
+    def __init__(self, name, fps_cap=None):
+        self.name = name
+        self.fps_cap = fps_cap
+        self.last_dispatch = 0.0
+        self.processed = 0
+        self.fps = 0.0
+        self.frame = None
+        self.dets = None
+
+    def ready(self, now):
+        return not self.fps_cap or now - self.last_dispatch >= 1.0 / self.fps_cap
+
+    def record(self, frame, dets, now):
+        if self.last_dispatch:
+            instant = 1.0 / max(now - self.last_dispatch, 1e-6)
+            self.fps = instant if self.fps == 0 else self.fps * 0.9 + instant * 0.1
+        self.last_dispatch = now
+        self.processed += 1
+        self.frame = frame
+        self.dets = dets
+
+
+class RoundRobinScheduler:
+    """
+    轮询凑批：每一批里每路最多一帧，下一批从上一批最后取到的下一路开始，
+    保证 batch 小于路数时每一路轮流被处理；超过帧率上限的路本轮跳过。
+    """
+
+    def __init__(self, readers, states, max_batch=4):
+        self.readers = readers
+        self.states = states
+        self.max_batch = max_batch
+        self.cursor = 0
+
+    def next_batch(self, now=None):
+        now = now or time.perf_counter()
+        n = len(self.readers)
+        batch = []
+        for step in range(n):
+            i = (self.cursor + step) % n
+            if not self.states[i].ready(now):
+                continue
+            item = self.readers[i].take()
+            if item is None:
+                continue
+            batch.append((i, item[1]))
+            if len(batch) >= self.max_batch:
+                break
+        if batch:
+            self.cursor = (batch[-1][0] + 1) % n
+        return batch
+
+
+def infer_batch(model, frames, conf, iou, imgsz=640):
+    """所有路共用一个模型，一次 predict 处理一整批"""
+    results = model.predict(frames, conf=conf, iou=iou, imgsz=imgsz, verbose=False)
+    return [results_to_detections(r) for r in results]
+
+
+def compose_grid(states, size, renderer=None):
+    """把每一路最新的标注帧按网格拼成一张图，size=(宽, 高)"""
+    renderer = renderer or default_renderer()
+    n = max(len(states), 1)
+    cols = int(math.ceil(math.sqrt(n)))
+    rows = int(math.ceil(n / cols))
+    width, height = size
+    cw, ch = max(width // cols, 1), max(height // rows, 1)
+    canvas = np.zeros((ch * rows, cw * cols, 3), dtype=np.uint8)
+    for i, state in enumerate(states):
+        x0, y0 = (i % cols) * cw, (i // cols) * ch
+        if state.frame is not None:
+            tile = renderer.render(state.frame, state.dets, (cw, ch))
+            th, tw = tile.shape[:2]
+            if tw > cw or th > ch:
+                scale = min(cw / tw, ch / th)
+                tile = cv2.resize(tile, (max(int(tw * scale), 1), max(int(th * scale), 1)),
+                                  interpolation=cv2.INTER_AREA)
+                th, tw = tile.shape[:2]
+            ox, oy = x0 + (cw - tw) // 2, y0 + (ch - th) // 2
+            canvas[oy:oy + th, ox:ox + tw] = tile
+        title = f"{state.name}  {state.fps:.1f} FPS"
+        renderer.blit(canvas, renderer.sprite(title, (40, 40, 40)), x0 + 2, y0 + 2)
+    return canvas
+
+
+class MultiStreamWorker(QThread):
+    """
+    多路检测：每路一个解码线程，推理只有这一个线程、一份模型，
+    按轮询凑成一批一起推理，吞吐随 batch 增大而提高，而不是靠多加载几份模型。
+    """
+
+    frame_processed = pyqtSignal(np.ndarray)
+    result_updated = pyqtSignal(str)
+    fps_updated = pyqtSignal(float)
+    stats_updated = pyqtSignal(str)
+    operating_point_updated = pyqtSignal(str)
+
+    def __init__(self, model, get_params, sources, max_batch=4, fps_cap=None, imgsz=640, grid_fps=20,
+                 controller=None):
+        super().__init__()
+        self.model = model
+        self.get_params = get_params
+        self.specs = [parse_source(s) if isinstance(s, str) else s for s in sources]
+        self.max_batch = max_batch
+        self.fps_cap = fps_cap
+        self.imgsz = imgsz
+        self.controller = controller  # QualityController，按目标调整分辨率和 batch（不超过 max_batch）
+        self.grid_interval = 1.0 / grid_fps
+        self.display_size = None
+        self.running = True
+        self.paused = False
+        # 和 DetectionWorker 保持同样的属性，主界面的按钮逻辑不用区分
+        self.source_size = None
+        self.motion_gate = None
+        self.current_frame_index = 0
+        self.target_frame_index = None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.running = False
+        self.paused = False
+
+    def stats_text(self, readers, states):
+        lines = []
+        for reader, state in zip(readers, states):
+            flag = "（替代录像）" if reader.using_fallback else ""
+            flag = "（打开失败）" if reader.failed else flag
+            lines.append(f"{state.name}{flag}: {state.fps:.1f} FPS, 已处理 {state.processed}, "
+                         f"丢弃 {reader.dropped()}")
+        return "\n".join(lines)
+
+    def run(self):
+        readers = [StreamReader(i, s["name"], s["uri"], s.get("fallback")) for i, s in enumerate(self.specs)]
+        states = [StreamState(s["name"], s.get("fps_cap", self.fps_cap)) for s in self.specs]
+        for reader in readers:
+            reader.start()
+        scheduler = RoundRobinScheduler(readers, states, self.max_batch)
+        total = 0
+        start = time.perf_counter()
+        last_grid = 0.0
+        try:
+            while self.running:
+                if self.paused:
+                    self.msleep(50)
+                    continue
+                if readers and all(not r.running for r in readers):
+                    break
+                imgsz = self.imgsz
+                if self.controller is not None:
+                    imgsz = self.controller.imgsz
+                    scheduler.max_batch = min(self.controller.batch, self.max_batch)
+                batch_start = time.perf_counter()
+                batch = scheduler.next_batch(batch_start)
+                if batch:
+                    conf, iou, _ = self.get_params()
+                    dets_list = infer_batch(self.model, [frame for _, frame in batch], conf, iou, imgsz)
+                    now = time.perf_counter()
+                    for (i, frame), dets in zip(batch, dets_list):
+                        states[i].record(frame, dets, now)
+                    total += len(batch)
+                    if self.controller is not None:
+                        # 一批帧同时完成，按一次记录，帧数算进 FPS
+                        changed = self.controller.record(now - batch_start, {"infer": now - batch_start}, now,
+                                                         frames=len(batch))
+                        if changed:
+                            self.operating_point_updated.emit(self.controller.operating_point_text())
+                else:
+                    # 没有新帧也要按时刷新统计，打开失败、断流的路才看得到
+                    self.msleep(2)
+                    now = time.perf_counter()
+
+                if now - last_grid >= self.grid_interval:
+                    last_grid = now
+                    size = self.display_size or (1280, 720)
+                    self.frame_processed.emit(compose_grid(states, size))
+                    self.fps_updated.emit(total / max(now - start, 1e-6))
+                    self.stats_updated.emit(f"{len(readers)} 路, batch≤{self.max_batch}")
+                    counts = {}
+                    for state in states:
+                        if state.dets is not None:
+                            for name, num in count_by_label(state.dets).items():
+                                counts[name] = counts.get(name, 0) + num
+                    self.result_updated.emit(self.stats_text(readers, states) + "\n\n当前画面合计:\n" +
+                                             format_counts(counts))
+        finally:
+            for reader in readers:
+                reader.stop()
+            for reader in readers:
+                reader.join(timeout=2)
+
+
+def benchmark(model_path, sources, batches=(1, 2, 4, 8), seconds=10.0, imgsz=640):
+    """同样的几路输入，对比不同 batch 下的总吞吐（帧/秒）"""
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    specs = [parse_source(s) for s in sources]
+    results = {}
+    for max_batch in batches:
+        readers = [StreamReader(i, s["name"], s["uri"], s["fallback"]) for i, s in enumerate(specs)]
+        states = [StreamState(s["name"]) for s in specs]
+        for reader in readers:
+            reader.start()
+            reader.opened.wait(5)
+        scheduler = RoundRobinScheduler(readers, states, max_batch)
+        infer_batch(model, [np.zeros((imgsz, imgsz, 3), dtype=np.uint8)] * max_batch, 0.25, 0.7, imgsz)  # 预热
+        done, sizes = 0, []
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            batch = scheduler.next_batch()
+            if not batch:
+                time.sleep(0.001)
+                continue
+            for (i, frame), dets in zip(batch, infer_batch(model, [f for _, f in batch], 0.25, 0.7, imgsz)):
+                states[i].record(frame, dets, time.perf_counter())
+            done += len(batch)
+            sizes.append(len(batch))
+        elapsed = time.perf_counter() - start
+        for reader in readers:
+            reader.stop()
+        results[max_batch] = (done / elapsed, sum(sizes) / max(len(sizes), 1),
+                              [s.processed for s in states])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多路视频共用一个模型的吞吐测试")
+    parser.add_argument("model", help="模型权重，例如 Assets/Model/car detector.pt")
+    parser.add_argument("sources", nargs="+", help="视频源：摄像头编号、文件或 \"rtsp://...|替代文件\"")
+    parser.add_argument("--batch", default="1,2,4,8")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--imgsz", type=int, default=640)
+    args = parser.parse_args()
+
+    batches = [int(b) for b in args.batch.split(",")]
+    for max_batch, (fps, mean_batch, per_stream) in benchmark(args.model, args.sources, batches,
+                                                              args.seconds, args.imgsz).items():
+        print(f"batch≤{max_batch:<3} 总吞吐 {fps:7.1f} 帧/秒  平均批大小 {mean_batch:.2f}  各路帧数 {per_stream}")
@@ -0,0 +1,173 @@
+import time
+from collections import deque
+
+# 从画质最好到最省算力排列的工作点：推理分辨率、每几帧检测一次、每批帧数
+DEFAULT_LADDER = [
+    {"imgsz": 640, "stride": 1, "batch": 1},
+    {"imgsz": 480, "stride": 1, "batch": 1},
+    {"imgsz": 320, "stride": 1, "batch": 1},
+    {"imgsz": 320, "stride": 2, "batch": 1},
+    {"imgsz": 320, "stride": 3, "batch": 1},
+]
+
+# 多路检测时加大 batch 比跳帧更划算，这里不跳帧
+MULTI_STREAM_LADDER = [
+    {"imgsz": 640, "stride": 1, "batch": 1},
+    {"imgsz": 640, "stride": 1, "batch": 4},
+    {"imgsz": 480, "stride": 1, "batch": 4},
+    {"imgsz": 480, "stride": 1, "batch": 8},
+    {"imgsz": 320, "stride": 1, "batch": 8},
+    {"imgsz": 320, "stride": 1, "batch": 16},
+]
+
+# 按延迟控制时加大 batch 只会让每一帧等得更久，只降分辨率
+MULTI_STREAM_LATENCY_LADDER = [
+    {"imgsz": 640, "stride": 1, "batch": 1},
+    {"imgsz": 480, "stride": 1, "batch": 1},
+    {"imgsz": 416, "stride": 1, "batch": 1},
+    {"imgsz": 320, "stride": 1, "batch": 1},
+]
+
+MULTI_STREAM_LADDERS = {"fps": MULTI_STREAM_LADDER, "latency": MULTI_STREAM_LATENCY_LADDER}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class QualityController:
+    """
+    闭环画质控制：目标是 FPS（mode="fps"）或 p95 延迟毫秒数（mode="latency"）。
+    按最近 window 帧的实测结果在 ladder 上移动：连续 patience 个窗口不达标就降一级；
+    只有余量超过 headroom（按上一级的实测代价估算也能达标）并持续更久才升一级，
+    每次切换后 cooldown 秒内不再动，避免来回振荡。
+    """
+
+    def __init__(self, mode="fps", target=25.0, ladder=None, window=30, patience=2, headroom=0.25,
+                 cooldown=3.0, start_level=0):
+        self.mode = mode
+        self.target = target
+        self.ladder = ladder or DEFAULT_LADDER
+        self.window = window
+        self.patience = patience
+        self.headroom = headroom
+        self.cooldown = cooldown
+        self.level = min(max(start_level, 0), len(self.ladder) - 1)
+        self.latencies = deque(maxlen=window)
+        self.frame_times = deque(maxlen=window)  # (时间戳, 这一次完成的帧数)，一批只记一次
+        self.stages = {}
+        self.level_cost = {}  # 工作点 -> 实测的每帧耗时，升级时用来估算
+        self.bad_windows = 0
+        self.good_windows = 0
+        self.samples = 0
+        self.last_change = None
+        self.changes = 0
+
+    @property
+    def point(self):
+        return self.ladder[self.level]
+
+    @property
+    def imgsz(self):
+        return self.point["imgsz"]
+
+    @property
+    def stride(self):
+        return self.point["stride"]
+
+    @property
+    def batch(self):
+        return self.point["batch"]
+
+    def record(self, latency, stages=None, now=None, frames=1):
+        """
+        记录一帧（或同时完成的一批 frames 帧）：latency 为从读入到显示的秒数，
+        stages 为各阶段耗时 {名称: 秒}。返回工作点是否发生变化。
+        """
+        now = now or time.perf_counter()
+        self.latencies.extend([latency] * frames)
+        self.frame_times.append((now, frames))
+        for name, seconds in (stages or {}).items():
+            self.stages.setdefault(name, deque(maxlen=self.window)).append(seconds)
+        before = self.samples
+        self.samples += frames
+        if self.samples // self.window == before // self.window:
+            return False
+        return self._evaluate(now)
+
+    def fps(self):
+        # 第一条记录之前的耗时不在窗口里，它的帧数不算
+        if len(self.frame_times) < 2:
+            return 0.0
+        frames = sum(n for _, n in self.frame_times) - self.frame_times[0][1]
+        return frames / max(self.frame_times[-1][0] - self.frame_times[0][0], 1e-6)
+
+    def p95_ms(self):
+        return percentile(list(self.latencies), 95) * 1000
+
+    def _margin(self):
+        """达标程度：>0 表示有余量，<0 表示不达标，按目标的比例计"""
+        if self.mode == "fps":
+            return self.fps() / self.target - 1.0
+        return 1.0 - self.p95_ms() / self.target
+
+    def _predicted_margin(self, level):
+        """按某一级以前测到的单帧耗时，估算切过去以后的达标程度"""
+        cost = self.level_cost.get(level)
+        if cost is None:
+            return None
+        current = self.level_cost.get(self.level)
+        if not current:
+            return None
+        if self.mode == "fps":
+            return self.fps() * current / cost / self.target - 1.0
+        return 1.0 - self.p95_ms() * cost / current / self.target
+
+    def _evaluate(self, now):
+        self.level_cost[self.level] = sum(self.latencies) / len(self.latencies)
+        margin = self._margin()
+        if margin < 0:
+            self.bad_windows += 1
+            self.good_windows = 0
+        elif margin > self.headroom:
+            self.good_windows += 1
+            self.bad_windows = 0
+        else:
+            self.bad_windows = self.good_windows = 0
+
+        if self.last_change is not None and now - self.last_change < self.cooldown:
+            return False
+        if self.bad_windows >= self.patience and self.level < len(self.ladder) - 1:
+            return self._move(self.level + 1, now)
+        if self.good_windows >= self.patience * 2 and self.level > 0:
+            predicted = self._predicted_margin(self.level - 1)
+            # 没测过上一级就试一下；测过并且估计达不到目标就不升，避免在两级之间来回跳
+            if predicted is None or predicted > 0:
+                return self._move(self.level - 1, now)
+        return False
+
+    def _move(self, level, now):
+        self.level = level
+        self.last_change = now
+        self.bad_windows = self.good_windows = 0
+        self.latencies.clear()
+        self.frame_times.clear()
+        self.changes += 1
+        return True
+
+    def stage_ms(self):
+        return {name: sum(values) / len(values) * 1000 for name, values in self.stages.items() if values}
+
+    def operating_point_text(self):
+        point = self.point
+        text = f"{point['imgsz']}px"
+        if point["stride"] > 1:
+            text += f" 每{point['stride']}帧检测"
+        if point["batch"] > 1:
+            text += f" batch{point['batch']}"
+        target = f"目标 {self.target:g} FPS" if self.mode == "fps" else f"目标 p95 {self.target:g}ms"
+        return f"[{text} | {target} | p95 {self.p95_ms():.0f}ms]"
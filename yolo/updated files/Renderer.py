@@ -0,0 +1,241 @@
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+from Detections import display_label, class_color, draw_detections
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # 没有 Pillow 时用 cv2.putText，中文类别名会显示成问号
+    Image = None
+
+# 常见的中文字体位置，依次尝试
+FONT_CANDIDATES = [
+    "simhei.ttf",
+    "msyh.ttc",
+    os.path.join("C:\\", "Windows", "Fonts", "simhei.ttf"),
+    os.path.join("C:\\", "Windows", "Fonts", "msyh.ttc"),
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+MAX_SPRITES = 4096
+
+
+def load_font(size, font_path=None):
+    if Image is None:
+        return None
+    for path in ([font_path] if font_path else []) + FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size)
+        except (OSError, IOError):
+            continue
+    return ImageFont.load_default()
+
+
+class AnnotationRenderer:
+    """
+    检测框绘制：类别名、分数、跟踪 ID 各自预先渲染成带底色的小图（sprite）并缓存，
+    每帧只做数组切片赋值和 alpha 混合；先把帧缩到显示尺寸再画，像素少得多。
+    """
+
+    def __init__(self, font_size=14, thickness=2, font_path=None, label_alpha=0.85):
+        self.font_size = font_size
+        self.thickness = thickness
+        self.font = load_font(font_size, font_path)
+        self.label_alpha = label_alpha
+        self.sprites = {}  # key -> (预乘后的 BGR, 255-alpha, BGR, alpha)
+
+    # --- sprite ---
+    def _text_mask(self, text):
+        """文字的灰度蒙版，0..255"""
+        if self.font is not None:
+            left, top, right, bottom = self.font.getbbox(text)
+            w, h = max(right - left, 1), max(bottom - top, 1)
+            canvas = Image.new("L", (w + 4, h + 4), 0)
+            ImageDraw.Draw(canvas).text((2 - left, 2 - top), text, fill=255, font=self.font)
+            return np.asarray(canvas)
+        scale = self.font_size / 30.0
+        (w, h), base = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+        mask = np.zeros((h + base + 4, w + 4), dtype=np.uint8)
+        cv2.putText(mask, text, (2, h + 2), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, 1, cv2.LINE_AA)
+        return mask
+
+    def _store(self, key, rgb, alpha):
+        if len(self.sprites) >= MAX_SPRITES:
+            # 跟踪 ID 会一直增长，缓存满了直接清空重建
+            self.sprites.clear()
+        alpha = (alpha * 255).astype(np.uint16)[..., None]
+        # 预乘 alpha，混合时只剩一次乘法和一次加法
+        sprite = (rgb.astype(np.uint16) * alpha, 255 - alpha, rgb.astype(np.uint8), alpha)
+        self.sprites[key] = sprite
+        return sprite
+
+    def sprite(self, text, color):
+        key = (text, color)
+        cached = self.sprites.get(key)
+        if cached is not None:
+            return cached
+        mask = self._text_mask(text).astype(np.float32) / 255.0
+        # 类别色做底，按亮度选黑/白字
+        text_color = np.array((0, 0, 0) if sum(color) > 450 else (255, 255, 255), dtype=np.float32)
+        bg = np.array(color, dtype=np.float32)
+        rgb = bg * (1 - mask[..., None]) + text_color * mask[..., None]
+        return self._store(key, rgb, np.maximum(mask, self.label_alpha))
+
+    def label_sprite(self, name, score, color):
+        """类别名 + 分数拼成一张 sprite；分数只有 0.00~1.00 共 101 种，组合数有限，可以整体缓存"""
+        text = f"{score:.2f}"
+        key = (name, text, color)
+        cached = self.sprites.get(key)
+        if cached is not None:
+            return cached
+        parts = [self.sprite(name, color), self.sprite(" " + text, color)]
+        height = max(p[3].shape[0] for p in parts)
+        rgb = np.empty((height, sum(p[3].shape[1] for p in parts), 3), dtype=np.float32)
+        alpha = np.empty(rgb.shape[:2], dtype=np.float32)
+        rgb[:] = color
+        alpha[:] = self.label_alpha
+        x = 0
+        for part in parts:
+            h, w = part[3].shape[:2]
+            rgb[:h, x:x + w] = part[2]
+            alpha[:h, x:x + w] = part[3][..., 0] / 255.0
+            x += w
+        return self._store(key, rgb, alpha)
+
+    # --- 绘制 ---
+    @staticmethod
+    def blit(image, sprite, x, y):
+        """把 sprite 左上角放在 (x, y) 做 alpha 混合，超出画面的部分裁掉，返回 sprite 宽度"""
+        premul, inv_alpha = sprite[0], sprite[1]
+        h, w = inv_alpha.shape[:2]
+        H, W = image.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, W), min(y + h, H)
+        if x1 <= x0 or y1 <= y0:
+            return w
+        sx, sy = x0 - x, y0 - y
+        roi = image[y0:y1, x0:x1]
+        blended = premul[sy:sy + y1 - y0, sx:sx + x1 - x0] + roi * inv_alpha[sy:sy + y1 - y0, sx:sx + x1 - x0]
+        roi[:] = blended // 255
+        return w
+
+    def draw_box(self, image, x1, y1, x2, y2, color):
+        t = self.thickness
+        H, W = image.shape[:2]
+        x1, x2 = max(x1, 0), min(x2, W)
+        y1, y2 = max(y1, 0), min(y2, H)
+        if x2 <= x1 or y2 <= y1:
+            return
+        image[y1:min(y1 + t, y2), x1:x2] = color
+        image[max(y2 - t, y1):y2, x1:x2] = color
+        image[y1:y2, x1:min(x1 + t, x2)] = color
+        image[y1:y2, max(x2 - t, x1):x2] = color
+
+    def render(self, frame, dets, size=None):
+        """
+        画出检测结果。size=(宽, 高) 时先把帧按比例缩到不超过该尺寸再画，
+        框坐标随之缩放；返回新的图像，不修改输入帧。
+        """
+        scale = 1.0
+        if size is not None:
+            fh, fw = frame.shape[:2]
+            scale = min(size[0] / fw, size[1] / fh, 1.0)
+        if scale < 1.0:
+            image = cv2.resize(frame, (max(int(frame.shape[1] * scale), 1), max(int(frame.shape[0] * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            image = frame.copy()
+        if len(dets["boxes"]) == 0:
+            return image
+
+        boxes = np.round(dets["boxes"] * scale).astype(np.int32)
+        ids = dets.get("ids")
+        for i in range(len(boxes)):
+            x1, y1, x2, y2 = boxes[i]
+            color = class_color(int(dets["classes"][i]))
+            self.draw_box(image, x1, y1, x2, y2, color)
+            parts = [self.label_sprite(display_label(dets["labels"][i], dets["sources"][i]),
+                                       float(dets["scores"][i]), color)]
+            if ids is not None:
+                parts.insert(0, self.sprite(f"#{int(ids[i])} ", color))
+            height = max(p[1].shape[0] for p in parts)
+            y = y1 - height if y1 - height >= 0 else y1
+            x = x1
+            for part in parts:
+                x += self.blit(image, part, x, y)
+        return image
+
+
+_default_renderer = None
+
+
+def default_renderer():
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = AnnotationRenderer()
+    return _default_renderer
+
+
+def random_detections(n, width, height, names, seed=0):
+    rng = np.random.RandomState(seed)
+    xy = rng.rand(n, 2) * [width * 0.9, height * 0.9]
+    wh = rng.rand(n, 2) * [width * 0.1, height * 0.1] + 10
+    return {
+        "boxes": np.concatenate([xy, xy + wh], axis=1).astype(np.float32),
+        "scores": rng.rand(n).astype(np.float32),
+        "classes": rng.randint(0, len(names), n).astype(np.int32),
+        "labels": [names[c] for c in rng.randint(0, len(names), n)],
+        "sources": [""] * n,
+    }
+
+
+def benchmark(boxes=200, source=(1920, 1080), display=(960, 540), repeat=50, names=None):
+    """对比逐框 cv2 绘制和 sprite 绘制，返回 {方法: 每毫秒画的框数}"""
+    names = names or ["Car", "Bus", "Truck", "Ambulance", "Motorcycle"]
+    frame = np.random.randint(0, 255, (source[1], source[0], 3), dtype=np.uint8)
+    dets = random_detections(boxes, source[0], source[1], names)
+    renderer = AnnotationRenderer()
+    renderer.render(frame, dets, display)  # 预热 sprite 缓存
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    results = {}
+    ms = timed(lambda: cv2.resize(draw_detections(frame, dets), display, interpolation=cv2.INTER_AREA))
+    results["cv2 原尺寸绘制+缩放"] = boxes / ms
+    ms = timed(lambda: renderer.render(frame, dets))
+    results["sprite 原尺寸"] = boxes / ms
+    ms = timed(lambda: renderer.render(frame, dets, display))
+    results["sprite 显示尺寸"] = boxes / ms
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检测框绘制性能测试")
+    parser.add_argument("--boxes", type=int, default=200)
+    parser.add_argument("--source", default="1920x1080")
+    parser.add_argument("--display", default="960x540")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--data", help="从数据集 yaml 读类别名，例如 PlantTrainData.yaml")
+    args = parser.parse_args()
+
+    names = None
+    if args.data:
+        import yaml
+        with open(args.data, "r", encoding="utf-8") as f:
+            names = yaml.safe_load(f)["names"]
+        if isinstance(names, dict):
+            names = list(names.values())
+    source = tuple(int(v) for v in args.source.split("x"))
+    display = tuple(int(v) for v in args.display.split("x"))
+    for name, rate in benchmark(args.boxes, source, display, args.repeat, names).items():
+        print(f"{name:<20} {rate:8.1f} 框/ms")
+    sys.exit(0)
@@ -0,0 +1,324 @@
+import os
+import gc
+import io
+import sys
+import csv
+import json
+import time
+import zipfile
+import platform
+import argparse
+import threading
+import traceback
+import tracemalloc
+from collections import deque
+
+try:
+    import psutil
+except ImportError:  # 没有 psutil 时 Linux 读 /proc，其它系统只能拿到峰值
+    psutil = None
+
+MB = 1024 * 1024
+DIAGNOSTICS_DIR = "diagnostics"
+# 判断持续增长的阈值：指标 -> (每分钟至少增长多少字节, 窗口内至少累计增长多少字节)
+GROWTH_LIMITS = {
+    "rss": (1 * MB, 32 * MB),
+    "heap": (256 * 1024, 8 * MB),
+}
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+def trend(times, values):
+    """最小二乘斜率（每分钟）和相邻两次不下降的比例"""
+    n = len(values)
+    if n < 3:
+        return 0.0, 0.0
+    mean_t = sum(times) / n
+    mean_v = sum(values) / n
+    var = sum((t - mean_t) ** 2 for t in times)
+    if var == 0:
+        return 0.0, 0.0
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / var
+    rising = sum(1 for a, b in zip(values, values[1:]) if b >= a) / (n - 1)
+    return slope * 60, rising
+
+
+def format_stats(stats, limit=10, frames=6):
+    lines = []
+    for stat in stats[:limit]:
+        size = getattr(stat, "size_diff", stat.size)
+        count = getattr(stat, "count_diff", stat.count)
+        lines.append(f"{size / 1024:+10.1f} KiB  {count:+8d} 块")
+        for line in stat.traceback.format(limit=frames):
+            lines.append("    " + line)
+    return "\n".join(lines)
+
+
+class ResourceMonitor:
+    """
+    长时间运行的资源监控：后台线程每 interval 秒采一次 RSS、Python 堆（tracemalloc）、线程数
+    和登记过的队列深度，保留最近 history 个样本。growth() 判断是否在持续增长，
+    write_bundle() 把样本、分配最多的代码位置、各线程栈打成一个 zip 方便排查。
+    """
+
+    def __init__(self, interval=5.0, history=720, window=60, top_n=15, trace=True, trace_frames=10):
+        self.interval = interval
+        self.window = window
+        self.top_n = top_n
+        self.trace = trace
+        self.trace_frames = trace_frames
+        self.samples = deque(maxlen=history)
+        self.probes = {}  # 名称 -> 返回数字的函数
+        self.baseline = None  # 开始时的 tracemalloc 快照，用来对比增长的分配位置
+        self.started_at = None
+        self.started_tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # --- 采样 ---
+    def register(self, name, probe):
+        """登记一个队列深度或缓存大小之类的探针，probe() 返回数字，出错时记为 -1"""
+        self.probes[name] = probe
+
+    def unregister(self, name):
+        self.probes.pop(name, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.started_tracing = True
+        if tracemalloc.is_tracing():
+            self.baseline = tracemalloc.take_snapshot()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ResourceMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        self._thread = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+            self.baseline = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        row = {"time": time.time(), "rss": rss_bytes(), "threads": threading.active_count()}
+        if tracemalloc.is_tracing():
+            row["heap"], row["heap_peak"] = tracemalloc.get_traced_memory()
+        for name, probe in list(self.probes.items()):
+            try:
+                row[name] = probe()
+            except Exception:
+                row[name] = -1
+        with self._lock:
+            self.samples.append(row)
+        return row
+
+    @property
+    def latest(self):
+        with self._lock:
+            return self.samples[-1] if self.samples else None
+
+    # --- 分析 ---
+    def growth(self):
+        """
+        最近 window 个样本上每个指标的增长情况：{指标: (每分钟斜率, 不下降比例, 是否判为持续增长)}。
+        RSS 和堆按 GROWTH_LIMITS 判断，队列深度等探针只要一直涨（不下降比例≥0.9）就算。
+        """
+        with self._lock:
+            recent = list(self.samples)[-self.window:]
+        if len(recent) < 3:
+            return {}
+        times = [r["time"] for r in recent]
+        result = {}
+        for key in recent[-1]:
+            if key in ("time", "heap_peak"):
+                continue
+            values = [r.get(key, 0) for r in recent]
+            slope, rising = trend(times, values)
+            if key in GROWTH_LIMITS:
+                min_slope, min_total = GROWTH_LIMITS[key]
+                growing = slope > min_slope and rising >= 0.7 and values[-1] - values[0] > min_total
+            else:
+                growing = slope > 0 and rising >= 0.9 and values[-1] > values[0]
+            result[key] = (slope, rising, growing)
+        return result
+
+    def growing(self):
+        return [key for key, (_, _, flag) in self.growth().items() if flag]
+
+    def top_allocations(self, limit=None, key_type="traceback"):
+        """和开始时的快照比，新增内存最多的分配位置；没开 tracemalloc 时返回空列表"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        limit = limit or self.top_n
+        if self.baseline is None:
+            return snapshot.statistics(key_type)[:limit]
+        return snapshot.compare_to(self.baseline, key_type)[:limit]
+
+    # --- 诊断包 ---
+    def summary(self):
+        latest = self.latest or self.sample()
+        lines = [f"开始时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at or time.time()))}",
+                 f"运行时长: {(time.time() - (self.started_at or time.time())) / 60:.1f} 分钟",
+                 f"样本数: {len(self.samples)}（间隔 {self.interval}s）",
+                 f"RSS: {latest['rss'] / MB:.1f} MB，线程数: {latest['threads']}"]
+        if "heap" in latest:
+            lines.append(f"Python 堆: {latest['heap'] / MB:.1f} MB（峰值 {latest['heap_peak'] / MB:.1f} MB）")
+        lines.append("")
+        lines.append(f"{'指标':<16}{'每分钟变化':>14}{'不下降比例':>12}  判断")
+        for key, (slope, rising, growing) in self.growth().items():
+            unit = f"{slope / MB:+.2f} MB" if key in GROWTH_LIMITS else f"{slope:+.2f}"
+            lines.append(f"{key:<16}{unit:>14}{rising:>12.0%}  {'持续增长' if growing else '-'}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def thread_stacks():
+        frames = sys._current_frames()
+        lines = []
+        for thread in threading.enumerate():
+            lines.append(f"--- {thread.name} (ident={thread.ident}, daemon={thread.daemon})")
+            frame = frames.get(thread.ident)
+            if frame is not None:
+                lines.extend(line.rstrip() for line in traceback.format_stack(frame))
+        return "\n".join(lines)
+
+    @staticmethod
+    def environment():
+        lines = [f"python: {sys.version}", f"platform: {platform.platform()}", f"argv: {sys.argv}",
+                 f"psutil: {'yes' if psutil is not None else 'no'}"]
+        for name in ("numpy", "cv2", "torch", "ultralytics", "PyQt5.QtCore"):
+            module = sys.modules.get(name)  # 只记录已经导入的，不为了写版本号去导入
+            if module is not None:
+                version = getattr(module, "__version__", None) or getattr(module, "QT_VERSION_STR", "?")
+                lines.append(f"{name}: {version}")
+        return "\n".join(lines)
+
+    def write_bundle(self, path=None, state=None):
+        """写诊断 zip，state 是调用方附带的运行状态（模型、输入源、设置等），返回文件路径"""
+        if path is None:
+            os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+            path = os.path.join(DIAGNOSTICS_DIR, time.strftime("diagnostics_%Y%m%d_%H%M%S.zip"))
+        gc.collect()
+        self.sample()
+        with self._lock:
+            samples = list(self.samples)
+        keys = []
+        for row in samples:
+            keys += [k for k in row if k not in keys]
+        table = io.StringIO()
+        writer = csv.DictWriter(table, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(samples)
+
+        allocations = self.top_allocations()
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr("summary.txt", self.summary())
+            bundle.writestr("samples.csv", table.getvalue())
+            bundle.writestr("allocations.txt", format_stats(allocations, self.top_n, self.trace_frames)
+                            if allocations else "tracemalloc 未开启")
+            bundle.writestr("threads.txt", self.thread_stacks())
+            bundle.writestr("environment.txt", self.environment())
+            bundle.writestr("gc.txt", f"gc.get_count(): {gc.get_count()}\ngarbage: {len(gc.garbage)}\n"
+                                      f"tracked objects: {len(gc.get_objects())}")
+            if state:
+                bundle.writestr("state.json", json.dumps(state, ensure_ascii=False, indent=2, default=str))
+        return path
+
+
+def check_hot_path(fn, iterations=500, warmup=50, limit=256):
+    """
+    内存回归检查：先跑 warmup 次让缓存填满，然后跑 iterations 次，
+    Python 堆平均每次增长超过 limit 字节就判为泄漏。返回 (是否通过, 每次增长字节, 增长最多的位置)。
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(10)
+    try:
+        for _ in range(warmup):
+            fn()
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        for _ in range(iterations):
+            fn()
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    stats = after.compare_to(before, "traceback")
+    per_iteration = sum(s.size_diff for s in stats) / iterations
+    return per_iteration <= limit, per_iteration, stats[:10]
+
+
+def _display_path(source=(1920, 1080), display=(960, 540), boxes=50):
+    """模拟检测界面每帧的热路径：画框、转 RGB、保存最后一帧（不含 Qt 部分）"""
+    import cv2
+    import numpy as np
+    from Renderer import AnnotationRenderer, random_detections
+
+    renderer = AnnotationRenderer()
+    frame = np.random.randint(0, 255, (source[1], source[0], 3), dtype=np.uint8)
+    holder = {}
+    counter = [0]
+
+    def step():
+        counter[0] += 1
+        dets = random_detections(boxes, source[0], source[1], ["Car", "Bus", "Truck"], seed=counter[0] % 7)
+        image = renderer.render(frame, dets, display)
+        holder["last_frame"] = image
+        holder["rgb"] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    return step
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检测界面每帧热路径的内存回归检查")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=256, help="每帧允许的 Python 堆增长（字节）")
+    args = parser.parse_args()
+
+    start_rss = rss_bytes()
+    ok, per_iteration, stats = check_hot_path(_display_path(), args.iterations, args.warmup, args.limit)
+    print(f"每帧 Python 堆增长 {per_iteration:.1f} 字节（上限 {args.limit}），"
+          f"RSS 变化 {(rss_bytes() - start_rss) / MB:+.1f} MB")
+    if not ok:
+        print("增长最多的位置：")
+        print(format_stats(stats))
+    sys.exit(0 if ok else 1)
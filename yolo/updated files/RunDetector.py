@@ -0,0 +1,213 @@
+import time
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from Detections import results_to_detections, offset_detections, count_by_label, format_counts
+from Renderer import default_renderer
+
+
+class DetectionWorker(QThread):
+    frame_processed = pyqtSignal(np.ndarray)
+    result_updated = pyqtSignal(str)
+    fps_updated = pyqtSignal(float)
+    progress_updated = pyqtSignal(int, int)
+    stats_updated = pyqtSignal(str)
+    operating_point_updated = pyqtSignal(str)
+
+    def __init__(self, model, get_params, input_type, path, pipeline=None, motion_gate=None,
+                 tracker=None, detect_interval=1, controller=None, shared_decoders=0, record_path=None,
+                 replay_mode="original", replay_fps=None, video_index=None):
+        super().__init__()
+        self.model = model
+        self.pipeline = pipeline
+        self.motion_gate = motion_gate
+        self.tracker = tracker
+        self.detect_interval = max(1, int(detect_interval))  # 开启跟踪时每隔几帧做一次检测
+        self.frames_since_detect = 0
+        self.get_params = get_params
+        self.input_type = input_type
+        self.path = path
+        self.renderer = default_renderer()
+        self.display_size = None  # 显示区域大小 (宽, 高)，按这个尺寸画框，不在原分辨率上画
+        self.source_size = None  # 原始帧大小，ROI 等坐标仍然按原始帧计算
+        self.controller = controller  # QualityController，按目标 FPS/延迟调整分辨率和跳帧
+        self.shared_decoders = shared_decoders  # >0 时视频文件用多个解码进程 + 共享内存读取
+        self.record_path = record_path  # 摄像头检测时同时把原始帧录到这个目录
+        self.replay_mode = replay_mode  # input_type 为 "回放" 时 path 是录制目录，按这个模式出帧
+        self.replay_fps = replay_fps
+        self.video_index = video_index  # VideoIndex，检测视频文件时逐帧记下各类别出现的位置
+        self.capture = None
+        self.frame_count = 0
+        self.last_dets = None
+        self.stage_times = {}
+
+        self.running = True
+        self.paused = False
+        self.current_frame_index = 0
+        self.target_frame_index = None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.running = False
+        self.paused = False
+
+    def detect(self, frame, conf, iou):
+        if self.pipeline is not None:
+            if self.controller is not None:
+                self.pipeline.imgsz = self.controller.imgsz
+            return self.pipeline.process(frame, conf, iou)
+        if self.controller is not None:
+            result = self.model.predict(frame, conf=conf, iou=iou, imgsz=self.controller.imgsz, verbose=False)[0]
+        else:
+            result = self.model.predict(frame, conf=conf, iou=iou, verbose=False)[0]
+        return results_to_detections(result)
+
+    def gated_detect(self, frame, conf, iou):
+        gate = self.motion_gate
+        if not gate.should_detect(frame):
+            return gate.last_detections
+        crop, (ox, oy) = gate.roi_crop(frame)
+        dets = offset_detections(self.detect(crop, conf, iou), ox, oy)
+        gate.last_detections = gate.filter_roi(dets)
+        return gate.last_detections
+
+    def run_detector(self, frame):
+        conf, iou, _ = self.get_params()
+        if self.motion_gate is not None:
+            dets = self.gated_detect(frame, conf, iou)
+            self.stats_updated.emit(self.motion_gate.stats_text())
+            return dets
+        return self.detect(frame, conf, iou)
+
+    def stride(self):
+        return self.controller.stride if self.controller is not None else 1
+
+    def tracked_detect(self, frame):
+        # 每 detect_interval 帧检测一次，中间帧只用卡尔曼预测外推
+        interval = max(self.detect_interval, self.stride())
+        if self.frames_since_detect % interval == 0:
+            self.frames_since_detect = 1
+            return self.tracker.update(self.run_detector(frame))
+        self.frames_since_detect += 1
+        return self.tracker.step(max_misses=interval)
+
+    def result_text(self, dets):
+        if self.tracker is None:
+            return format_counts(count_by_label(dets))
+        return ("累计目标（按跟踪 ID 去重）:\n" + format_counts(self.tracker.unique_counts()) +
+                "\n\n当前画面:\n" + format_counts(count_by_label(dets)))
+
+    def process_frame(self, frame):
+        start = time.perf_counter()
+        if self.tracker is not None:
+            dets = self.tracked_detect(frame)
+        elif self.last_dets is not None and self.frame_count % self.stride() != 0:
+            # 自适应控制要求跳帧时沿用上一次的检测结果
+            dets = self.last_dets
+        else:
+            dets = self.run_detector(frame)
+        self.frame_count += 1
+        self.last_dets = dets
+        inferred = time.perf_counter()
+        self.source_size = (frame.shape[1], frame.shape[0])
+        self.frame_processed.emit(self.renderer.render(frame, dets, self.display_size))
+        self.result_updated.emit(self.result_text(dets))
+        self.stage_times = {"infer": inferred - start, "render": time.perf_counter() - inferred}
+        return dets
+
+    def open_capture(self):
+        if self.input_type == "视频" and self.shared_decoders > 0:
+            from SharedFrames import SharedMemoryCapture
+            return SharedMemoryCapture(self.path, decoders=self.shared_decoders)
+        if self.input_type == "回放":
+            from FrameRecorder import ReplayCapture
+            return ReplayCapture(self.path, self.replay_mode, self.replay_fps)
+        if self.input_type == "摄像头" and self.record_path:
+            from FrameRecorder import RecordingCapture
+            return RecordingCapture(cv2.VideoCapture(0), self.record_path)
+        source = 0 if self.input_type == "摄像头" else self.path
+        return cv2.VideoCapture(source)
+
+    def run(self):
+        try:
+            if self.input_type == "图片":
+                frame = cv2.imread(self.path)
+                if frame is None:
+                    self.result_updated.emit("无法读取图片")
+                    return
+                start = time.perf_counter()
+                self.process_frame(frame)
+                self.fps_updated.emit(1.0 / max(time.perf_counter() - start, 1e-6))
+                return
+            self.run_stream()
+        finally:
+            if self.pipeline is not None:
+                self.pipeline.close()
+
+    def run_stream(self):
+        cap = self.capture = self.open_capture()
+        if not cap.isOpened():
+            self.result_updated.emit("无法打开视频源")
+            return
+
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.input_type == "视频" else 0
+        if self.video_index is not None:
+            self.video_index.set_video(total, cap.get(cv2.CAP_PROP_FPS))
+        fps = 0.0
+        while self.running:
+            if self.paused:
+                self.msleep(50)
+                continue
+
+            if self.target_frame_index is not None and total > 0:
+                target = min(max(0, self.target_frame_index), total - 1)
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.current_frame_index = target
+                self.target_frame_index = None
+                if self.tracker is not None:
+                    # 跳转后轨迹不再连续，重新开始跟踪
+                    self.tracker.reset()
+                    self.frames_since_detect = 0
+
+            read_start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            start = time.perf_counter()
+            dets = self.process_frame(frame)
+            if self.video_index is not None:
+                self.video_index.add(self.current_frame_index, dets)
+            self.current_frame_index += 1
+            if hasattr(cap, "frame_done"):
+                # 回放源按这一刻统计端到端延迟
+                cap.frame_done()
+                if self.current_frame_index % 100 == 0:
+                    self.stats_updated.emit(cap.stats_text())
+            if self.controller is not None:
+                stages = dict(self.stage_times, decode=start - read_start)
+                changed = self.controller.record(time.perf_counter() - read_start, stages)
+                if changed or self.frame_count % self.controller.window == 0:
+                    self.operating_point_updated.emit(self.controller.operating_point_text())
+
+            # 指数平滑一下 FPS，避免数字跳动太厉害
+            instant = 1.0 / max(time.perf_counter() - start, 1e-6)
+            fps = instant if fps == 0 else fps * 0.9 + instant * 0.1
+            self.fps_updated.emit(fps)
+            if total > 0:
+                self.progress_updated.emit(self.current_frame_index, total)
+
+            _, _, delay = self.get_params()
+            if delay > 0:
+                self.msleep(int(delay * 1000))
+
+        cap.release()
+        if self.video_index is not None:
+            self.video_index.save()
+        if hasattr(cap, "stats_text"):
+            self.stats_updated.emit(cap.stats_text())
@@ -0,0 +1,361 @@
+import time
+import queue
+import bisect
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+CHUNK_FRAMES = 64  # 多个解码进程读同一个文件时，每个进程一次最多负责的连续帧数
+SLOT_BYTES = 512 << 20  # 每个解码进程的共享内存槽预算
+MIN_SLOTS = 8
+
+
+def probe(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    info = {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 25.0,
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
+    cap.release()
+    return info
+
+
+class FrameRing:
+    """
+    一组共享内存帧缓冲：每个槽放一帧 (H, W, 3) uint8。
+    解码进程按自己分到的槽写入，队列里只传槽号，推理进程直接在共享内存上建 NumPy 视图。
+    """
+
+    def __init__(self, shape, slots, names=None):
+        self.shape = tuple(shape)
+        self.nbytes = int(np.prod(self.shape))
+        self.owner = names is None
+        if self.owner:
+            self.buffers = [shared_memory.SharedMemory(create=True, size=self.nbytes) for _ in range(slots)]
+        else:
+            # 解码进程由创建方 spawn 出来，和创建方共用 resource_tracker，挂载后只 close 不 unlink
+            self.buffers = [shared_memory.SharedMemory(name=name) for name in names]
+        self.views = [np.ndarray(self.shape, dtype=np.uint8, buffer=b.buf) for b in self.buffers]
+
+    @property
+    def names(self):
+        return [b.name for b in self.buffers]
+
+    def close(self):
+        self.views = []
+        for b in self.buffers:
+            b.close()
+            if self.owner:
+                b.unlink()
+        self.buffers = []
+
+
+def keyframes(path):
+    """
+    只解复用不解码，扫出关键帧的帧号；OpenCV 不支持读原始包时返回 None。
+    包是按解码顺序来的，闭合 GOP 下关键帧前面的包数就是它的帧号，开放 GOP 有偏差时由 seek_verified 纠正。
+    """
+    prop = getattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME", None)
+    if prop is None:
+        return None
+    cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    try:
+        if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            return None
+        frames = []
+        index = 0
+        while cap.grab():
+            if cap.get(prop):
+                frames.append(index)
+            index += 1
+        return frames or None
+    finally:
+        cap.release()
+
+
+def slots_for(shape, chunk_frames=CHUNK_FRAMES):
+    """
+    每个解码进程的槽数，也是一块的最大帧数：槽能放下一整块，后面几块的进程才能在读取方还没读到时
+    先把整块解码完，解码进程数加倍吞吐才跟着加倍；槽数少于块长时各进程只能轮流解码。
+    按每个进程 SLOT_BYTES（512MB）算，不超过 chunk_frames、不少于 MIN_SLOTS：
+    1080p（6.2MB/帧）取 64 个约 400MB；4K（24.9MB/帧）取 21 个约 520MB，4 个解码进程共约 2.1GB 共享内存。
+    """
+    frame_bytes = int(np.prod(shape))
+    return int(max(MIN_SLOTS, min(chunk_frames, SLOT_BYTES // frame_bytes)))
+
+
+def plan_chunks(start, end, keys=None, max_frames=CHUNK_FRAMES):
+    """
+    把 [start, end) 切成不超过 max_frames 帧的块：后半段里有关键帧时在最后一个关键帧处切，
+    seek 到关键帧不用从前一个关键帧解码过来；没有时（长 GOP 或没有关键帧信息）直接按 max_frames 切，
+    由 seek_verified 核对落点。
+    """
+    if end is None:
+        return [(start, None)]
+    keys = sorted(keys or [])
+    bounds = [start]
+    while bounds[-1] < end:
+        begin = bounds[-1]
+        limit = min(begin + max_frames, end)
+        i = bisect.bisect_right(keys, limit) - 1
+        if limit < end and i >= 0 and keys[i] > begin + max_frames // 2:
+            limit = keys[i]
+        bounds.append(limit)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def seek_verified(cap, index):
+    """
+    跳到 index 并用 CAP_PROP_POS_FRAMES 核对：落在目标之前就顺序 grab 过去，
+    落在之后就往前退一段再 grab。返回这次是否需要纠正。
+    """
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == index:
+        return False  # 上一块刚好读到这里，不用跳
+    target = index
+    back = CHUNK_FRAMES
+    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    missed = pos != index
+    while pos > index and target > 0:
+        target = max(0, index - back)
+        back *= 2
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    while pos < index and cap.grab():
+        pos += 1
+    return missed
+
+
+def decode_worker(path, names, shape, free_q, ready_q, decoder, chunks, stop, misses):
+    """
+    解码进程：按顺序解码分到的 (起始帧, 结束帧) 块，每块只 seek 一次且核对位置，
+    需要纠正的次数累加到共享计数 misses。
+    帧直接解码进共享内存槽（cap.read 传入目标数组时不再额外分配）。
+    """
+    ring = FrameRing(shape, 0, names)
+    cap = cv2.VideoCapture(path)
+    try:
+        for chunk_start, chunk_end in chunks:
+            if stop.is_set():
+                break
+            if seek_verified(cap, chunk_start):
+                with misses.get_lock():
+                    misses.value += 1
+            index = chunk_start
+            while (chunk_end is None or index < chunk_end) and not stop.is_set():
+                try:
+                    slot = free_q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                view = ring.views[slot]
+                ret, out = cap.read(view)
+                if not ret:
+                    free_q.put(slot)
+                    ready_q.put((None, index, decoder))
+                    return
+                if out.ctypes.data != view.ctypes.data:
+                    # OpenCV 没能直接写进槽里（例如分辨率和探测到的不一致），补一次复制
+                    view[:] = out if out.shape == view.shape else cv2.resize(out, (shape[1], shape[0]))
+                ready_q.put((slot, index, decoder))
+                index += 1
+        ready_q.put((None, None, decoder))
+    finally:
+        cap.release()
+        ring.close()
+
+
+class SharedMemoryCapture:
+    """
+    用多个解码进程读一个视频文件，接口和 cv2.VideoCapture 一样（isOpened/read/get/set/release），
+    DetectionWorker 可以直接替换。read 返回的帧是共享内存上的视图，下一次 read 时归还，
+    所以调用方如果要长期保存这一帧需要自己 copy。
+    """
+
+    def __init__(self, path, decoders=2, slots_per_decoder=None):
+        self.path = path
+        self.decoders = max(1, decoders)
+        self.slots_per_decoder = slots_per_decoder  # 不指定时按分辨率用 slots_for 算，块长不超过它
+        self.info = probe(path)
+        self.ring = None
+        self.procs = []
+        self.position = 0
+        self.pending = {}  # 帧号 -> (槽号, 解码进程)
+        self.finished = set()
+        self.current = None
+        self.keyframes = None
+        if self.info:
+            # 关键帧只扫一次，之后每次跳转都按它重新分块
+            self.keyframes = keyframes(path) if self.decoders > 1 and self.info["frames"] else None
+            shape = (self.info["height"], self.info["width"], 3)
+            self.slots_per_decoder = self.slots_per_decoder or slots_for(shape)
+            self.ring = FrameRing(shape, self.decoders * self.slots_per_decoder)
+            self.ctx = mp.get_context("spawn")
+            self.misses = self.ctx.Value("i", 0)  # 落点和目标帧不一致、需要纠正的 seek 次数
+            self._start(0)
+
+    def _start(self, position):
+        self.position = position
+        self.pending = {}
+        self.finished = set()
+        self.stop_event = self.ctx.Event()
+        self.ready_q = self.ctx.Queue()
+        self.free_qs = []
+        shape = self.ring.shape
+        chunks = plan_chunks(position, self.info["frames"] or None, self.keyframes, self.slots_per_decoder)
+        for d in range(self.decoders):
+            free_q = self.ctx.Queue()
+            # 每个解码进程只用自己的几个槽：等待中的下一帧所属进程总有空槽可写，不会互相卡死
+            for slot in range(d * self.slots_per_decoder, (d + 1) * self.slots_per_decoder):
+                free_q.put(slot)
+            self.free_qs.append(free_q)
+            proc = self.ctx.Process(target=decode_worker, daemon=True,
+                                    args=(self.path, self.ring.names, shape, free_q, self.ready_q,
+                                          d, chunks[d::self.decoders], self.stop_event, self.misses))
+            proc.start()
+            self.procs.append(proc)
+
+    def _stop(self):
+        if not self.procs:
+            return
+        self.stop_event.set()
+        for proc in self.procs:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        self.procs = []
+        self.current = None
+
+    def _release_current(self):
+        if self.current is not None:
+            slot, decoder = self.current
+            self.free_qs[decoder].put(slot)
+            self.current = None
+
+    @property
+    def seek_misses(self):
+        return self.misses.value if self.info else 0
+
+    def isOpened(self):
+        return self.info is not None
+
+    def read(self, image=None):
+        """按帧号顺序返回下一帧；多个解码进程的输出在这里重新排序"""
+        self._release_current()
+        while self.position not in self.pending:
+            if len(self.finished) == self.decoders:
+                return False, None
+            try:
+                slot, index, decoder = self.ready_q.get(timeout=5)
+            except queue.Empty:
+                return False, None
+            if slot is None:
+                self.finished.add(decoder)
+                continue
+            self.pending[index] = (slot, decoder)
+        slot, decoder = self.pending.pop(self.position)
+        self.position += 1
+        self.current = (slot, decoder)
+        view = self.ring.views[slot]
+        if image is not None:
+            image[:] = view
+            return True, image
+        return True, view
+
+    def get(self, prop):
+        if not self.info:
+            return 0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.info["frames"]
+        if prop == cv2.CAP_PROP_FPS:
+            return self.info["fps"]
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.info["width"]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.info["height"]
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self.info:
+            return False
+        # 跳转时重启解码进程，从新位置开始分块
+        self._stop()
+        self._start(int(value))
+        return True
+
+    def release(self):
+        self._stop()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def _thumb(frame):
+    # 比对准确性用的缩略采样，不做完整比较，免得拖慢计时
+    return frame[::16, ::16].copy()
+
+
+def benchmark(path, decoder_counts=(1, 2, 4), frames=300, work_size=640):
+    """
+    每种解码进程数读 frames 帧，推理端只做一次缩放到 work_size 模拟预处理。
+    准确性：每一帧和同进程顺序读到的同一帧比对（按 16 像素间隔采样），统计不一致的帧数，
+    以及 seek 落点和目标帧不一致、需要纠正的次数。
+    返回 {解码进程数: (帧/秒, 不一致帧数, 纠正次数)}；0 表示同进程 cv2 直接读作对照。
+    """
+    results = {}
+    reference = []
+    cap = cv2.VideoCapture(path)
+    start = time.perf_counter()
+    n = 0
+    while n < frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        cv2.resize(frame, (work_size, work_size))
+        reference.append(_thumb(frame))
+        n += 1
+    cap.release()
+    results[0] = (n / max(time.perf_counter() - start, 1e-6), 0, 0)
+
+    for count in decoder_counts:
+        cap = SharedMemoryCapture(path, decoders=count)
+        ret, frame = cap.read()  # 等子进程启动完再计时
+        start = time.perf_counter()
+        n = mismatched = 0
+        while ret and n < frames:
+            cv2.resize(frame, (work_size, work_size))
+            if n >= len(reference) or not np.array_equal(_thumb(frame), reference[n]):
+                mismatched += 1
+            n += 1
+            ret, frame = cap.read()
+        fps = n / max(time.perf_counter() - start, 1e-6)
+        mismatched += max(0, len(reference) - n)  # 提前读完也算不一致
+        cap.release()
+        results[count] = (fps, mismatched, cap.seek_misses)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="共享内存多进程解码吞吐测试")
+    parser.add_argument("videos", nargs="+", help="测试视频，例如 1080p 和 4K 各一个")
+    parser.add_argument("--decoders", default="1,2,4")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.decoders.split(",")]
+    for video in args.videos:
+        info = probe(video)
+        if info is None:
+            print(f"{video}: 无法打开")
+            continue
+        print(f"{video} ({info['width']}x{info['height']})")
+        for count, (fps, mismatched, misses) in benchmark(video, counts, args.frames).items():
+            label = "同进程 cv2" if count == 0 else f"{count} 个解码进程"
+            print(f"  {label:<12} {fps:8.1f} 帧/秒  与顺序读不一致 {mismatched} 帧  seek 纠正 {misses} 次")
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+MARKER = "[startup]"
+
+
+def parse_importtime(stderr_text):
+    """解析 -X importtime 的输出，返回 [(模块, 自身耗时us, 累计耗时us, 层级)]"""
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, raw_name = parts
+        level = (len(raw_name) - len(raw_name.lstrip(" ")) - 1) // 2
+        rows.append((raw_name.strip(), int(self_us), int(cumulative_us), level))
+    return rows
+
+
+def run_probe(script, python=sys.executable):
+    env = dict(os.environ, YOLO_STARTUP_PROBE="1")
+    start = time.perf_counter()
+    proc = subprocess.run([python, "-X", "importtime", script], env=env, capture_output=True,
+                          text=True, encoding="utf-8", errors="replace")
+    wall = time.perf_counter() - start
+    first_window = None
+    for line in proc.stdout.splitlines():
+        if line.startswith(MARKER):
+            first_window = float(line.split()[-1])
+    return wall, first_window, parse_importtime(proc.stderr), proc.returncode
+
+
+def format_report(script, wall, first_window, rows, top=20):
+    lines = [f"启动脚本: {script}", f"进程总耗时: {wall:.3f} s"]
+    if first_window is not None:
+        lines.append(f"首个窗口显示耗时（进程内计时）: {first_window:.3f} s")
+    total_us = sum(r[2] for r in rows if r[3] == 0)
+    lines.append(f"import 总耗时: {total_us / 1e6:.3f} s")
+    lines.append("")
+    lines.append(f"{'累计(ms)':>10} {'自身(ms)':>10}  顶层模块")
+    for name, self_us, cumulative_us, level in sorted((r for r in rows if r[3] == 0),
+                                                      key=lambda r: r[2], reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="统计 main.py 启动耗时和 import 开销")
+    parser.add_argument("script", nargs="?", default="main.py")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", default="startup_report.txt")
+    args = parser.parse_args()
+
+    wall, first_window, rows, code = run_probe(args.script)
+    report = format_report(args.script, wall, first_window, rows, args.top)
+    print(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    sys.exit(code)
@@ -0,0 +1,233 @@
+import numpy as np
+from Detections import empty_detections
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # 没装 scipy 时退化为贪心匹配
+    linear_sum_assignment = None
+
+
+def iou_matrix(a, b):
+    """a: (N,4) b: (M,4) xyxy，返回 (N,M) IoU"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def assign(cost, max_cost):
+    """最小代价匹配，返回 (匹配对, 未匹配行, 未匹配列)"""
+    rows, cols = cost.shape
+    if rows == 0 or cols == 0:
+        return [], list(range(rows)), list(range(cols))
+    if linear_sum_assignment is not None:
+        r, c = linear_sum_assignment(cost)
+        pairs = [(i, j) for i, j in zip(r, c) if cost[i, j] <= max_cost]
+    else:
+        pairs = []
+        used_r, used_c = set(), set()
+        for flat in np.argsort(cost, axis=None):
+            i, j = divmod(int(flat), cols)
+            if cost[i, j] > max_cost:
+                break
+            if i in used_r or j in used_c:
+                continue
+            pairs.append((i, j))
+            used_r.add(i)
+            used_c.add(j)
+    matched_r = {i for i, _ in pairs}
+    matched_c = {j for _, j in pairs}
+    return pairs, [i for i in range(rows) if i not in matched_r], [j for j in range(cols) if j not in matched_c]
+
+
+def xyxy_to_cxcywh(boxes):
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + wh / 2, wh], axis=1)
+
+
+def cxcywh_to_xyxy(boxes):
+    half = boxes[:, 2:] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+class KalmanBank:
+    """所有轨迹共用的匀速卡尔曼滤波，状态 [cx, cy, w, h, vx, vy, vw, vh] 按批量计算"""
+
+    std_position = 1.0 / 20
+    std_velocity = 1.0 / 160
+
+    def __init__(self):
+        self.F = np.eye(8, dtype=np.float32)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8, dtype=np.float32)
+        self.x = np.zeros((0, 8), dtype=np.float32)
+        self.P = np.zeros((0, 8, 8), dtype=np.float32)
+
+    def add(self, boxes):
+        z = xyxy_to_cxcywh(boxes)
+        x = np.concatenate([z, np.zeros_like(z)], axis=1)
+        size = np.repeat(z[:, 2:4].max(axis=1, keepdims=True), 4, axis=1)
+        std = np.concatenate([2 * self.std_position * size, 10 * self.std_velocity * size], axis=1)
+        P = np.zeros((len(z), 8, 8), dtype=np.float32)
+        P[:, np.arange(8), np.arange(8)] = std ** 2
+        self.x = np.concatenate([self.x, x.astype(np.float32)])
+        self.P = np.concatenate([self.P, P])
+
+    def remove(self, keep):
+        self.x = self.x[keep]
+        self.P = self.P[keep]
+
+    def predict(self):
+        if len(self.x) == 0:
+            return
+        size = np.repeat(self.x[:, 2:4].max(axis=1, keepdims=True), 4, axis=1)
+        q = np.concatenate([self.std_position * size, self.std_velocity * size], axis=1) ** 2
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T
+        self.P[:, np.arange(8), np.arange(8)] += q
+        self.x[:, 2:4] = np.maximum(self.x[:, 2:4], 1.0)
+
+    def update(self, idx, boxes):
+        if len(idx) == 0:
+            return
+        idx = np.asarray(idx)
+        z = xyxy_to_cxcywh(boxes)
+        x, P = self.x[idx], self.P[idx]
+        size = np.repeat(x[:, 2:4].max(axis=1, keepdims=True), 4, axis=1)
+        R = np.zeros((len(idx), 4, 4), dtype=np.float32)
+        R[:, np.arange(4), np.arange(4)] = (self.std_position * size) ** 2
+        PHt = P @ self.H.T
+        S = self.H @ PHt + R
+        K = PHt @ np.linalg.inv(S)
+        y = z - x @ self.H.T
+        self.x[idx] = x + np.einsum("nij,nj->ni", K, y)
+        self.P[idx] = (np.eye(8, dtype=np.float32) - K @ self.H) @ P
+
+    def boxes(self):
+        return cxcywh_to_xyxy(self.x[:, :4])
+
+
+class ByteTracker:
+    """
+    ByteTrack 风格的多目标跟踪：先用高分框匹配，再用低分框补匹配未命中的轨迹，
+    同一类别之间才允许匹配。支持“每 N 帧检测一次，中间只做卡尔曼预测”。
+    """
+
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, match_iou=0.3, max_age=30, min_hits=3):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.max_age = max_age  # 丢失多少帧后删除轨迹
+        self.min_hits = min_hits  # 命中多少次才算确认，避免误检计入总数
+        self.reset()
+
+    def reset(self):
+        self.kf = KalmanBank()
+        self.ids = np.zeros((0,), dtype=np.int64)
+        self.classes = np.zeros((0,), dtype=np.int32)
+        self.scores = np.zeros((0,), dtype=np.float32)
+        self.hits = np.zeros((0,), dtype=np.int32)
+        self.misses = np.zeros((0,), dtype=np.int32)
+        self.labels = []
+        self.sources = []
+        self.next_id = 1
+        self.seen = {}  # 显示名 -> 出现过的已确认轨迹 id 集合
+
+    def _match(self, track_idx, dets, det_idx):
+        if len(track_idx) == 0 or len(det_idx) == 0:
+            return [], list(track_idx), list(det_idx)
+        boxes = self.kf.boxes()[track_idx]
+        iou = iou_matrix(boxes, dets["boxes"][det_idx])
+        # 多模型时不同来源的类别编号会重复，用 来源+类别名 判断是否同类
+        track_keys = np.array([f"{self.sources[i]}:{self.labels[i]}" for i in track_idx], dtype=object)
+        det_keys = np.array([f"{dets['sources'][j]}:{dets['labels'][j]}" for j in det_idx], dtype=object)
+        same_class = track_keys[:, None] == det_keys[None, :]
+        cost = np.where(same_class, 1.0 - iou, 1.0)
+        pairs, um_t, um_d = assign(cost, 1.0 - self.match_iou)
+        return ([(track_idx[i], det_idx[j]) for i, j in pairs],
+                [track_idx[i] for i in um_t], [det_idx[j] for j in um_d])
+
+    def update(self, dets):
+        """用一帧检测结果更新轨迹，返回带 ids 的当前轨迹"""
+        self.kf.predict()
+        scores = dets["scores"]
+        high = np.where(scores >= self.high_thresh)[0]
+        low = np.where((scores >= self.low_thresh) & (scores < self.high_thresh))[0]
+        all_tracks = np.arange(len(self.ids))
+
+        pairs, unmatched_tracks, unmatched_high = self._match(all_tracks, dets, high)
+        pairs_low, unmatched_tracks, _ = self._match(np.array(unmatched_tracks, dtype=np.int64), dets, low)
+        pairs += pairs_low
+
+        if pairs:
+            t_idx = np.array([t for t, _ in pairs])
+            d_idx = np.array([d for _, d in pairs])
+            self.kf.update(t_idx, dets["boxes"][d_idx])
+            self.scores[t_idx] = scores[d_idx]
+            self.hits[t_idx] += 1
+            self.misses[t_idx] = 0
+        if unmatched_tracks:
+            self.misses[np.array(unmatched_tracks)] += 1
+
+        if unmatched_high:
+            new = np.array(unmatched_high)
+            self.kf.add(dets["boxes"][new])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.next_id += len(new)
+            self.classes = np.concatenate([self.classes, dets["classes"][new]])
+            self.scores = np.concatenate([self.scores, scores[new]])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=np.int32)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int32)])
+            self.labels += [dets["labels"][i] for i in new]
+            self.sources += [dets["sources"][i] for i in new]
+
+        self._drop_lost()
+        self._record_seen()
+        return self.current(max_misses=0)
+
+    def step(self, max_misses=None):
+        """没有检测结果的帧：只做预测，返回最近 max_misses 帧内被命中过的轨迹的外推位置"""
+        self.kf.predict()
+        self.misses += 1
+        self._drop_lost()
+        return self.current(max_misses=self.max_age if max_misses is None else max_misses)
+
+    def _drop_lost(self):
+        keep = self.misses <= self.max_age
+        if keep.all():
+            return
+        self.kf.remove(keep)
+        self.ids, self.classes = self.ids[keep], self.classes[keep]
+        self.scores, self.hits, self.misses = self.scores[keep], self.hits[keep], self.misses[keep]
+        self.labels = [l for l, k in zip(self.labels, keep) if k]
+        self.sources = [s for s, k in zip(self.sources, keep) if k]
+
+    def _record_seen(self):
+        for i in np.where(self.hits >= self.min_hits)[0]:
+            key = f"{self.sources[i]}:{self.labels[i]}" if self.sources[i] else self.labels[i]
+            self.seen.setdefault(key, set()).add(int(self.ids[i]))
+
+    def current(self, max_misses=0):
+        visible = (self.hits >= self.min_hits) & (self.misses <= max_misses)
+        idx = np.where(visible)[0]
+        if len(idx) == 0:
+            dets = empty_detections()
+            dets["ids"] = np.zeros((0,), dtype=np.int64)
+            return dets
+        return {
+            "boxes": self.kf.boxes()[idx].astype(np.float32),
+            "scores": self.scores[idx],
+            "classes": self.classes[idx],
+            "labels": [self.labels[i] for i in idx],
+            "sources": [self.sources[i] for i in idx],
+            "ids": self.ids[idx],
+        }
+
+    def unique_counts(self):
+        return {name: len(ids) for name, ids in self.seen.items()}
@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+import importlib.util
+
+CACHE_DIR_NAME = "__uicache__"
+CACHE_VERSION = "# uicache 2"  # 编译结果的格式变了就改这个标记，旧缓存会自动重新编译
+
+# pyuic 生成的 QPixmap("../Picture/x.png") 按当前目录解析，uic.loadUi 则按 .ui 所在目录解析
+_RESOURCE = re.compile(r'(QtGui\.(?:QPixmap|QIcon))\("([^"]+)"\)')
+_RESOLVER = f"""{CACHE_VERSION}
+import os as _os
+_UI_DIR = _os.path.dirname(_os.path.dirname(_os.path.abspath(__file__)))
+
+
+def _ui_path(path):
+    return path if _os.path.isabs(path) or path.startswith(":") else _os.path.join(_UI_DIR, path)
+"""
+
+
+def compiled_path(ui_path):
+    folder, name = os.path.split(os.path.abspath(ui_path))
+    module = os.path.splitext(name)[0].replace(" ", "_") + "_ui"
+    return os.path.join(folder, CACHE_DIR_NAME, module + ".py")
+
+
+def _is_current(py_path, ui_path):
+    if not os.path.exists(py_path) or os.path.getmtime(py_path) < os.path.getmtime(ui_path):
+        return False
+    with open(py_path, "r", encoding="utf-8") as f:
+        return CACHE_VERSION in f.read(4096)
+
+
+def resolve_resources(code):
+    """把生成代码里的相对图标路径改成按 .ui 所在目录解析，和 uic.loadUi 的行为一致"""
+    code = _RESOURCE.sub(lambda m: f'{m.group(1)}(_ui_path("{m.group(2)}"))', code)
+    head, sep, body = code.partition("\nfrom PyQt5 import")
+    return head + "\n" + _RESOLVER + sep + body if sep else _RESOLVER + code
+
+
+def compile_ui(ui_path, force=False):
+    """把 .ui 编译成 python 模块（和 GUI.py 一样由 pyuic 生成），已是最新则跳过"""
+    py_path = compiled_path(ui_path)
+    if not force and _is_current(py_path, ui_path):
+        return py_path
+    import io
+    from PyQt5 import uic  # 只有需要重新编译时才导入 uic
+    os.makedirs(os.path.dirname(py_path), exist_ok=True)
+    code = io.StringIO()
+    with open(ui_path, "r", encoding="utf-8") as src:
+        uic.compileUi(src, code)
+    tmp_path = py_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as dst:
+        dst.write(resolve_resources(code.getvalue()))
+    os.replace(tmp_path, py_path)
+    return py_path
+
+
+def load_ui(ui_path, widget):
+    """
+    代替 uic.loadUi(ui_path, widget)：使用缓存的编译结果，
+    界面控件同样作为属性挂到 widget 上。
+    """
+    py_path = compile_ui(ui_path)
+    module_name = "uicache_" + os.path.splitext(os.path.basename(py_path))[0]
+    module = sys.modules.get(module_name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(module_name, py_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[module_name] = module
+
+    ui_class = next(getattr(module, name) for name in dir(module) if name.startswith("Ui_"))
+    ui = ui_class()
+    ui.setupUi(widget)
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+    return widget
+
+
+if __name__ == "__main__":
+    # 预编译 Assets/UI 下所有界面文件
+    ui_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("Assets", "UI")
+    for file in sorted(os.listdir(ui_dir)):
+        if file.endswith(".ui"):
+            print("编译", file, "->", compile_ui(os.path.join(ui_dir, file), force=True))
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from Detections import count_by_label
+
+INDEX_DIR = "video_index"
+FORMAT_VERSION = 1
+
+
+def index_path(video, model_name, index_dir=INDEX_DIR):
+    """同一个视频、同一个模型一份索引：文件名是视频名加 (绝对路径, 模型名) 的摘要"""
+    key = f"{os.path.abspath(video)}|{model_name}".encode("utf-8")
+    stem = os.path.splitext(os.path.basename(video))[0]
+    return os.path.join(index_dir, f"{stem}_{hashlib.sha1(key).hexdigest()[:10]}.npz")
+
+
+def _video_stat(video):
+    st = os.stat(video)
+    return st.st_size, int(st.st_mtime)
+
+
+def _mark(runs, frame):
+    """runs 是 [[开始帧, 结束帧], ...]，顺序处理时只需要延长最后一段"""
+    if runs and runs[-1][0] <= frame <= runs[-1][1] + 1:
+        runs[-1][1] = max(runs[-1][1], frame)
+    else:
+        runs.append([frame, frame])
+
+
+def _covered(runs, frame):
+    return any(start <= frame <= end for start, end in runs)
+
+
+def _merge(runs):
+    """排序并合并重叠或相邻的区间，返回 (N, 2) int32，结束帧包含在内"""
+    if not runs:
+        return np.zeros((0, 2), dtype=np.int32)
+    runs = sorted(runs)
+    merged = [list(runs[0])]
+    for start, end in runs[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype=np.int32)
+
+
+class VideoIndex:
+    """
+    一个视频的检测索引：每个类别出现过的帧区间（排好序、合并过），以及每秒的计数汇总
+    （该秒处理过的帧数、各类别的计数之和与最大值）。检测时逐帧 add，结束时 save 成一个压缩 npz，
+    之后按类别跳转、找最密集的片段、画热度条都只查这份索引，不用再跑模型。
+    """
+
+    def __init__(self, video, model_name, fps=None, total_frames=0, path=None):
+        self.video = video
+        self.model_name = model_name
+        self.path = path or index_path(video, model_name)
+        self.stat = _video_stat(video) if os.path.exists(video) else (0, 0)
+        self.fps = fps or 25.0
+        self.total_frames = total_frames
+        self.labels = []
+        self.runs = {}  # 类别 -> 区间列表
+        self.processed = []  # 处理过的帧区间，区分"没检测到"和"还没处理"
+        self.seen = np.zeros(0, dtype=bool)  # 逐帧的处理标记，跳回已处理过的位置时按秒汇总不重复计数
+        self.sec_frames = np.zeros(0, dtype=np.uint16)
+        self.sec_sum = np.zeros((0, 0), dtype=np.uint32)
+        self.sec_max = np.zeros((0, 0), dtype=np.uint16)
+        self._cache = {}
+
+    # --- 构建 ---
+    def set_video(self, total_frames, fps):
+        """
+        run_stream 打开视频后告诉索引总帧数和帧率；帧率变了（不同的解码后端）时之前的按秒汇总作废，
+        逐帧的处理标记也一起清掉，之后处理到的帧按新的帧率重新汇总
+        """
+        if fps and abs(fps - self.fps) > 1e-3 and self.sec_frames.any():
+            self.sec_frames[:] = 0
+            self.sec_sum[:] = 0
+            self.sec_max[:] = 0
+            self.seen[:] = False
+        self.fps = fps or self.fps
+        self.total_frames = total_frames or self.total_frames
+        self._grow(self.second(max(self.total_frames - 1, 0)) + 1)
+
+    def second(self, frame):
+        return int(frame / self.fps)
+
+    def _grow(self, seconds, labels=None):
+        labels = len(self.labels) if labels is None else labels
+        s, l = self.sec_frames.shape[0], self.sec_sum.shape[0]
+        if seconds <= s and labels <= l:
+            return
+        seconds = max(seconds, s if seconds <= s else s * 2)
+        frames = np.zeros(seconds, dtype=np.uint16)
+        frames[:s] = self.sec_frames
+        total = np.zeros((max(labels, l), seconds), dtype=np.uint32)
+        total[:l, :s] = self.sec_sum
+        peak = np.zeros((max(labels, l), seconds), dtype=np.uint16)
+        peak[:l, :s] = self.sec_max
+        self.sec_frames, self.sec_sum, self.sec_max = frames, total, peak
+
+    def _label_id(self, label):
+        if label not in self.runs:
+            self.labels.append(label)
+            self.runs[label] = []
+            self._grow(self.sec_frames.shape[0], len(self.labels))
+        return self.labels.index(label)
+
+    def add(self, frame, dets):
+        """记录第 frame 帧的检测结果；跳转后帧号不连续也没关系，区间在查询和保存时合并"""
+        if frame >= len(self.seen):
+            grown = np.zeros(max(frame + 1, len(self.seen) * 2, self.total_frames), dtype=bool)
+            grown[:len(self.seen)] = self.seen
+            self.seen = grown
+        already = bool(self.seen[frame])
+        self.seen[frame] = True
+        _mark(self.processed, frame)
+        sec = self.second(frame)
+        self._grow(sec + 1)
+        if not already:
+            self.sec_frames[sec] = min(int(self.sec_frames[sec]) + 1, 65535)
+        for label, count in count_by_label(dets).items():
+            i = self._label_id(label)
+            # 已经处理过的帧只补上这一帧以前没记过的类别（例如换了置信度阈值后重新检测）
+            counted = already and _covered(self.runs[label], frame)
+            _mark(self.runs[label], frame)
+            if not counted:
+                self.sec_sum[i, sec] += count
+                self.sec_max[i, sec] = max(int(self.sec_max[i, sec]), count)
+        self._cache.clear()
+
+    # --- 查询 ---
+    def intervals(self, label):
+        if label not in self._cache:
+            self._cache[label] = _merge(self.runs.get(label, []))
+        return self._cache[label]
+
+    def coverage(self):
+        """处理过的帧占总帧数的比例"""
+        if not self.total_frames:
+            return 0.0
+        done = _merge(self.processed)
+        return float((done[:, 1] - done[:, 0] + 1).sum()) / self.total_frames
+
+    def frame_count(self, label):
+        iv = self.intervals(label)
+        return int((iv[:, 1] - iv[:, 0] + 1).sum())
+
+    def next_occurrence(self, label, frame):
+        """frame 之后该类别下一次出现的起始帧，没有时返回 None"""
+        iv = self.intervals(label)
+        i = int(np.searchsorted(iv[:, 0], frame, side="right"))
+        return int(iv[i, 0]) if i < len(iv) else None
+
+    def prev_occurrence(self, label, frame):
+        """frame 之前该类别上一次出现的起始帧（正处在某一段中间时先回到这一段的开头）"""
+        iv = self.intervals(label)
+        i = int(np.searchsorted(iv[:, 0], frame, side="left")) - 1
+        return int(iv[i, 0]) if i >= 0 else None
+
+    def nearest(self, label, frame):
+        """拖动进度条时对齐到最近的出现位置：在某一段里就不动，否则取前后更近的一端"""
+        iv = self.intervals(label)
+        if not len(iv):
+            return None
+        i = int(np.searchsorted(iv[:, 0], frame, side="right")) - 1
+        if i >= 0 and frame <= iv[i, 1]:
+            return frame
+        candidates = []
+        if i >= 0:
+            candidates.append(int(iv[i, 1]))
+        if i + 1 < len(iv):
+            candidates.append(int(iv[i + 1, 0]))
+        return min(candidates, key=lambda f: abs(f - frame))
+
+    def density(self, label=None):
+        """每秒平均每帧的目标数，label 为空时是所有类别之和；没处理过的秒是 nan"""
+        if label is None:
+            total = self.sec_sum.sum(axis=0) if len(self.labels) else np.zeros_like(self.sec_frames, np.uint32)
+        elif label in self.runs and self.labels.index(label) < len(self.sec_sum):
+            total = self.sec_sum[self.labels.index(label)]
+        else:
+            total = np.zeros_like(self.sec_frames, dtype=np.uint32)
+        frames = self.sec_frames.astype(np.float32)
+        n = min(len(total), len(frames))  # 检测线程可能刚好在扩容
+        total, frames = total[:n], frames[:n]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(frames > 0, total / frames, np.nan)
+
+    def densest(self, label=None, window=5.0):
+        """平均目标数最多的连续 window 秒，返回它的起始帧"""
+        values = np.nan_to_num(self.density(label))
+        if not values.any():
+            return None
+        width = max(1, int(round(window)))
+        sums = np.convolve(values, np.ones(width), mode="valid") if len(values) >= width else values
+        return int(int(np.argmax(sums)) * self.fps)
+
+    def heatmap(self, label=None, width=400, height=8):
+        """画进度条下面的热度条（BGR）：越密越红，没处理过的部分是灰色"""
+        import cv2
+        values = self.density(label)
+        seconds = len(values)
+        strip = np.full((height, max(width, 1), 3), 60, dtype=np.uint8)
+        if not seconds:
+            return strip
+        edges = np.linspace(0, seconds, width + 1).astype(int)
+        edges = np.minimum(edges, seconds - 1)
+        done = ~np.isnan(values)
+        filled = np.nan_to_num(values)
+        # 每个像素取它覆盖的几秒里的最大值，保证短暂出现的目标也能看到
+        peak = np.maximum.reduceat(filled, edges[:-1])
+        seen = np.maximum.reduceat(done.astype(np.uint8), edges[:-1]) > 0
+        top = peak.max()
+        level = (peak / top * 255).astype(np.uint8) if top > 0 else np.zeros(width, dtype=np.uint8)
+        colors = cv2.applyColorMap(level.reshape(1, -1), cv2.COLORMAP_JET)[0]
+        strip[:, seen] = colors[seen]
+        return strip
+
+    def summary(self):
+        lines = [f"{os.path.basename(self.video)}（{self.model_name}），已处理 {self.coverage():.0%}"]
+        for label in sorted(self.labels, key=self.frame_count, reverse=True):
+            iv = self.intervals(label)
+            lines.append(f"{label}: {len(iv)} 段，{self.frame_count(label) / self.fps:.1f} 秒")
+        return "\n".join(lines)
+
+    # --- 读写 ---
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        merged = [self.intervals(label) for label in self.labels]
+        offsets = np.cumsum([0] + [len(iv) for iv in merged]).astype(np.int64)
+        meta = {"video": os.path.abspath(self.video), "model": self.model_name, "fps": self.fps,
+                "total_frames": self.total_frames, "size": self.stat[0], "mtime": self.stat[1],
+                "labels": self.labels, "version": FORMAT_VERSION}
+        tmp = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp, meta=json.dumps(meta, ensure_ascii=False),
+            intervals=np.concatenate(merged) if merged else np.zeros((0, 2), dtype=np.int32),
+            offsets=offsets, processed=_merge(self.processed),
+            sec_frames=self.sec_frames, sec_sum=self.sec_sum[:len(self.labels)],
+            sec_max=self.sec_max[:len(self.labels)])
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["video"], meta["model"], meta["fps"], meta["total_frames"], path=path)
+            index.stat = (meta["size"], meta["mtime"])
+            index.labels = list(meta["labels"])
+            intervals, offsets = data["intervals"], data["offsets"]
+            for i, label in enumerate(index.labels):
+                index.runs[label] = intervals[offsets[i]:offsets[i + 1]].tolist()
+            index.processed = data["processed"].tolist()
+            index.seen = np.zeros(max(index.total_frames, int(data["processed"].max(initial=-1)) + 1), dtype=bool)
+            for start, end in index.processed:
+                index.seen[start:end + 1] = True
+            index.sec_frames = data["sec_frames"]
+            index.sec_sum = data["sec_sum"]
+            index.sec_max = data["sec_max"]
+        return index
+
+    @classmethod
+    def open(cls, video, model_name, index_dir=INDEX_DIR):
+        """有同一视频、同一模型的索引且视频文件没变时接着用，否则新建一份空的"""
+        path = index_path(video, model_name, index_dir)
+        if os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.stat == _video_stat(video):
+                    return index
+            except (OSError, ValueError, KeyError):
+                pass
+        return cls(video, model_name, path=path)
+
+    @classmethod
+    def find(cls, video, model_name, index_dir=INDEX_DIR):
+        """只读取已有的索引，没有或视频已经改过时返回 None"""
+        path = index_path(video, model_name, index_dir)
+        if not os.path.exists(path):
+            return None
+        index = cls.open(video, model_name, index_dir)
+        return index if index.processed else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查询视频检测索引：某个类别出现在哪些片段、最密集的片段在哪里")
+    parser.add_argument("video")
+    parser.add_argument("--model", required=True, help="检测时使用的模型名")
+    parser.add_argument("--label", help="只看这个类别（多模型检测时写成 模型名:类别）")
+    parser.add_argument("--window", type=float, default=5.0, help="最密集片段的长度（秒）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = VideoIndex.find(args.video, args.model)
+    if index is None:
+        print("没有这个视频的索引，先在检测界面里用该模型检测一遍")
+        sys.exit(1)
+    loaded = time.perf_counter()
+    print(index.summary())
+    if args.label:
+        iv = index.intervals(args.label)
+        for s, e in iv[:20]:
+            print(f"  {s / index.fps:8.1f}s - {(e + 1) / index.fps:8.1f}s  （第 {s} - {e} 帧）")
+        if len(iv) > 20:
+            print(f"  ... 共 {len(iv)} 段")
+    densest = index.densest(args.label, args.window)
+    if densest is not None:
+        print(f"最密集的 {args.window:g} 秒从 {densest / index.fps:.1f}s 开始（第 {densest} 帧）")
+    print(f"读取索引 {(loaded - start) * 1000:.1f}ms，查询 {(time.perf_counter() - loaded) * 1000:.1f}ms")
+    sys.exit(0)
@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from Renderer import default_renderer
+from Detections import count_by_label, format_counts, detections_to_json
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # 没有 watchdog 时只靠定时扫描
+    Observer = None
+    FileSystemEventHandler = object
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+OUTPUT_DIR_NAME = "_detections"
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    sha256 TEXT,
+    model_version TEXT,
+    processed_at REAL,
+    count INTEGER,
+    detections TEXT,
+    error TEXT,
+    PRIMARY KEY (sha256, model_version)
+);
+"""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_version(weights, name=None):
+    """模型名 + 权重内容哈希前 12 位；同名模型换了权重就是新版本"""
+    name = name or os.path.splitext(os.path.basename(weights))[0]
+    return f"{name}@{file_sha256(weights)[:12]}"
+
+
+def read_image(path):
+    import cv2
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class Manifest:
+    """
+    已处理文件清单（SQLite，放在输出目录里）：files 表按路径记大小/修改时间/内容哈希，
+    大小和修改时间都没变就不重新算哈希；results 表按 (内容哈希, 模型版本) 记检测结果，
+    同样内容的文件换了名字也不会重复检测，换了模型版本才会重新检测。
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def file_hash(self, rel, size, mtime, full_path):
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime, sha256 FROM files WHERE path = ?", (rel,)).fetchone()
+        if row and row[0] == size and row[1] == mtime:
+            return row[2]
+        sha = file_sha256(full_path)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                              (rel, size, mtime, sha))
+        return sha
+
+    def prune(self, paths):
+        """删掉这次扫描没见到的路径（文件被删除或改名），已算好的检测结果按内容哈希保留"""
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM seen")
+            self.conn.executemany("INSERT OR IGNORE INTO seen (path) VALUES (?)", [(p,) for p in paths])
+            self.conn.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM seen)")
+            self.conn.execute("DELETE FROM seen")
+
+    def done(self, sha, version):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM results WHERE sha256 = ? AND model_version = ?",
+                                     (sha, version)).fetchone() is not None
+
+    def record(self, rows):
+        """rows: [(sha256, 模型版本, 目标数, 检测结果 json, 错误信息)]，一批一个事务"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results (sha256, model_version, processed_at, count, detections, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)", [(sha, version, now, count, dets, error)
+                                              for sha, version, count, dets, error in rows])
+
+    def summary(self, version):
+        with self._lock:
+            files = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            done, objects = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(count), 0) FROM files JOIN results USING (sha256) "
+                "WHERE model_version = ?", (version,)).fetchone()
+        return {"files": files, "done": done, "objects": objects}
+
+    def export(self, version):
+        """当前模型版本下每个文件的结果：[(相对路径, 检测结果列表)]"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, detections FROM files JOIN results USING (sha256) WHERE model_version = ? "
+                "ORDER BY path", (version,)).fetchall()
+        return [(path, json.loads(dets) if dets else []) for path, dets in rows]
+
+
+class _Wakeup(FileSystemEventHandler):
+    def __init__(self, event):
+        self.event = event
+
+    def on_any_event(self, event):
+        if not event.is_directory and OUTPUT_DIR_NAME not in event.src_path:
+            self.event.set()
+
+
+class WatchFolder:
+    """
+    监视文件夹：定时（有 watchdog 时文件一变化就提前）扫描目录，挑出当前模型版本还没处理过的图片，
+    按 batch 张一批推理，每批处理完立即写入清单，中途退出重启后从下一批继续。
+    修改时间在 settle 秒以内的文件认为还在上传，下一轮再处理。
+    """
+
+    def __init__(self, folder, model, version, out_dir=None, batch=8, settle=2.0, interval=5.0,
+                 save_images=True):
+        self.folder = os.path.abspath(folder)
+        self.model = model
+        self.version = version
+        self.out_dir = out_dir or os.path.join(self.folder, OUTPUT_DIR_NAME)
+        self.batch = batch
+        self.settle = settle
+        self.interval = interval
+        self.save_images = save_images
+        self.manifest = Manifest(os.path.join(self.out_dir, "manifest.sqlite"))
+        self.wakeup = threading.Event()
+        self.observer = None
+        self.last_scan = {"seen": 0, "pending": 0, "settling": 0, "seconds": 0.0}
+
+    def start_watching(self):
+        if Observer is None or self.observer is not None:
+            return False
+        self.observer = Observer()
+        self.observer.schedule(_Wakeup(self.wakeup), self.folder, recursive=True)
+        self.observer.start()
+        return True
+
+    def close(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=2)
+            self.observer = None
+        self.manifest.close()
+
+    def scan(self):
+        """返回 [(相对路径, 完整路径, 内容哈希)]：当前模型版本还没处理过、并且已经上传完的图片"""
+        start = time.perf_counter()
+        now = time.time()
+        pending, seen, settling = [], 0, 0
+        present, complete = set(), True
+        stack = [self.folder]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                complete = False  # 有目录没读到，这轮不清理清单，免得把里面的文件当成删掉了
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) != os.path.abspath(self.out_dir):
+                        stack.append(entry.path)
+                    continue
+                if not entry.name.lower().endswith(IMAGE_EXTS):
+                    continue
+                seen += 1
+                rel = os.path.relpath(entry.path, self.folder).replace(os.sep, "/")
+                present.add(rel)
+                st = entry.stat()
+                if now - st.st_mtime < self.settle:
+                    settling += 1
+                    continue
+                try:
+                    sha = self.manifest.file_hash(rel, st.st_size, st.st_mtime, entry.path)
+                except OSError:
+                    continue  # 扫描和读取之间被删掉或移走
+                if not self.manifest.done(sha, self.version):
+                    pending.append((rel, entry.path, sha))
+        if complete:
+            self.manifest.prune(present)
+        pending.sort()
+        # 同样内容的文件只检测一次
+        unique, hashes = [], set()
+        for item in pending:
+            if item[2] not in hashes:
+                hashes.add(item[2])
+                unique.append(item)
+        self.last_scan = {"seen": seen, "pending": len(unique), "settling": settling,
+                          "seconds": time.perf_counter() - start}
+        return unique
+
+    def process_batch(self, items, conf=0.25, iou=0.7, imgsz=640):
+        """检测一批图片并写入清单，返回 [(相对路径, 图片, 检测结果)]，读不出的图片记为错误不再重试"""
+        from MultiStream import infer_batch
+        frames, loaded, rows = [], [], []
+        for rel, path, sha in items:
+            frame = read_image(path)
+            if frame is None:
+                rows.append((sha, self.version, 0, None, "无法读取图片"))
+                continue
+            frames.append(frame)
+            loaded.append((rel, sha))
+        results = []
+        if frames:
+            for (rel, sha), frame, dets in zip(loaded, frames, infer_batch(self.model, frames, conf, iou, imgsz)):
+                rows.append((sha, self.version, len(dets["labels"]),
+                             json.dumps(detections_to_json(dets), ensure_ascii=False), None))
+                results.append((rel, frame, dets))
+                if self.save_images:
+                    self._save_annotated(rel, frame, dets)
+        self.manifest.record(rows)
+        return results
+
+    def _save_annotated(self, rel, frame, dets):
+        import cv2
+        target = os.path.join(self.out_dir, self.version.replace("@", "_"), rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        ok, data = cv2.imencode(os.path.splitext(target)[1] or ".jpg", default_renderer().render(frame, dets))
+        if ok:
+            data.tofile(target)  # 兼容中文路径
+
+    def run(self, should_stop, conf=0.25, iou=0.7, once=False, on_batch=None, get_params=None):
+        """
+        主循环：扫描 -> 分批处理 -> 等下一次扫描。should_stop() 返回 True 时在批与批之间退出；
+        once=True 时处理完当前积压就返回。on_batch(结果列表, 剩余数) 每批处理完调用一次。
+        给了 get_params 时每批前调用一次取 (conf, iou)，运行中改了阈值下一批就生效。
+        """
+        while not should_stop():
+            items = self.scan()
+            for start in range(0, len(items), self.batch):
+                if should_stop():
+                    return
+                if get_params is not None:
+                    conf, iou = get_params()
+                results = self.process_batch(items[start:start + self.batch], conf, iou)
+                if on_batch is not None:
+                    on_batch(results, len(items) - start - self.batch)
+            if once:
+                return
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.observer is not None:
+                time.sleep(self.settle)  # 刚收到的文件可能还没写完，等一下再扫
+
+
+class WatchFolderWorker(QThread):
+    """检测界面里的监视文件夹模式：后台处理，界面显示最近一张的检测结果和累计进度"""
+
+    frame_processed = pyqtSignal(np.ndarray)
+    result_updated = pyqtSignal(str)
+    fps_updated = pyqtSignal(float)
+    stats_updated = pyqtSignal(str)
+    progress_updated = pyqtSignal(int, int)
+    operating_point_updated = pyqtSignal(str)
+
+    def __init__(self, model, get_params, folder, version, batch=8):
+        super().__init__()
+        self.get_params = get_params
+        self.watch = None
+        self.args = (folder, model, version)
+        self.batch = batch
+        self.renderer = default_renderer()
+        self.display_size = None
+        self.running = True
+        self.paused = False
+        # 和 DetectionWorker 保持同样的属性，主界面的按钮逻辑不用区分
+        self.source_size = None
+        self.motion_gate = None
+        self.tracker = None
+        self.current_frame_index = 0
+        self.target_frame_index = None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.running = False
+        self.paused = False
+        if self.watch is not None:
+            self.watch.wakeup.set()
+
+    def should_stop(self):
+        while self.paused and self.running:
+            self.msleep(100)
+        return not self.running
+
+    def on_batch(self, results, remaining):
+        now = time.perf_counter()
+        self.processed += len(results)
+        self.fps_updated.emit(self.processed / max(now - self.start_time, 1e-6))
+        summary = self.watch.manifest.summary(self.watch.version)
+        self.progress_updated.emit(summary["done"], summary["done"] + max(remaining, 0))
+        if results:
+            rel, frame, dets = results[-1]
+            self.source_size = (frame.shape[1], frame.shape[0])
+            self.frame_processed.emit(self.renderer.render(frame, dets, self.display_size))
+            self.result_updated.emit(f"{rel}\n{format_counts(count_by_label(dets))}\n\n"
+                                     f"已处理 {summary['done']} 张，共 {summary['objects']} 个目标，"
+                                     f"待处理 {max(remaining, 0)} 张")
+        scan = self.watch.last_scan
+        self.stats_updated.emit(f"{self.watch.version} | 目录内 {scan['seen']} 张，"
+                                f"上传中 {scan['settling']} 张，扫描 {scan['seconds'] * 1000:.0f}ms")
+
+    def run(self):
+        self.watch = WatchFolder(*self.args, batch=self.batch)
+        self.watch.start_watching()
+        self.processed = 0
+        self.start_time = time.perf_counter()
+        try:
+            self.on_batch([], 0)
+            self.watch.run(self.should_stop, on_batch=self.on_batch,
+                           get_params=lambda: self.get_params()[:2])
+        finally:
+            self.watch.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="监视文件夹，增量检测新上传的图片")
+    parser.add_argument("folder")
+    parser.add_argument("--model", required=True, help="Assets/Model 下的模型名，例如 \"plant detector\"")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=5.0, help="没有 watchdog 时的扫描间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="处理完当前积压就退出")
+    parser.add_argument("--no-images", action="store_true", help="只记录结果，不保存画框后的图片")
+    parser.add_argument("--export", help="把当前模型版本的全部结果导出为 json")
+    args = parser.parse_args()
+
+    from ModelRegistry import default_registry
+    registry = default_registry()
+    version = model_version(registry.path(args.model), args.model)
+    watch = WatchFolder(args.folder, registry.get(args.model), version, batch=args.batch,
+                        interval=args.interval, save_images=not args.no_images)
+    if not args.once and watch.start_watching():
+        print("使用 watchdog 监听文件变化")
+
+    def report(results, remaining):
+        for rel, _, dets in results:
+            print(f"{rel}: {len(dets['labels'])} 个目标")
+        if results:
+            print(f"-- 待处理 {max(remaining, 0)} 张")
+
+    try:
+        watch.run(lambda: False, args.conf, args.iou, once=args.once, on_batch=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        summary = watch.manifest.summary(version)
+        print(f"{version}: 已处理 {summary['done']} / {summary['files']} 个文件，共 {summary['objects']} 个目标")
+        if args.export:
+            with open(args.export, "w", encoding="utf-8") as f:
+                json.dump(dict(watch.manifest.export(version)), f, ensure_ascii=False, indent=2)
+        watch.close()
+    sys.exit(0)
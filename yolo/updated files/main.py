@@ -1,15 +1,18 @@
+import os
 import sys
-from PyQt5 import QtWidgets, uic
+import time
+START_TIME = time.perf_counter()
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow
+from UiCache import load_ui
 
-# 假设你的训练模块和检测模块是两个QWidget类
-from TrainMainWindow import YoloTrainerApp
-from MainLogic import LogicMixin
+# 训练模块（matplotlib）和检测模块（cv2/torch/ultralytics）都很重，
+# 等用户点了对应按钮再导入，主窗口可以秒开
 
 class MainController(QMainWindow):
     def __init__(self):
         super().__init__()
-        uic.loadUi("Assets/UI/MainGUI.ui", self)
+        load_ui("Assets/UI/MainGUI.ui", self)
 
         self.trainButton.clicked.connect(self.open_train)
         self.detectButton.clicked.connect(self.open_detect)
@@ -19,16 +22,25 @@ class MainController(QMainWindow):
 
     def open_train(self):
         if self.train_window is None:
+            from TrainMainWindow import YoloTrainerApp
             self.train_window = YoloTrainerApp()
         self.train_window.show()
 
     def open_detect(self):
         if self.detect_window is None:
+            from MainLogic import LogicMixin
             self.detect_window = LogicMixin()
         self.detect_window.show()
 
+def report_first_window(app):
+    # 由 StartupReport.py 设置，窗口显示出来后打印耗时并退出
+    print(f"[startup] first window shown {time.perf_counter() - START_TIME:.3f}", flush=True)
+    app.quit()
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainController()
     window.show()
+    if os.environ.get("YOLO_STARTUP_PROBE"):
+        QTimer.singleShot(0, lambda: report_first_window(app))
     sys.exit(app.exec_())